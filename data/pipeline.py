@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+# Runs the data pipeline -- as_received -> raw -> processed -> db -> exported -- doing the same as the Makefiles in each
+# directory (and the psql steps in db/), but keyed on content rather than on modification times.
+# Each stage is identified by a hash of its commands (which include its parameters) and of the contents of its input files,
+# scripts included. Its outputs are stored in a local cache under that hash, and a stage whose hash hasn't changed isn't
+# run again: touching a script, or re-downloading an identical extract, reruns nothing. And if a stage's outputs come out
+# the same as before, the stages after it aren't rerun either.
+# Stages that don't depend on each other (e.g. the REPD, FiT, MV and OSM preprocessing) run at the same time, and the
+# time taken by each stage is reported at the end.
+#
+# Usage (from this directory):
+#    python3 pipeline.py                        # everything up to the exported data
+#    python3 pipeline.py processed-fit db       # just these stages (and any they need)
+#    python3 pipeline.py --force db             # rerun a stage even if its hash hasn't changed (e.g. after dropping the database)
+#    python3 pipeline.py --jobs 1               # one stage at a time
+#    python3 pipeline.py --list                 # the stages, and which are up to date
+# Stage output (including errors) goes to a log file per stage, in the cache directory.
+#
+# Manual edits to the files in raw/ (see doc/preprocessing.md) are respected: if a stage's output already exists but differs
+# from what the stage made, and from anything it has made before, it is left as it is (with a warning), and the stages that
+# use it see the edited version. (An output the stage made in another run, e.g. before an input was changed and changed
+# back, is replaced by the cached one.)
+
+import os, sys, glob, fnmatch, hashlib, json, shutil, subprocess, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+############################################
+# User configuration:
+
+datadir = os.path.dirname(os.path.abspath(__file__))
+rootdir = os.path.dirname(datadir)
+cachedir = os.path.join(datadir, ".pipeline-cache")   # the cached outputs, stage records and logs (delete it to start afresh)
+numjobs = os.cpu_count() or 1   # at most this many stages run at once
+bulk_load = True   # load the database tables with db/bulk-load.py (binary COPY from the Parquet files) rather than with psql from the csv files
+
+# Parameters, substituted into the commands below (so a change to one of them changes the hash of the stages that use it)
+params = {
+	'python': sys.executable,
+	'osm_extract': "../as_received/great-britain-latest.osm.pbf",
+	'repd_download': "../as_received/renewable-energy-planning-database-march-2020.csv",
+	'fit_workbooks': "../as_received/installation_report_*_part_*.xlsx",
+	'database': "hut23-425",
+}
+
+############################################
+# The stages:
+
+class Stage:
+	"""A step of the pipeline: shell commands run in workdir (relative to the repository root), which read the inputs and write the outputs.
+	Inputs and outputs are relative to workdir; inputs can be glob patterns. The commands and paths can use {param} from params."""
+	def __init__(self, name, workdir, commands, inputs, outputs, default=True):
+		self.name = name
+		self.workdir = os.path.join(rootdir, workdir)
+		self.commands = [command.format(**params) for command in commands]
+		self.inputs = [self.path(fpath.format(**params)) for fpath in inputs]
+		self.outputs = [self.path(fpath.format(**params)) for fpath in outputs]
+		self.default = default   # whether it's run when no stages are named
+		self.depends = []
+
+	def path(self, fpath):
+		"A path relative to the repository root"
+		return os.path.relpath(os.path.normpath(os.path.join(self.workdir, fpath)), rootdir)
+
+	def input_files(self):
+		"The input files as they are now, in a fixed order. Raises an error for one that's missing."
+		fpaths = []
+		for pattern in self.inputs:
+			if glob.has_magic(pattern):
+				matches = sorted(os.path.relpath(fpath, rootdir) for fpath in glob.glob(os.path.join(rootdir, pattern)))
+				if not matches:
+					raise FileNotFoundError("no input files match %s" % pattern)
+				fpaths.extend(matches)
+			else:
+				if not os.path.isfile(os.path.join(rootdir, pattern)):
+					raise FileNotFoundError("input %s does not exist" % pattern)
+				fpaths.append(pattern)
+		return fpaths
+
+osmscripts = ["compile_osm_solar.py", "osm_pbf.py", "osm_tags.py", "osm_output.py", "osm_store.py", "osm_containment.py", "osm_stats.py"]
+dbscripts = ["*.sql", "*.py", "neighbour-finding/*.sql"]
+processed_tables = ["repd", "fit", "osm", "machine_vision"]
+
+stages = [
+	# raw
+	Stage("raw-osm-filter", "data/raw",
+		["osmium tags-filter {osm_extract} generator:method=photovoltaic plant:method=photovoltaic plant:source=solar --overwrite -o osm-gb-solaronly.osm.pbf"],
+		["{osm_extract}"], ["osm-gb-solaronly.osm.pbf"]),
+	Stage("raw-osm-geojson", "data/raw",
+		["rm -f osm-gb-solaronly.geojson"] +
+		["ogr2ogr -f GeoJSON %s -addfields osm-gb-solaronly.geojson osm-gb-solaronly.osm.pbf %s -nln merged" % ("-overwrite" if layer == "points" else "-update -append", layer)
+			for layer in ["points", "lines", "multilinestrings", "multipolygons", "other_relations"]],
+		["osm-gb-solaronly.osm.pbf"], ["osm-gb-solaronly.geojson"]),
+	Stage("raw-osm", "data/raw",
+		["{python} compile_osm_solar.py"],
+		["osm-gb-solaronly.osm.pbf"] + osmscripts, ["osm.csv", "osm.parquet", "osm-solar-state.pickle", "osm-stats.json"]),
+	Stage("raw-repd", "data/raw",
+		["sed -e 's|00/01/1900||g' < {repd_download} > repd.csv"],
+		["{repd_download}"], ["repd.csv"]),
+	# processed
+	Stage("processed-repd", "data/processed",
+		["{python} pre-process-repd.py --parquet repd.parquet < ../raw/repd.csv > repd.csv"],
+		["../raw/repd.csv", "pre-process-repd.py", "osgb.py", "schema.py"], ["repd.csv", "repd.parquet"]),
+	Stage("processed-fit", "data/processed",
+		["{python} pre-process-fit.py --parquet fit.parquet {fit_workbooks} > fit.csv"],
+		["{fit_workbooks}", "pre-process-fit.py", "schema.py", "../raw/convert_fit_excel_to_csv.py", "../raw/xlsx_reader.py"], ["fit.csv", "fit.parquet"]),
+	Stage("processed-osm", "data/processed",
+		["{python} pre-process-osm.py --parquet osm.parquet ../raw/osm.parquet > osm.csv"],
+		["../raw/osm.parquet", "pre-process-osm.py", "start_dates.py", "schema.py"], ["osm.csv", "osm.parquet"]),
+	Stage("processed-mv", "data/processed",
+		["{python} pre-process-mv.py --parquet machine_vision.parquet ../raw/machine_vision.geojson > machine_vision.csv"],
+		["../raw/machine_vision.geojson", "pre-process-mv.py", "schema.py"], ["machine_vision.csv", "machine_vision.parquet"]),
+	# db: build the database, then export from it
+	Stage("db", "db",
+		["{python} bulk-load.py {database}", "PYTHON={python} psql -v bulk_loaded=1 -f make-database.sql {database}", "psql -f export.sql {database}"] if bulk_load else
+		["PYTHON={python} psql -f make-database.sql {database}", "psql -f export.sql {database}"],
+		(["../data/processed/%s.parquet" % table for table in processed_tables] + ["../data/processed/schema.py"] if bulk_load else
+		 ["../data/processed/%s.csv" % table for table in processed_tables]) + dbscripts,
+		["../data/exported/ukpvgeo_points.csv", "../data/exported/osm_repd_proposed_matches.csv"]),
+	# exported
+	Stage("exported-geometries", "data/exported",
+		["{python} export_geometries.py"],
+		["ukpvgeo_points.csv", "../raw/osm-gb-solaronly.geojson", "export_geometries.py"], ["ukpvgeo_geometries.geojson"]),
+	# (needs the local files in data/other, so only run when asked for, as with "make all" in data/exported)
+	Stage("exported-analysis", "data/exported",
+		["{python} analyse_exported.py"],
+		["ukpvgeo_points.csv", "analyse_exported.py"], ["plot_analyse_exported.pdf"], default=False),
+]
+
+# A stage depends on the stages that write its inputs
+for stage in stages:
+	for other in stages:
+		if other is not stage and any(fnmatch.fnmatchcase(output, pattern) for pattern in stage.inputs for output in other.outputs):
+			stage.depends.append(other.name)
+
+############################################
+# Content hashes and the cache:
+
+hashesfpath = os.path.join(cachedir, "hashes.json")   # remembers each file's hash, with its size and mtime, so unchanged files aren't re-read
+_hashes = None
+_hashlock = threading.Lock()
+
+def file_hash(fpath):
+	"SHA-256 of a file's contents (fpath relative to the repository root)"
+	global _hashes
+	fullpath = os.path.join(rootdir, fpath)
+	stat = os.stat(fullpath)
+	with _hashlock:
+		if _hashes is None:
+			_hashes = {}
+			if os.path.exists(hashesfpath):
+				with open(hashesfpath, 'rt') as infp:
+					_hashes = json.load(infp)
+		known = _hashes.get(fpath)
+		if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+			return known[2]
+	digest = hashlib.sha256()
+	with open(fullpath, 'rb') as infp:
+		for block in iter(lambda: infp.read(1 << 20), b''):
+			digest.update(block)
+	with _hashlock:
+		_hashes[fpath] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+	return digest.hexdigest()
+
+def save_hashes():
+	if _hashes is not None:
+		os.makedirs(cachedir, exist_ok=True)
+		with _hashlock:
+			with open(hashesfpath + ".tmp", 'wt') as outfp:
+				json.dump(_hashes, outfp)
+			os.replace(hashesfpath + ".tmp", hashesfpath)
+
+def stage_key(stage):
+	"The hash identifying a stage's work: its commands, its output paths, and the paths and contents of its inputs"
+	digest = hashlib.sha256()
+	digest.update(json.dumps([stage.name, stage.commands, stage.outputs]).encode('utf-8'))
+	for fpath in stage.input_files():
+		digest.update(json.dumps([fpath, file_hash(fpath)]).encode('utf-8'))
+	return digest.hexdigest()
+
+def object_path(filehash):
+	return os.path.join(cachedir, "objects", filehash[:2], filehash[2:])
+
+def record_path(stage, key):
+	return os.path.join(cachedir, "stages", "%s-%s.json" % (stage.name, key))
+
+def _copy_into_place(src, dest):
+	"Copy a file, so that dest only ever appears complete"
+	os.makedirs(os.path.dirname(dest), exist_ok=True)
+	shutil.copyfile(src, dest + ".tmp")
+	os.replace(dest + ".tmp", dest)
+
+def store_outputs(stage, key, seconds):
+	"Put the outputs of a stage that has just run into the cache, with a record of which outputs go with this key"
+	outputs = {}
+	for fpath in stage.outputs:
+		filehash = file_hash(fpath)
+		if not os.path.exists(object_path(filehash)):
+			_copy_into_place(os.path.join(rootdir, fpath), object_path(filehash))
+		outputs[fpath] = filehash
+	os.makedirs(os.path.dirname(record_path(stage, key)), exist_ok=True)
+	with open(record_path(stage, key) + ".tmp", 'wt') as outfp:
+		json.dump({'outputs': outputs, 'seconds': seconds}, outfp, indent=1)
+	os.replace(record_path(stage, key) + ".tmp", record_path(stage, key))
+
+def cached_record(stage, key):
+	"The record of a previous run of the stage with this key, if all its outputs are still in the cache (or None)"
+	if not os.path.exists(record_path(stage, key)):
+		return None
+	with open(record_path(stage, key), 'rt') as infp:
+		record = json.load(infp)
+	if sorted(record['outputs']) != sorted(stage.outputs):
+		return None
+	if not all(os.path.exists(object_path(filehash)) for filehash in record['outputs'].values()):
+		return None
+	return record
+
+def produced_hashes(stage, fpath):
+	"The hashes an output has had as written by the stage, in the runs of it recorded in the cache"
+	hashes = set()
+	prefix = stage.name + "-"
+	for recordfpath in glob.glob(os.path.join(cachedir, "stages", glob.escape(prefix) + "*.json")):
+		if len(os.path.basename(recordfpath)) != len(prefix) + 64 + len(".json"):   # (another stage, whose name starts with this one's)
+			continue
+		with open(recordfpath, 'rt') as infp:
+			filehash = json.load(infp)['outputs'].get(fpath)
+		if filehash is not None:
+			hashes.add(filehash)
+	return hashes
+
+def restore_outputs(stage, record, printed):
+	"""Bring back the cached outputs that are missing, or that are as the stage wrote them in another run (e.g. before an
+	input was changed and changed back). An output that is there but different from anything the stage wrote (edited by
+	hand) is left alone."""
+	for fpath, filehash in record['outputs'].items():
+		if not os.path.exists(os.path.join(rootdir, fpath)):
+			_copy_into_place(object_path(filehash), os.path.join(rootdir, fpath))
+			printed.append("    restored %s from the cache" % fpath)
+		elif file_hash(fpath) != filehash:
+			if file_hash(fpath) in produced_hashes(stage, fpath):
+				_copy_into_place(object_path(filehash), os.path.join(rootdir, fpath))
+				printed.append("    restored %s from the cache (it was the output of another run)" % fpath)
+			else:
+				printed.append("    WARNING: %s differs from the cached output of this stage (edited by hand?), so it's been left as it is" % fpath)
+
+############################################
+# Running the stages:
+
+class Result:
+	def __init__(self, status, seconds=0.0, detail=""):
+		self.status = status   # 'ran', 'cached', 'failed', or 'not run' (because a stage it needs failed)
+		self.seconds = seconds
+		self.detail = detail
+
+_printlock = threading.Lock()
+
+def report(stage, lines):
+	with _printlock:
+		for line in lines:
+			print("[%s] %s" % (stage.name, line) if not line.startswith("    ") else line)
+		sys.stdout.flush()
+
+def run_stage(stage, force=False):
+	"""Runs one stage, unless its outputs for the current inputs are already in the cache. Returns a Result.
+	(Called in a worker thread: the work itself is done by the stage's commands, in subprocesses.)"""
+	started = time.time()
+	printed = []
+	try:
+		key = stage_key(stage)
+		record = None if force else cached_record(stage, key)
+		if record is not None:
+			restore_outputs(stage, record, printed)
+			report(stage, ["up to date (key %s)" % key[:12]] + printed)
+			return Result('cached', time.time() - started, "%.1f s when run" % record['seconds'])
+
+		report(stage, ["running (key %s)" % key[:12]])
+		logfpath = os.path.join(cachedir, "logs", stage.name + ".log")
+		os.makedirs(os.path.dirname(logfpath), exist_ok=True)
+		with open(logfpath, 'wt') as logfp:
+			for command in stage.commands:
+				logfp.write("$ %s\n" % command)
+				logfp.flush()
+				status = subprocess.run(command, shell=True, cwd=stage.workdir, stdout=logfp, stderr=subprocess.STDOUT).returncode
+				if status != 0:
+					raise RuntimeError("command failed (exit status %i): %s\n    see %s" % (status, command, logfpath))
+		for fpath in stage.outputs:
+			if not os.path.isfile(os.path.join(rootdir, fpath)):
+				raise RuntimeError("did not write its output %s\n    see %s" % (fpath, logfpath))
+		seconds = time.time() - started
+		store_outputs(stage, key, seconds)
+		report(stage, ["done in %.1f s" % seconds])
+		return Result('ran', seconds)
+	except Exception as err:
+		report(stage, ["FAILED: %s" % err])
+		return Result('failed', time.time() - started, str(err).split("\n")[0])
+
+def select_stages(names):
+	"The named stages plus everything they depend on, in pipeline order"
+	byname = {stage.name: stage for stage in stages}
+	for name in names:
+		if name not in byname:
+			raise KeyError("No stage called %r. The stages are: %s" % (name, ", ".join(byname)))
+	wanted = set()
+	todo = list(names) if names else [stage.name for stage in stages if stage.default]
+	while todo:
+		name = todo.pop()
+		if name not in wanted:
+			wanted.add(name)
+			todo.extend(byname[name].depends)
+	return [stage for stage in stages if stage.name in wanted]
+
+def run_stages(selected, jobs=numjobs, force=()):
+	"""Runs the stages, each as soon as the stages it depends on have finished (up to `jobs` at a time). Returns {name: Result}."""
+	results = {}
+	pending = list(selected)
+	running = {}
+	with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+		while pending or running:
+			for stage in list(pending):
+				if len(running) >= jobs:
+					break
+				depends = stage.depends
+				if not all(name in results for name in depends):
+					continue
+				pending.remove(stage)
+				if any(results[name].status in ('failed', 'not run') for name in depends):
+					results[stage.name] = Result('not run', detail="needs " + ", ".join(name for name in depends if results[name].status in ('failed', 'not run')))
+					continue
+				running[pool.submit(run_stage, stage, stage.name in force)] = stage
+			if running:
+				finished, _ = wait(running, return_when=FIRST_COMPLETED)
+				for future in finished:
+					results[running.pop(future).name] = future.result()
+			save_hashes()
+	return results
+
+def print_timings(selected, results, elapsed):
+	print("")
+	print("%-22s %-8s %9s" % ("stage", "status", "time"))
+	for stage in selected:
+		result = results[stage.name]
+		print("%-22s %-8s %7.1f s  %s" % (stage.name, result.status, result.seconds, result.detail))
+	print("%-22s %-8s %7.1f s" % ("(total, wall clock)", "", elapsed))
+
+def list_stages():
+	for stage in stages:
+		try:
+			key = stage_key(stage)
+			state = "up to date" if cached_record(stage, key) is not None else "to run"
+		except FileNotFoundError as err:
+			state = "to run (%s)" % err
+		print("%-22s %-12s needs: %s" % (stage.name, state, ", ".join(stage.depends) or "-"))
+	save_hashes()
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+	force = set()
+	names = []
+	while args:
+		arg = args.pop(0)
+		if arg == '--list':
+			list_stages()
+			sys.exit(0)
+		elif arg == '--jobs':
+			numjobs = int(args.pop(0))
+		elif arg == '--force':
+			force.add(args.pop(0))
+		elif arg.startswith('-'):
+			raise ValueError("Usage: %s [--jobs N] [--force STAGE] [--list] [STAGE ...]" % sys.argv[0])
+		else:
+			names.append(arg)
+
+	selected = select_stages(names + sorted(force))
+	started = time.time()
+	results = run_stages(selected, numjobs, force)
+	print_timings(selected, results, time.time() - started)
+	if any(result.status != 'ran' and result.status != 'cached' for result in results.values()):
+		sys.exit(1)
@@ -0,0 +1,109 @@
+### Vectorised conversion of British National Grid (OSGB36) eastings/northings to WGS84 lat/lon
+### The same maths as bng_to_latlon.OSGB36toWGS84 (Hannah Fry's method), but applied to whole arrays at once with NumPy
+### Usage: lat, lon = osgb.OSGB36toWGS84_arrays(eastings, northings)
+
+from math import pi
+import numpy as np
+
+# The Airy 1830 semi-major and semi-minor axes used for OSGB36 (m)
+a, b = 6377563.396, 6356256.909
+F0 = 0.9996012717  # scale factor on the central meridian
+
+# Latitude and longitude of true origin (radians)
+lat0 = 49*pi/180
+lon0 = -2*pi/180  # longitude of central meridian
+
+# Northing & easting of true origin (m)
+N0, E0 = -100000, 400000
+e2 = 1 - (b*b)/(a*a)  # eccentricity squared
+n = (a-b)/(a+b)
+
+# Helmert transform from Airy 1830 to GRS80
+s = -20.4894*10**-6  # The scale factor -1
+tx, ty, tz = 446.448, -125.157, + 542.060  # The translations along x, y, z axes respectively
+rx, ry, rz = [x*pi/(180*3600.) for x in (0.1502, 0.2470, 0.8421)]  # The rotations along x, y, z respectively (seconds converted to radians)
+
+# The GRS80 semi-major and semi-minor axes used for WGS84 (m)
+a_2, b_2 = 6378137.000, 6356752.3141
+e2_2 = 1 - (b_2*b_2)/(a_2*a_2)  # The eccentricity of the GRS80 ellipsoid
+
+def OSGB36toWGS84_arrays(E, N):
+    """Convert arrays of OSGB36 eastings and northings (m) to arrays of WGS84 latitudes and longitudes (degrees, rounded to 6 d.p.).
+    Rows where either coordinate is missing (NaN) give NaN.
+    Each point goes through exactly the same iterations as the per-point bng_to_latlon.OSGB36toWGS84."""
+    E = np.asarray(E, dtype=np.float64)
+    N = np.asarray(N, dtype=np.float64)
+    outlat = np.full(E.shape, np.nan)
+    outlon = np.full(E.shape, np.nan)
+    valid = np.isfinite(E) & np.isfinite(N)
+    if np.any(valid):
+        outlat[valid], outlon[valid] = _convert(E[valid], N[valid])
+    return outlat, outlon
+
+def _convert(E, N):
+    # Iterate for the latitude on the Airy ellipsoid. Each point keeps iterating until its own stopping condition is met.
+    lat = np.full(E.shape, lat0)
+    M = np.zeros(E.shape)
+    todo = N-N0-M >= 0.00001  # Accurate to 0.01mm
+    while np.any(todo):
+        lt = (N[todo]-N0-M[todo])/(a*F0) + lat[todo]
+        lat[todo] = lt
+        M1 = (1 + n + (5./4)*n**2 + (5./4)*n**3) * (lt-lat0)
+        M2 = (3*n + 3*n**2 + (21./8)*n**3) * np.sin(lt-lat0) * np.cos(lt+lat0)
+        M3 = ((15./8)*n**2 + (15./8)*n**3) * np.sin(2*(lt-lat0)) * np.cos(2*(lt+lat0))
+        M4 = (35./24)*n**3 * np.sin(3*(lt-lat0)) * np.cos(3*(lt+lat0))
+        # meridional arc
+        M[todo] = b * F0 * (M1 - M2 + M3 - M4)
+        todo &= N-N0-M >= 0.00001
+
+    # transverse radius of curvature
+    nu = a*F0/np.sqrt(1-e2*np.sin(lat)**2)
+
+    # meridional radius of curvature
+    rho = a*F0*(1-e2)*(1-e2*np.sin(lat)**2)**(-1.5)
+    eta2 = nu/rho-1
+
+    sec_lat = 1./np.cos(lat)
+    VII = np.tan(lat)/(2*rho*nu)
+    VIII = np.tan(lat)/(24*rho*nu**3)*(5+3*np.tan(lat)**2+eta2-9*np.tan(lat)**2*eta2)
+    IX = np.tan(lat)/(720*rho*nu**5)*(61+90*np.tan(lat)**2+45*np.tan(lat)**4)
+    X = sec_lat/nu
+    XI = sec_lat/(6*nu**3)*(nu/rho+2*np.tan(lat)**2)
+    XII = sec_lat/(120*nu**5)*(5+28*np.tan(lat)**2+24*np.tan(lat)**4)
+    XIIA = sec_lat/(5040*nu**7)*(61+662*np.tan(lat)**2+1320*np.tan(lat)**4+720*np.tan(lat)**6)
+    dE = E-E0
+
+    # These are on the wrong ellipsoid currently: Airy 1830 (denoted by _1)
+    lat_1 = lat - VII*dE**2 + VIII*dE**4. - IX*dE**6.
+    lon_1 = lon0 + X*dE - XI*dE**3 + XII*dE**5. - XIIA*dE**7.
+
+    # Convert to cartesian from spherical polar coordinates (height taken as 0)
+    x_1 = (nu/F0)*np.cos(lat_1)*np.cos(lon_1)
+    y_1 = (nu/F0)*np.cos(lat_1)*np.sin(lon_1)
+    z_1 = ((1-e2)*nu/F0)*np.sin(lat_1)
+
+    # Perform Helmert transform (to go between Airy 1830 (_1) and GRS80 (_2))
+    x_2 = tx + (1+s)*x_1 + (-rz)*y_1 + (ry)*z_1
+    y_2 = ty + (rz)*x_1 + (1+s)*y_1 + (-rx)*z_1
+    z_2 = tz + (-ry)*x_1 + (rx)*y_1 + (1+s)*z_1
+
+    # Back to spherical polar coordinates from cartesian
+    p = np.sqrt(x_2**2 + y_2**2)
+
+    # Lat is obtained by an iterative procedure, again per point
+    lat = np.arctan2(z_2, (p*(1-e2_2)))  # Initial value
+    latold = np.full(E.shape, 2*pi)
+    todo = np.abs(lat - latold) > 10**-16
+    while np.any(todo):
+        lo = lat[todo]
+        latold[todo] = lo
+        nu_2 = a_2/np.sqrt(1-e2_2*np.sin(lo)**2)
+        lat[todo] = np.arctan2(z_2[todo]+e2_2*nu_2*np.sin(lo), p[todo])
+        todo &= np.abs(lat - latold) > 10**-16
+
+    lon = np.arctan2(y_2, x_2)
+
+    # Convert to degrees
+    lat = lat*180/pi
+    lon = lon*180/pi
+    return np.round(lat, 6), np.round(lon, 6)
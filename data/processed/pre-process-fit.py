@@ -1,47 +1,113 @@
 #!/usr/bin/env python3
 ### Process the FiT data to add an index column
-### Reads from stdin, writes to stdout
+### Reads the raw fit.csv from stdin; or, given the FiT Excel workbooks as arguments, reads them directly (the same output,
+### without writing and re-parsing the whole unfiltered report as raw fit.csv in between; numbers are written exactly as
+### the workbooks have them, where pandas' CSV parser can be out in the last digits). Writes to stdout
+### The output has the types given in schema.py; with "--parquet FILE", it is also written as Parquet
 
-import sys
+import sys, os, tempfile
 import pandas as pd
-import numpy as np
-
-fit_df = pd.read_csv(sys.stdin)
-
-# Check the file has the columns we expect and order them as we expect
-# If the columns don't exist, make the column empty
-output_df = pd.DataFrame()
-required_columns = ['Extension (Y/N)',
-                    'PostCode',
-                    'Technology',
-                    'Installed capacity',
-                    'Declared net capacity',
-                    'Application date',
-                    'Commissioning date',
-                    'MCS issue date',
-                    'Export status',
-                    'TariffCode',
-                    'Tariff Description',
-                    'Installation Type',
-                    'Installation Country',
-                    'Local Authority',
-                    'Government Office Region',
-                    'Constituency',
-                    'Accreditation Route',
-                    'MPAN Prefix',
-                    'Community school category',
-                    'LLSOA Code']
-
-for col in required_columns:
+import schema
+
+# Number of rows of the FiT file read, filtered and written at a time
+# (the file has around a million rows, of all technologies, so it is never all held in memory)
+chunksize = 50000
+
+# The columns we expect, in the order we expect them (the columns of the output, apart from the index column, fit_id)
+required_columns = schema.columns('fit')[1:]
+
+# The numeric columns; all other columns are read as text
+numeric_columns = schema.columns('fit', 'float')
+column_dtypes = {col: (float if col in numeric_columns else str) for col in required_columns}
+
+# The strings read as missing values: this mirrors read_csv's default na_values, so that the workbook route makes the same
+# cells NULL as the CSV route does
+missing_values = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                            '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+def processed_value(value, numeric):
+    """One raw value as it comes out of the CSV route: pandas reads its missing-value strings as missing, and the numeric columns as floats"""
+    if value in missing_values:
+        return None
+    if numeric:
+        return float(value)
+    return value
+
+def typed_batch(rows):
+    """Rows of processed values (fit_id first) as an Arrow record batch, conformed to the schema"""
+    return schema.arrow_batch(schema.conform(pd.DataFrame(rows, columns=schema.columns('fit'), dtype=object), 'fit'), 'fit')
+
+def process_rows(rows, outfp, printed):
+    """Worker for the workbook route: writes the PV rows of one workbook, with the required columns, each with its position
+    among the workbook's data rows (the rows it would have in the raw fit.csv) as fit_id. The part is written typed, as an
+    Arrow IPC file, so that it doesn't have to be parsed again. Returns (header, number of data rows)."""
+    import pyarrow as pa
+    writer = pa.ipc.new_file(outfp.buffer, schema.arrow_schema('fit'))   # (the part is binary, so it goes to the file underneath the text one)
     try:
-        output_df[col] = fit_df[col]
-    except KeyError:
-        output_df[col] = np.nan
+        header = None
+        numrows = 0
+        batch = []
+        for rowstrs in fitexcel.iter_output_rows(rows, printed):
+            if header is None:
+                # (where a column name is repeated, pandas would use the first one)
+                header = rowstrs
+                positions = [header.index(col) if col in header else len(header) for col in required_columns]
+                technology = positions[required_columns.index('Technology')]
+                continue
+            if technology < len(rowstrs) and rowstrs[technology]=='Photovoltaic':
+                batch.append([numrows] + [processed_value(rowstrs[pos], col in numeric_columns) if pos < len(rowstrs) else None
+                                          for col, pos in zip(required_columns, positions)])
+                if len(batch) == chunksize:
+                    writer.write_batch(typed_batch(batch))
+                    batch = []
+            numrows += 1
+        if batch:
+            writer.write_batch(typed_batch(batch))
+    finally:
+        writer.close()
+    return header, numrows
+
+def process_workbook(job):
+    return fitexcel.convert_workbook(job, consume=process_rows)
+
+writer = schema.ProcessedWriter('fit', sys.stdout, schema.parquet_output_arg(sys.argv))
+
+if len(sys.argv) > 1:
+    # The workbook reading is shared with data/raw/convert_fit_excel_to_csv.py
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raw'))
+    import convert_fit_excel_to_csv as fitexcel
+
+    # The workbooks are processed in parallel, then joined in order, with the index carrying on from one workbook to the next
+    import pyarrow as pa
+    datarows = 0
+    gotheader = False
+    with tempfile.TemporaryDirectory() as partdir:
+        for partfpath, partheader, numrows in fitexcel.iter_workbook_parts(sorted(sys.argv[1:]), os.path.join(partdir, "fit.arrow"),
+                                                                           process_workbook, printfp=sys.stderr):
+            with pa.OSFile(partfpath, 'rb') as partfp:
+                part = pa.ipc.open_file(partfp)
+                for whichbatch in range(part.num_record_batches):
+                    output_df = schema.from_arrow(part.get_batch(whichbatch), 'fit')
+                    output_df['fit_id'] += datarows
+                    writer.write(output_df, conformed=True)
+            gotheader = partheader is not None
+            datarows += numrows
+    assert(datarows > 10000)
+    assert(gotheader)
+
+else:
+    # Read only the columns we need, a chunk at a time, and write out each chunk as it's done
+    # The index column is the row's position in the whole file, which carries on from one chunk to the next
+    for fit_df in pd.read_csv(sys.stdin, usecols=lambda col: col in column_dtypes, dtype=column_dtypes, chunksize=chunksize):
+        # Check the chunk has the columns we expect and order them as we expect
+        # If the columns don't exist, make the column empty
+        output_df = fit_df.reindex(columns=required_columns)
 
-# Also at this point reduce to PV only (reduces data volumes)
-output_df = output_df[output_df['Technology']=='Photovoltaic']
+        # Also at this point reduce to PV only (reduces data volumes)
+        output_df = output_df[output_df['Technology']=='Photovoltaic']
 
-# Add index column
-fit_csv_str = output_df.to_csv(index=True)
+        # Add index column
+        output_df.insert(0, 'fit_id', output_df.index)
+        writer.write(output_df)
 
-sys.stdout.write(fit_csv_str)
+writer.close()
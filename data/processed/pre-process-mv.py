@@ -2,30 +2,45 @@
 ### Create a CSV for easy import to PostgreSQL
 ### Get the centre of the polygons as point coordinates for the machine vision objects
 ### Remove the string "<2016-06" from dates as this can't be loaded as a date in PostgreSQL
-### Reads from stdin, writes to stdout
+### Reads the GeoJSON file given as an argument (or from stdin), writes to stdout
+### The features are streamed from the file in batches (as read by GDAL, the same as geopandas.read_file would), so the whole
+### dataset is never held in memory, and no GeoDataFrame is built just to drop the geometry
+### The output has the types given in schema.py; with "--parquet FILE", it is also written as Parquet
 
-import geopandas as gpd
 import sys
+import pyogrio
+import shapely
+import schema
 
-machine_vision = "../raw/machine_vision.geojson"
-machine_vision_df = gpd.read_file(machine_vision)
+batchsize = 10000
 
-def getXY(pt):
-    return (pt.x, pt.y)
-centroidseries = machine_vision_df['geometry'].centroid
-centroidlist = map(getXY, centroidseries)
-machine_vision_df['x'], machine_vision_df['y'] = [list(t) for t in zip(*map(getXY, centroidseries))]
+def centroid_arrays(wkb):
+    """The x and y arrays of the centroids of a batch of WKB geometries (NaN where there is no geometry)"""
+    centroids = shapely.centroid(shapely.from_wkb(wkb))
+    return shapely.get_x(centroids), shapely.get_y(centroids)
 
-def remove_bad_date(dt_str):
+def remove_bad_dates(dt_strs):
     """Remove the string representing any date before 2016-06 and also only take
     the first of those with 2 dates; take the earlier date as correct for
     install date"""
-    return(dt_str.replace("<2016-06", "").split(",")[0])
-machine_vision_df['install_date'] = list(map(remove_bad_date, machine_vision_df['install_date']))
+    return dt_strs.str.replace("<2016-06", "", regex=False).str.split(",", regex=False).str[0]
 
-# TODO: if we need this in PostgreSQL/PostGIS, figure out the correct data type for table column
-machine_vision_df = machine_vision_df.drop(['geometry'], axis=1)
+writer = schema.ProcessedWriter('machine_vision', sys.stdout, schema.parquet_output_arg(sys.argv))
+if len(sys.argv) > 1:
+    machine_vision = sys.argv[1]
+else:
+    machine_vision = "/vsistdin/"
 
-mv_csv_str = machine_vision_df.to_csv(index=True)
-
-sys.stdout.write(mv_csv_str)
+# Write the batches one after the other, with the rows numbered on from the previous batch
+rowswritten = 0
+with pyogrio.open_arrow(machine_vision, batch_size=batchsize, use_pyarrow=True) as (meta, reader):
+    geometry_column = meta['geometry_name'] or 'wkb_geometry'
+    for batch in reader:
+        machine_vision_df = batch.to_pandas()
+        # TODO: if we need this in PostgreSQL/PostGIS, figure out the correct data type for table column
+        machine_vision_df['x'], machine_vision_df['y'] = centroid_arrays(machine_vision_df.pop(geometry_column))
+        machine_vision_df['install_date'] = remove_bad_dates(machine_vision_df['install_date'])
+        machine_vision_df.insert(0, 'mv_id', machine_vision_df.index + rowswritten)
+        writer.write(machine_vision_df)
+        rowswritten += len(machine_vision_df)
+writer.close()
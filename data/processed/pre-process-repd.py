@@ -1,108 +1,72 @@
 #!/usr/bin/env python3
 ### Process the REPD data to remove oddities
 ### Reads from stdin, writes to stdout
+### The output has the types given in schema.py; with "--parquet FILE", it is also written as Parquet
 
-from bng_to_latlon import OSGB36toWGS84 as convert
+from osgb import OSGB36toWGS84_arrays
 import sys
 import pandas as pd
-import re
+import schema
 
-# Remove "carriage returns" and the dagger symbol
-def clean_repd_csv(csv_str):
-    csv_str = csv_str.replace("\r", "").replace("†", "")
-    rgx_list = ['\s*<br*\s*"', '\s*<br>\s*"']
-    for rgx_match in rgx_list:
-        csv_str = re.sub(rgx_match, '"', csv_str)
-    return csv_str
+# Number of rows of the REPD file read, processed and written at a time
+# (so the memory used does not grow with the size of the file)
+chunksize = 10000
 
-sys.stdin.reconfigure(encoding='iso-8859-1')
-repd_df = pd.read_csv(sys.stdin, skiprows=1)
+# Remove "carriage returns" and the dagger symbol, and any trailing "<br>" tag, from every text field
+def clean_repd_fields(df):
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        df[col] = (df[col].str.replace("\r", "", regex=False)
+                          .str.replace("†", "", regex=False)
+                          .str.replace(r'\s*<br*\s*\Z', '', regex=True)
+                          .str.replace(r'\s*<br>\s*\Z', '', regex=True))
+    return df
+
+# Remove thousand-separator commas from a number field, and make it numeric
+# (the astype(object) lets a column that is entirely empty go through .str too)
+def commaless_float(series):
+    return series.astype(object).str.replace(',', '', regex=False).astype(float)
 
-# Check the file has the columns we expect and order them as we expect
-# If the columns don't exist, make the column empty
-output_df = pd.DataFrame()
-required_columns = ['Old Ref ID',
-                    'Ref ID',
-                    'Record Last Updated (dd/mm/yyyy)',
-                    'Operator (or Applicant)',
-                    'Site Name',
-                    'Technology Type',
-                    'Storage Type',
-                    'Storage Co-location REPD Ref ID',
-                    'Installed Capacity (MWelec)',
-                    'CHP Enabled',
-                    'RO Banding (ROC/MWh)',
-                    'FiT Tariff (p/kWh)',
-                    'CfD Capacity (MW)',
-                    'Turbine Capacity (MW)',
-                    'No. of Turbines',
-                    'Height of Turbines (m)',
-                    'Mounting Type for Solar',
-                    'Development Status',
-                    'Development Status (short)',
-                    'Address',
-                    'County',
-                    'Region',
-                    'Country',
-                    'Post Code',
-                    'X-coordinate',
-                    'Y-coordinate',
-                    'Planning Authority',
-                    'Planning Application Reference',
-                    'Appeal Reference',
-                    'Secretary of State Reference',
-                    'Type of Secretary of State Intervention',
-                    'Judicial Review',
-                    'Offshore Wind Round',
-                    'Planning Application Submitted',
-                    'Planning Application Withdrawn',
-                    'Planning Permission Refused',
-                    'Appeal Lodged',
-                    'Appeal Withdrawn',
-                    'Appeal Refused',
-                    'Appeal Granted',
-                    'Planning Permission Granted',
-                    'Secretary of State - Intervened',
-                    'Secretary of State - Refusal',
-                    'Secretary of State - Granted',
-                    'Planning Permission Expired',
-                    'Under Construction',
-                    'Operational']
+# The columns we expect, in the order we expect them (the columns of the output, apart from the lat and lon added)
+output_columns = schema.columns('repd')
+required_columns = output_columns[:-2]
 
-for col in required_columns:
-    try:
-        output_df[col] = repd_df[col]
-    except KeyError:
-        output_df[col] = np.nan
+def process_chunk(repd_df):
+    # Check the chunk has the columns we expect and order them as we expect
+    # If the columns don't exist, make the column empty
+    output_df = repd_df.reindex(columns=required_columns)
 
-# Also at this point reduce to PV only (reduces data volumes)
-output_df = output_df[output_df['Technology Type']=='Solar Photovoltaics']
+    # Also at this point reduce to PV only (reduces data volumes)
+    output_df = output_df[output_df['Technology Type']=='Solar Photovoltaics'].copy()
 
-# Remove thousand-separator commas from number fields
-output_df['Storage Co-location REPD Ref ID'] = output_df['Storage Co-location REPD Ref ID'].map(lambda x: float(str(x).replace(',','')))
-output_df['X-coordinate'] = output_df['X-coordinate'].map(lambda x: float(str(x).replace(',','')))
-output_df['Y-coordinate'] = output_df['Y-coordinate'].map(lambda x: float(str(x).replace(',','')))
+    # Remove thousand-separator commas from number fields
+    output_df['Storage Co-location REPD Ref ID'] = commaless_float(output_df['Storage Co-location REPD Ref ID'])
+    output_df['X-coordinate'] = commaless_float(output_df['X-coordinate'])
+    output_df['Y-coordinate'] = commaless_float(output_df['Y-coordinate'])
 
-# Remove spaces from postcodes
-output_df['Post Code'] = output_df['Post Code'].map(lambda x: str(x).replace(' ',''))
+    # Remove spaces from postcodes
+    output_df['Post Code'] = output_df['Post Code'].astype(object).fillna('nan').str.replace(' ', '', regex=False)
 
-# Ensure the tariff is numeric
-output_df['FiT Tariff (p/kWh)'] = output_df['FiT Tariff (p/kWh)'].map(lambda x: float(x))
+    # Ensure the tariff is numeric
+    output_df['FiT Tariff (p/kWh)'] = output_df['FiT Tariff (p/kWh)'].astype(float)
 
-# Remove line breaks from within certain fields
-output_df['Site Name'] = output_df['Site Name'].str.strip()
-output_df['Address'] = output_df['Address'].str.replace('\r\n', ', ')
-output_df['Appeal Reference'] = output_df['Appeal Reference'].map(lambda x: str(x).replace('\r\n', ''))
+    # Remove line breaks from within certain fields
+    output_df['Site Name'] = output_df['Site Name'].str.strip()
+    output_df['Address'] = output_df['Address'].str.replace('\r\n', ', ', regex=False)
+    output_df['Appeal Reference'] = output_df['Appeal Reference'].astype(object).fillna('nan').str.replace('\r\n', '', regex=False)
 
-# Convert each BNG coordinate to lat and lon and add new columns
-for index, row in output_df.iterrows():
-    # Ignore any rows that don't have an X and Y coordinate
-    if pd.notna(row['X-coordinate']) and pd.notna(row['Y-coordinate']):
-        lat, lon = convert(row['X-coordinate'], row['Y-coordinate'])
-        output_df.at[index,'latitude'] = lat
-        output_df.at[index,'longitude'] = lon
+    # Convert the BNG coordinates to lat and lon, all in one go, and add new columns
+    # (rows that don't have an X and Y coordinate are left empty)
+    output_df['latitude'], output_df['longitude'] = OSGB36toWGS84_arrays(output_df['X-coordinate'], output_df['Y-coordinate'])
 
-repd_csv_str = output_df.to_csv(index=False)
+    # Make generic edits
+    # (the dates, which are dd/mm/yyyy, are read when the chunk is conformed to the schema)
+    return clean_repd_fields(output_df)
 
-# Make generic edits and write out
-sys.stdout.write(clean_repd_csv(repd_csv_str))
+# Read the file a chunk at a time, as text (so that every chunk is parsed the same way), and write out each chunk as it's done
+sys.stdin.reconfigure(encoding='iso-8859-1')
+writer = schema.ProcessedWriter('repd', sys.stdout, schema.parquet_output_arg(sys.argv))
+for repd_df in pd.read_csv(sys.stdin, skiprows=1, dtype=str, chunksize=chunksize):
+    writer.write(process_chunk(repd_df))
+writer.close()
@@ -0,0 +1,225 @@
+### The typed schema of the processed datasets (osm, repd, fit and machine_vision), shared by the pre-process scripts
+### Each script conforms its output to its table's schema, and writes it as CSV (for the database's \copy, in db/*.sql),
+### and also as Parquet, which keeps the types: a later stage reads the values back as they were, with no re-parsing of text
+### and no re-inferring of types. The database types given here are those of the tables in db/*.sql, which must match.
+### Usage: writer = schema.ProcessedWriter('repd', sys.stdout, 'repd.parquet'); writer.write(chunk_df) ...; writer.close()
+###        df = schema.read_parquet('repd', 'repd.parquet')
+
+import numpy as np
+import pandas as pd
+
+# The columns of each table, in order: (column in the processed dataset, type, database column, database type)
+# The types are 'str', 'int', 'float' and 'date'. Any value can be missing.
+tables = {
+    'osm': [('objtype',                 'str',   'objtype',         'varchar(8)'),
+            ('id',                      'int',   'osm_id',          'bigint'),
+            ('user',                    'str',   'username',        'varchar(60)'),
+            ('timestamp',               'date',  'time_created',    'date'),
+            ('lat',                     'float', 'latitude',        'float'),
+            ('lon',                     'float', 'longitude',       'float'),
+            ('calc_area',               'float', 'area',            'float'),
+            ('calc_capacity',           'float', 'capacity',        'float'),
+            ('generator:solar:modules', 'int',   'modules',         'bigint'),
+            ('location',                'str',   'located',         'varchar(20)'),
+            ('orientation',             'int',   'orientation',     'integer'),
+            ('plantref',                'str',   'plantref',        'varchar(20)'),
+            ('source_capacity',         'str',   'source_capacity', 'varchar(255)'),
+            ('source_obj',              'str',   'source_obj',      'varchar(255)'),
+            ('tag_power',               'str',   'tag_power',       'varchar(15)'),
+            ('tag_repd:id',             'str',   'repd_id_str',     'varchar(20)'),
+            ('tag_start_date',          'date',  'tag_start_date',  'date')],
+
+    'repd': [('Old Ref ID',                              'str',   'old_repd_id',                    'varchar(15)'),
+             ('Ref ID',                                  'int',   'repd_id',                        'integer'),
+             ('Record Last Updated (dd/mm/yyyy)',        'date',  'record_last_updated',            'date'),
+             ('Operator (or Applicant)',                 'str',   'operator',                       'varchar(100)'),
+             ('Site Name',                               'str',   'site_name',                      'varchar(100)'),
+             ('Technology Type',                         'str',   'tech_type',                      'varchar(40)'),
+             ('Storage Type',                            'str',   'storage_type',                   'varchar(40)'),
+             ('Storage Co-location REPD Ref ID',         'int',   'co_location_repd_id',            'integer'),
+             ('Installed Capacity (MWelec)',             'float', 'capacity',                       'float'),
+             ('CHP Enabled',                             'str',   'chp_enabled',                    'varchar(3)'),
+             ('RO Banding (ROC/MWh)',                    'str',   'ro_banding',                     'varchar(10)'),
+             ('FiT Tariff (p/kWh)',                      'float', 'fit_tariff',                     'float'),
+             ('CfD Capacity (MW)',                       'str',   'cfd_capacity',                   'varchar(10)'),
+             ('Turbine Capacity (MW)',                   'str',   'turbine_capacity',               'varchar(10)'),
+             ('No. of Turbines',                         'str',   'num_turbines',                   'varchar(10)'),
+             ('Height of Turbines (m)',                  'str',   'height_turbines',                'varchar(10)'),
+             ('Mounting Type for Solar',                 'str',   'mounting_type',                  'varchar(10)'),
+             ('Development Status',                      'str',   'dev_status',                     'varchar(40)'),
+             ('Development Status (short)',              'str',   'dev_status_short',               'varchar(30)'),
+             ('Address',                                 'str',   'address',                        'varchar(300)'),
+             ('County',                                  'str',   'county',                         'varchar(30)'),
+             ('Region',                                  'str',   'region',                         'varchar(20)'),
+             ('Country',                                 'str',   'country',                        'varchar(20)'),
+             ('Post Code',                               'str',   'postcode',                       'varchar(15)'),
+             ('X-coordinate',                            'float', 'x',                              'float'),
+             ('Y-coordinate',                            'float', 'y',                              'float'),
+             ('Planning Authority',                      'str',   'planning_authority',             'varchar(70)'),
+             ('Planning Application Reference',          'str',   'planning_application_reference', 'varchar(50)'),
+             ('Appeal Reference',                        'str',   'appeal_reference',               'varchar(50)'),
+             ('Secretary of State Reference',            'str',   'sec_state_ref',                  'varchar(50)'),
+             ('Type of Secretary of State Intervention', 'str',   'type_sec_state_intervention',    'varchar(20)'),
+             ('Judicial Review',                         'float', 'judicial_review',                'float'),
+             ('Offshore Wind Round',                     'str',   'offshore_wind_round',            'varchar(10)'),
+             ('Planning Application Submitted',          'date',  'planning_application_submitted', 'date'),
+             ('Planning Application Withdrawn',          'date',  'planning_application_withdrawn', 'date'),
+             ('Planning Permission Refused',             'date',  'planning_permission_refused',    'date'),
+             ('Appeal Lodged',                           'date',  'appeal_lodged',                  'date'),
+             ('Appeal Withdrawn',                        'date',  'appeal_withdrawn',               'date'),
+             ('Appeal Refused',                          'date',  'appeal_refused',                 'date'),
+             ('Appeal Granted',                          'date',  'appeal_granted',                 'date'),
+             ('Planning Permission Granted',             'date',  'planning_permission_granted',    'date'),
+             ('Secretary of State - Intervened',         'date',  'sec_state_intervened',           'date'),
+             ('Secretary of State - Refusal',            'date',  'sec_state_refused',              'date'),
+             ('Secretary of State - Granted',            'date',  'sec_state_granted',              'date'),
+             ('Planning Permission Expired',             'date',  'planning_permission_expired',    'date'),
+             ('Under Construction',                      'date',  'under_construction',             'date'),
+             ('Operational',                             'date',  'operational',                    'date'),
+             ('latitude',                                'float', 'latitude',                       'float'),
+             ('longitude',                               'float', 'longitude',                      'float')],
+
+    'fit': [('fit_id',                    'int',   'fit_id',                'int'),
+            ('Extension (Y/N)',           'str',   'extension',             'char(1)'),
+            ('PostCode',                  'str',   'postcode_stub',         'varchar(7)'),
+            ('Technology',                'str',   'technology',            'varchar(24)'),
+            ('Installed capacity',        'float', 'installed_capacity',    'float'),
+            ('Declared net capacity',     'float', 'declared_net_capacity', 'float'),
+            ('Application date',          'date',  'application_date',      'date'),
+            ('Commissioning date',        'date',  'commissioning_date',    'date'),
+            ('MCS issue date',            'date',  'mcs_issue_date',        'date'),
+            ('Export status',             'str',   'export_status',         'varchar(30)'),
+            ('TariffCode',                'str',   'tariff_code',           'varchar(20)'),
+            ('Tariff Description',        'str',   'tariff_description',    'varchar(100)'),
+            ('Installation Type',         'str',   'installation_type',     'varchar(25)'),
+            ('Installation Country',      'str',   'country',               'varchar(15)'),
+            ('Local Authority',           'str',   'local_authority',       'varchar(40)'),
+            ('Government Office Region',  'str',   'govt_office_region',    'varchar(40)'),
+            ('Constituency',              'str',   'constituency',          'varchar(60)'),
+            ('Accreditation Route',       'str',   'accreditation_route',   'varchar(6)'),
+            ('MPAN Prefix',               'float', 'mpan_prefix',           'float'),
+            ('Community school category', 'str',   'comm_school',           'varchar(40)'),
+            ('LLSOA Code',                'str',   'llsoa_code',            'varchar(20)')],
+
+    'machine_vision': [('mv_id',        'int',   'mv_id',          'int'),
+                       ('area',         'float', 'area',           'float'),
+                       ('confidence',   'str',   'confidence',     'char(1)'),
+                       ('install_date', 'date',  'install_date',   'date'),
+                       ('iso-3166-1',   'str',   'iso_code_short', 'char(2)'),
+                       ('iso-3166-2',   'str',   'iso_code',       'char(6)'),
+                       ('attribution',  'str',   'attribution',    'varchar(50)'),
+                       ('x',            'float', 'longitude',      'float'),
+                       ('y',            'float', 'latitude',       'float')],
+}
+
+pandas_dtypes = {'str': 'string', 'int': 'Int64', 'float': 'float64', 'date': 'datetime64[ns]'}
+
+def columns(table, kind=None):
+    """The column names of a processed dataset, in order (only those of the given type, if one is given)"""
+    return [col for col, colkind, dbcol, dbtype in tables[table] if kind is None or colkind == kind]
+
+def _parse_dates(values):
+    """Read dates as the database does (with the DMY datestyle set in db/make-database.sql): ISO 8601 (e.g. the FiT and OSM
+    dates), or otherwise day first (e.g. the REPD's dd/mm/yyyy). Only the values that aren't ISO 8601 go to the slower parser."""
+    dates = pd.to_datetime(values, format='ISO8601', errors='coerce', utc=True)
+    others = dates.isna() & values.notna()
+    if others.any():
+        dates[others] = pd.to_datetime(values[others], format='mixed', dayfirst=True, utc=True)
+    return dates
+
+def _conform_column(series, kind):
+    if kind == 'str':
+        return series.astype('string')
+    if kind == 'float':
+        return pd.to_numeric(series).astype('float64')
+    if kind == 'int':
+        # (rounded, as the database would when casting a float column to an integer one)
+        return np.round(pd.to_numeric(series).astype('float64')).astype('Int64')
+    if kind == 'date':
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            series = _parse_dates(series.astype(object))
+        if series.dt.tz is not None:
+            series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+        return series.dt.normalize().astype('datetime64[ns]')
+    raise ValueError("Unknown column type %r" % kind)
+
+def conform(df, table):
+    """A copy of the DataFrame with exactly the table's columns, in order, each converted to its type. A missing column is left
+    empty. Raises ValueError for a value that isn't of its column's type (e.g. text in a number column), as the database would."""
+    output_df = df.reindex(columns=columns(table))
+    for col, kind, dbcol, dbtype in tables[table]:
+        try:
+            output_df[col] = _conform_column(output_df[col], kind)
+        except (ValueError, TypeError) as err:
+            raise ValueError("%s column %r is not all %s: %s" % (table, col, kind, err))
+    return output_df
+
+def arrow_schema(table):
+    import pyarrow as pa   # (only needed for the Parquet files, so only imported here)
+    arrowtypes = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'date': pa.date32()}
+    return pa.schema([(col, arrowtypes[kind]) for col, kind, dbcol, dbtype in tables[table]])
+
+def arrow_batch(df, table):
+    """A conformed DataFrame as an Arrow record batch with the table's schema"""
+    import pyarrow as pa
+    schema = arrow_schema(table)
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if pa.types.is_date32(field.type):
+            arrays.append(pa.array(values.dt.date.astype(object).where(values.notna(), None), type=field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.record_batch(arrays, schema=schema)
+
+def from_arrow(data, table):
+    """A conformed DataFrame from an Arrow table or record batch with the table's schema"""
+    import pyarrow as pa
+    df = data.to_pandas(types_mapper={pa.string(): pd.StringDtype(), pa.int64(): pd.Int64Dtype()}.get, date_as_object=False)
+    return df.astype({col: pandas_dtypes[kind] for col, kind, dbcol, dbtype in tables[table]})
+
+def read_parquet(table, fpath):
+    """Read a processed dataset written by ProcessedWriter, as a conformed DataFrame (no parsing, and the types as written)"""
+    import pyarrow.parquet as pq
+    return from_arrow(pq.read_table(fpath, schema=arrow_schema(table)), table)
+
+def write_csv(df, outfp, header=True):
+    """Write a conformed DataFrame as CSV, for the database: missing values are empty, and dates are YYYY-MM-DD"""
+    df.to_csv(outfp, index=False, header=header, date_format='%Y-%m-%d')
+
+class ProcessedWriter:
+    """Writes a processed dataset a chunk at a time, conformed to its table's schema: as CSV to csvfp (with the header written
+    once, even if there are no rows), and also as Parquet if parquetfpath is given"""
+    def __init__(self, table, csvfp, parquetfpath=None):
+        self.table = table
+        self.csvfp = csvfp
+        self.headerwritten = False
+        self.parquet = None
+        if parquetfpath:
+            import pyarrow.parquet as pq
+            self.parquet = pq.ParquetWriter(parquetfpath, arrow_schema(table))
+
+    def write(self, df, conformed=False):
+        if not conformed:
+            df = conform(df, self.table)
+        write_csv(df, self.csvfp, header=not self.headerwritten)
+        self.headerwritten = True
+        if self.parquet is not None and len(df):
+            self.parquet.write_batch(arrow_batch(df, self.table))
+
+    def close(self):
+        if not self.headerwritten:
+            self.write(pd.DataFrame(columns=columns(self.table)))
+        if self.parquet is not None:
+            self.parquet.close()
+
+def parquet_output_arg(argv):
+    """Take "--parquet FILE" out of a script's argument list (in place), returning FILE, or None if it's not there"""
+    if '--parquet' not in argv:
+        return None
+    i = argv.index('--parquet')
+    if i + 1 >= len(argv):
+        raise ValueError("--parquet needs a file name")
+    fpath = argv[i + 1]
+    del argv[i:i + 2]
+    return fpath
@@ -0,0 +1,69 @@
+### Normalise the free-text OSM start_date tag into datetimes, as dateutil would parse them
+### Each distinct string is only parsed once (and remembered); the common forms (YYYY, YYYY-MM, YYYY-MM-DD) are parsed in bulk, and dateutil only sees the rest
+### Usage: output_df['tag_start_date'] = start_dates.normalise_start_dates(output_df['tag_start_date'])
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dateutil.parser import parse
+
+# Edits made to the strings before parsing
+before_date_strs = ['before ']
+after_date_strs = ['.']
+mistakes = [('-00', '-01')]
+
+# Parts of the date that are missing (e.g. the month and day of "2015") are taken from this date
+default_date = datetime(2020, 1, 1)
+
+# The forms that are parsed in bulk, without dateutil: (regex for the whole string, format)
+bulk_forms = [(r'\d{4}', '%Y'),
+              (r'\d{4}-\d{2}', '%Y-%m'),
+              (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d')]
+
+# The datetime for every raw string seen so far
+_parsed = {}
+
+def clean_start_dates(rawstrs):
+    """Make the edits to a Series of raw start date strings that are needed before parsing them"""
+    dates = rawstrs
+    for string in before_date_strs:
+        dates = dates.str.split(string, regex=False).str[-1]
+    for string in after_date_strs:
+        dates = dates.str.split(string, regex=False).str[0]
+    for mistake, correction in mistakes:
+        dates = dates.str.replace(mistake, correction, regex=False)
+    return dates
+
+def _parse_new(rawstrs):
+    """Parse raw strings that haven't been seen before, and remember the results"""
+    dates = clean_start_dates(pd.Series(rawstrs, dtype=object))
+    results = pd.Series(None, index=dates.index, dtype=object)
+
+    # Bulk-parse the common forms. A string that looks right but isn't a real date (e.g. "2015-02-30") is left for dateutil.
+    for regex, fmt in bulk_forms:
+        form = dates[dates.str.fullmatch(regex)]
+        if len(form):
+            parsed = pd.to_datetime(form, format=fmt, errors='coerce')
+            parsed = parsed[parsed.notna()]
+            results[parsed.index] = [datetime(ts.year, ts.month, ts.day) for ts in parsed]
+
+    # Anything else goes to dateutil (which raises an error for strings it can't make a date from)
+    for i in results.index[results.isna()]:
+        results[i] = parse(dates[i], ignoretz=True, default=default_date)
+
+    _parsed.update(zip(rawstrs, results))
+
+def normalise_start_dates(values):
+    """Convert start date tag values to a list of datetimes, with None for missing values"""
+    values = pd.Series(values).reset_index(drop=True)
+    present = values.notna().to_numpy()
+    rawstrs = values[present].astype(str)
+
+    codes, uniques = pd.factorize(rawstrs)
+    new = [rawstr for rawstr in uniques if rawstr not in _parsed]
+    if new:
+        _parse_new(new)
+
+    out = np.full(len(values), None, dtype=object)
+    out[present] = np.array([_parsed[rawstr] for rawstr in uniques], dtype=object)[codes]
+    return out.tolist()
@@ -1,20 +1,23 @@
 #!/usr/bin/env python
 
-# Script to parse an OSM XML extract for solar PV data.
+# Script to parse an OSM extract (PBF or XML) for solar PV data.
 # Dan Stowell, 2019-2020.
 
-import os, sys, csv, subprocess, re
-from functools import reduce
+import os, sys, csv, subprocess, re, gzip, pickle, json, io, contextlib, itertools, multiprocessing
 from xml import sax
 import numpy as np
 
-from matplotlib.path import Path
-from scipy.spatial import KDTree as kdtree
-
 import pandas as pd
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 
+import osm_pbf
+import osm_tags
+import osm_output
+from osm_store import CoordStore, RangeStore
+from osm_containment import OutlineIndex
+from osm_stats import SolarStats
+
 ############################################
 # User configuration:
 
@@ -22,13 +25,22 @@ import matplotlib.pyplot as plt
 # osmsourcefpath = os.path.expanduser('~/osm/great-britain/great-britain-200729.osm.pbf')
 
 do_osmium = False
-osmsourcefpath = "osm-gb-solaronly.xml"
+osmsourcefpath = "osm-gb-solaronly.osm.pbf"   # either a .osm.pbf file (read directly) or an XML .osm/.xml file
+numworkers = os.cpu_count() or 1   # a .osm.pbf file is decoded in shards by this many processes (1 = all in this process). The output is identical either way.
 
 # The extract must ALREADY have been processed by osmium to filter down to just the generator:method=photovoltaic items.
 # Here's what I do:
 # osmium tags-filter ~/osm/great-britain/great-britain-200729.osm.pbf generator:method=photovoltaic plant:method=photovoltaic plant:source=solar -o  ~/osm/solarsearch/gb-solarextracts/gb-200729-solar-withreferenced.xml
 # In the public scripts, this is all included in the work done by the makefile
 
+# After a full run, the compiled state (PV objects, coordinates, outlines, plantrefs) is saved here. Running
+#    python3 compile_osm_solar.py --update changes.osc.gz [more.osc.gz ...]
+# then applies OSM change files to that state, rather than re-parsing the whole extract.
+statefpath = "osm-solar-state.pickle"
+
+statsfpath = "osm-stats.json"   # the summary statistics printed at the end are also written here
+outputfpaths = ["osm.csv", "osm.parquet"]   # output files: .csv, and/or typed columnar output as .parquet or .arrow (which need pyarrow)
+
 
 ############################################
 # Helper functions:
@@ -45,6 +57,11 @@ def PolyArea(x,y):
 	"Calculate area of a polygon from its coordinates (shoelace formula)"
 	return 0.5*np.abs(np.dot(x,np.roll(y,1))-np.dot(y,np.roll(x,1)))  # https://stackoverflow.com/questions/24467972/calculate-area-of-polygon-given-x-y-coordinates
 
+def is_pv_object(tags):
+	"Whether an OSM element's tags make it a solar PV object: a photovoltaic generator, or a solar plant"
+	return (tags.get('power')=='generator' and tags.get('generator:method')=='photovoltaic') \
+		or (tags.get('power')=='plant'     and (tags.get('plant:method')=='photovoltaic' or tags.get('plant:source')=='solar'))
+
 def guess_kilowattage(anobj):
 	"This should NOT NORMALLY BE USED since it is really only a rule of thumb."
 	if not anobj['calc_area']:
@@ -52,41 +69,6 @@ def guess_kilowattage(anobj):
 	else:
 		return anobj['calc_area'] * 0.15
 
-regex_numbers_semicolon_start = re.compile('^([0-9;]*).*')
-
-compasspoints = {
-	'N':     0,
-	'NNE':  22.5,
-	'NE':   45,
-	'ENE':  67.5,
-	'E':    90,
-	'ESE': 112.5,
-	'SE':  135,
-	'SSE': 157.5,
-	'S':   180,
-	'SSW': 202.5,
-	'SW':  225,
-	'WSW': 247.5,
-	'W':   270,
-	'WNW': 292.2,
-	'NW':  315,
-	'NNW': 337.5,
-	# unconventional but seen in data:
-	'NORTH':   0,
-	'NORTHEAST':   45,
-	'NORTH_EAST':   45,
-	'EAS':    90,                   # TEMPORARY fix for wonky entry
-	'EAST':    90,
-	'SOUTHEAST':    135,
-	'SOUTH_EAST':    135,
-	'SOUTH':  180,
-	'SOUTHWEST':    225,
-	'SOUTH_WEST':    225,
-	'WEST':   270,
-	'NORTHWEST':   315,
-	'NORTH_WEST':   315,
-}
-
 ##############################################################################
 # The main routine, which progressively reacts to XML content as it is loaded:
 
@@ -98,8 +80,12 @@ class SolarXMLHandler(sax.handler.ContentHandler):
 		self.curitem = None
 		self.objs = []
 		# these value-stores are for intermediate processing of relationships (e.g. the parent way/rel to know their own accumulated contents) - they are not used as the output data.
-		self.nodedata = {}
-		self.waydata = {}
+		# Nodes and ways are by far the most numerous, so their coordinates are kept in compact array stores (keyed by integer id) rather than a dict per item.
+		self.nodedata = CoordStore('node')
+		# A way's nodes are kept as a run of node-store indices in waynoderanges (its start and count are columns of waydata), so that
+		# outline polygons can be built on demand from the node coordinates - which is only needed for the plant outlines.
+		self.waydata = CoordStore('way', extracols=['calc_area'], intcols=['nodestart', 'nodecount'])
+		self.waynoderanges = RangeStore('way node')
 		self.reldata = {}
 
 	def startElement (self, name, attrs):
@@ -117,302 +103,149 @@ class SolarXMLHandler(sax.handler.ContentHandler):
 		elif name == 'tag':
 			self.curitem['tags'][attrs['k']] = attrs['v']
 		elif name == 'nd': # This is a node reference from within a way
-			self.curitem['nodes'].append(attrs['ref'])
+			self.curitem['nodes'].append(int(attrs['ref']))
 		elif name == 'member': # This is a node/way/rel reference from within a relation
 			if attrs['type'] == 'way':
-				self.curitem['ways'].append({'ref':attrs['ref'], 'role':attrs['role']})
+				self.curitem['ways'].append({'ref':int(attrs['ref']), 'role':attrs['role']})
 			elif attrs['type'] == 'relation':
-				self.curitem['relations'].append({'ref':attrs['ref'], 'role':attrs['role']})
+				self.curitem['relations'].append({'ref':int(attrs['ref']), 'role':attrs['role']})
 			elif attrs['type'] == 'node':
-				self.curitem['nodes'].append({'ref':attrs['ref'], 'role':attrs['role']})
+				self.curitem['nodes'].append({'ref':int(attrs['ref']), 'role':attrs['role']})
 			else:
 				raise ValueError("This script does not know how to handle the following member-type found in relation %s: '%s'" % (self.curitem['id'], attrs['type']))
 
+	def add_item(self, item):
+		"""Accepts one complete node/way/relation record, as built by startElement() and the child elements.
+		This lets non-XML readers (e.g. the PBF reader in osm_pbf.py) feed the handler directly, without an XML step."""
+		self.curitem = item
+		self.endElement(item['objtype'])
+
+	def add_shard_segment(self, segment):
+		"Merges in one segment of parsed data from parse_shard(), giving exactly the same result as if its items had been added here with add_item()."
+		if segment[0]=='ways':
+			for item in segment[1]:
+				self.add_item(item)
+		else:
+			_, nodeids, nodelats, nodelons, reldata, objs, printed = segment
+			sys.stdout.write(printed)
+			self.nodedata.extend(nodeids, nodelats, nodelons)
+			for osmid, therel in reldata.items():
+				if osmid in self.reldata:
+					raise ValueError("datacache seems to encounter a duplicate item: type %s, id %i" % ('relation', osmid))
+				self.reldata[osmid] = therel
+			self.objs.extend(objs)
+
 	def endElement(self, name):
 		if name in ['node', 'way', 'relation']: # finish off, and store, the "object"
-			curitem = self.curitem # for speed
-
-			if ('highway' in curitem['tags']) and (curitem['tags']['highway']=='turning_circle'):
-				raise ValueError("Data contains highway=turning_circle items. Are you sure this OSM data has been preprocessed to strip it down only to the photovoltaics?")
-
-			# Cache the object data for use in lookups etc (NOT for output, these data structures - actually "curitem" is where the data for output live.)
-			datacache = {
-				'node': self.nodedata,
-				'way': self.waydata,
-				'relation': self.reldata,
-			}[name]
-			if curitem['id'] in datacache:
-				raise ValueError("datacache seems to encounter a duplicate item: type %s, id %i" % (name, curitem['id']))
-			datacache[curitem['id']] = {}
-			datacacheitem = datacache[curitem['id']]
-
-			if curitem['objtype']=='node':
-				datacacheitem['lat'] = curitem['lat']
-				datacacheitem['lon'] = curitem['lon']
-				curitem['calc_area'] = 0   # TODO there may be a tag telling you the area; else, as a node, it's useful to make clear we have no area estimate
-
-			elif curitem['objtype']=='way':
-				latlist = [self.nodedata[nodeid]['lat'] for nodeid in curitem['nodes']]
-				lonlist = [self.nodedata[nodeid]['lon'] for nodeid in curitem['nodes']]
-				datacacheitem['outlinepath'] = Path([_ for _ in zip(latlist, lonlist)])
-				# calculate its centroid as mean(nodes)
-				curitem['lat'] = np.mean(latlist)
-				curitem['lon'] = np.mean(lonlist)
-				datacacheitem['lat'] = curitem['lat']
-				datacacheitem['lon'] = curitem['lon']
-				# calculate its area using PolyArea
-				curitem['calc_area'] = PolyArea(latlist, lonlist)
-				# convert to square metres
-				curitem['calc_area'] = round(angular_area_to_sqm(curitem['calc_area'], curitem['lat']), 1)
-				datacacheitem['calc_area'] = curitem['calc_area']
-
-			elif curitem['objtype']=='relation':
-				datacacheitem['relations'] = curitem['relations']
-				datacacheitem['ways'] = curitem['ways']
-				datacacheitem['nodes'] = curitem['nodes']
-				datacacheitem['calc_area'] = 0
-				# NB most of the relationship-handling comes at the end in postprocess()
-
-			####################################
-			# Processing tags to log a PV object
-			if (curitem['tags'].get('power')=='generator' and curitem['tags'].get('generator:method')=='photovoltaic') \
-			or (curitem['tags'].get('power')=='plant'     and (curitem['tags'].get('plant:method')=='photovoltaic' or curitem['tags'].get('plant:source')=='solar')):
-
-				for k,v in curitem['tags'].items():
-					# In here we aim to process ALL KNOWN tags, including irrelevant ones, so that no information is lost
-					ok = True
-					if k=='power':
-						curitem['tag_power'] = v
-					elif k in ['generator:output:electricity', 'plant:output:electricity']:
-						v = v.replace(",", ".").upper()
-						if v in ['YES', 'SMALL_INSTALLATION']:
-							pass
-						elif v.endswith(" W"):
-							curitem['calc_capacity'] = float(v[:-2]) * 0.001
-						elif v.endswith(" KW"):
-							curitem['calc_capacity'] = float(v[:-3])
-						elif v.endswith(" MW"):
-							curitem['calc_capacity'] = float(v[:-3]) * 1000
-						elif v.endswith(" MWP"): # NB probably not possible to make use of difference between MW and MWp
-							curitem['calc_capacity'] = float(v[:-3]) * 1000
-						elif v.endswith("KW"):
-							curitem['calc_capacity'] = float(v[:-2])
-						elif v.endswith("MW"):
-							curitem['calc_capacity'] = float(v[:-2]) * 1000
-						else:
-							ok = False
-					elif k in ['location', 'generator:place', 'generator:location']:
-						if v=='rooftop':
-							v = 'roof'
-						curitem['location'] = v
-					elif k in ['source', 'source:geometry']:
-						curitem['source_obj'] = v.replace(",", ";")
-					elif k in ['source:generator:output:electricity', 'source:plant:output:electricity', "source:power:output", "source:output", "source:power"]:
-						if v=='REPD Open Data':
-							v = 'repd'
-						curitem['source_capacity'] = v.replace(",", ";")
-					elif k=='note':
-						if v=='roof household':
-							curitem['location'] = 'roof'
-						else:
-							pass # TODO check all unhandled "note", see if they're OK
-					elif k=='notional_area':
-						if curitem['calc_area'] != 0:
-							#TODO consider: print("  WARNING: skipping notional_area for %s %s because calc_area already filled in" % (curitem['objtype'], curitem['id']))
-							pass
-						if v.endswith(' sq m'):
-							try:
-								curitem['calc_area'] = float(v[:-5].replace(',', '.', ))
-							except:
-								print("Couldn't handle this notional_area: " + v)
-						else:
-							ok = False
-					elif k in ['direction', 'generator:orientation', 'orientation']:
-						v = v.replace('`', '').upper()  # some people write it this way
-						if v in compasspoints:
-							curitem['orientation'] = compasspoints[v]
-						elif v in ['ESW']:
-							pass # uninterpretable case seen in data... so skip
-						elif v in ['FLAT']:
-							pass # flat-mounted items have no orientation
-						else:
-							try:
-								curitem['orientation'] = int(v) # NB there could of course be parse failures here
-							except ValueError:
-								print("Un-parseable orientation value in %s %s: %s=%s" % (curitem['objtype'], curitem['id'], k, v))
-					elif k=='pv_module_array':
-						splitvals = v.split(" by ")
-						if len(splitvals)==2:
-							curitem['generator:solar:modules'] = int(splitvals[0]) * int(splitvals[1])
-						else:
-							ok = False
-					elif k in ['modules', 'generator:solar:modules', 'generator:modules']:
-						if v=='unknown':
-							v=''
-						else:
-							# It's quite common (for some UI reason) to get typos in this field with characters pasted after the initial digits. We trim them off.
-							v = regex_numbers_semicolon_start.sub('\\1', v)
-						if ';' in v:
-							v = str(reduce(lambda a, b: a+b, map(int, v.split(';')))) # entries could be e.g. "7;5;2" and here we reduce them to a single integer sum
-						curitem['generator:solar:modules'] = v
-					#elif k=='':
-					#elif k=='':
-					#elif k=='':
-					#elif k=='':
-					#elif k=='':
-					#elif k=='':
-					#elif k=='':
-					elif k in [
-# Here are ALL the ones we copy into the output data unedited
-'start_date',
-'repd:id',
-						]:
-						curitem['tag_%s' % k] = v
-					elif k in [
-# Here are ALL the ones we don't need information from:
-'generator',
-'generator:source',
-'generator:method',
-'generator:type',
-'generator:output',
-'generator:note',
-'generator:strings',
-'generator:output:biogas',
-'generator:output:hot_water',
-'generator:plant',
-'plant:source',
-'plant:method',
-'plant:type',
-'power_source',
-'note:generator:output:electricity',
-'voltage',
-'fixme',
-'earliest_start_date',
-'latest_start_date',
-'amenity',
-'capacity',
-'floating',
-'area',
-'ref',
-'website',
-'alt_name',
-'url',
-'landcover',
-'email',
-'fax',
-'postal_code',
-'phone',
-'site',
-'surface',
-'notes',
-'industrial',
-'listed_status',
-'survey_date',
-'man_made',
-'barrier',
-'fence_type',
-'height',
-'shop',
-'wheelchair',
-'sport',
-'brand',
-'leisure',
-'frequency',
-'manufacturer',
-'architect',
-'HE_ref',
-'note_2',
-'survey:date',
-'mapillary',
-'natural',
-'construction',
-'farmland',
-'opening_hours',
-	] or k.split(':')[0] in [
-'source',  # NB there are lots of different source tags. Here we're suppressing any leftovers, even though we may use specific source tags already.
-'operator',
-'owner',
-'description',
-'contact',
-'name',
-'fence',
-'social_facility',
-'flickr',
-'highway',
-'landuse',
-'fhrs',
-'layer',
-'ref',
-'level',
-'wikimedia_commons',
-'wikidata',
-'wikipedia',
-'geograph',
-'type', # rel multipolygon
-'tourism',
-'building',
-'addr',
-'roof',
-'demolished',
-'indoor',
-]:
-						pass
-					else:
-						ok = False
+			obj = self._finish_item(self.curitem)
+			if obj is not None:
+				self.objs.append(obj)
+			self.curitem = None      # NB we need to clear "curitem" in ALL cases where it was a node/way/item, NOT just if it's a PV item processed.
 
-					if not ok:
-						astr = "Un-recognised tag in %s %s: %s=%s" % (curitem['objtype'], curitem['id'], k, v)
-						print(astr)
-						#raise ValueError(astr)
+	def _finish_item(self, curitem, replace=False):
+		"""Stores the geometry of a completed node/way/relation, and returns it as a processed PV object if it is one (else None).
+		With replace=True, an element already in the stores is overwritten (used when applying a change file) rather than being an error."""
+		if ('highway' in curitem['tags']) and (curitem['tags']['highway']=='turning_circle'):
+			raise ValueError("Data contains highway=turning_circle items. Are you sure this OSM data has been preprocessed to strip it down only to the photovoltaics?")
+
+		# Cache the object data for use in lookups etc (NOT for output, these data structures - actually "curitem" is where the data for output live.)
+		osmid = int(curitem['id'])
+		if curitem['objtype']=='node':
+			if replace:
+				self.nodedata.update(osmid, curitem['lat'], curitem['lon'])
+			else:
+				self.nodedata.add(osmid, curitem['lat'], curitem['lon'])
+			curitem['calc_area'] = 0   # TODO there may be a tag telling you the area; else, as a node, it's useful to make clear we have no area estimate
+
+		elif curitem['objtype']=='way':
+			nodeindices = self.nodedata.indices(curitem['nodes'])
+			latlist = self.nodedata.lat[nodeindices]
+			lonlist = self.nodedata.lon[nodeindices]
+			nodestart = self.waynoderanges.append(nodeindices)
+			# calculate its centroid as mean(nodes)
+			curitem['lat'] = np.mean(latlist)
+			curitem['lon'] = np.mean(lonlist)
+			# calculate its area using PolyArea
+			curitem['calc_area'] = PolyArea(latlist, lonlist)
+			# convert to square metres
+			curitem['calc_area'] = round(angular_area_to_sqm(curitem['calc_area'], curitem['lat']), 1)
+			if replace:
+				self.waydata.update(osmid, curitem['lat'], curitem['lon'], calc_area=curitem['calc_area'], nodestart=nodestart, nodecount=len(nodeindices))
+			else:
+				self.waydata.add(osmid, curitem['lat'], curitem['lon'], calc_area=curitem['calc_area'], nodestart=nodestart, nodecount=len(nodeindices))
 
-					# TODO also try to calc_type: rooftop or infarm (location=roof; large size) or unknown
+		elif curitem['objtype']=='relation':
+			if osmid in self.reldata and not replace:
+				raise ValueError("datacache seems to encounter a duplicate item: type %s, id %i" % (curitem['objtype'], osmid))
+			self.reldata[osmid] = {
+				'relations': curitem['relations'],
+				'ways': curitem['ways'],
+				'nodes': curitem['nodes'],
+				'calc_area': 0,
+			}
+			# NB most of the relationship-handling comes at the end in postprocess()
 
-				if curitem['tag_power']=='plant': # We store the power-plant's ID info in a form which will be easy to propagate down to child members
-					curitem['plantref'] = (curitem['objtype'], curitem['id'])
+		####################################
+		# Processing tags to log a PV object
+		if is_pv_object(curitem['tags']):
 
-				# OK now store it - we only need to store top-level PV items, child-nodes etc are not needed except for the data stored elsewhere
-				self.objs.append(self.curitem)
+			osm_tags.normalise_tags(curitem)
 
+			if curitem['tag_power']=='plant': # We store the power-plant's ID info in a form which will be easy to propagate down to child members
+				curitem['plantref'] = (curitem['objtype'], curitem['id'])
 
-			self.curitem = None      # NB we need to clear "curitem" in ALL cases where it was a node/way/item, NOT just if it's a PV item processed.
+			# OK now it's ready to store - we only need to store top-level PV items, child-nodes etc are not needed except for the data stored elsewhere
+			return curitem
+		return None
 
-	def postprocess(self):
+	def postprocess(self, previous=None):
 		"""
-		This MUST be called, once, after the XML has been loaded.
+		This MUST be called, once, after the XML has been loaded (and again after applying a change file).
 		It:
 		- ensures relation-members know about their parent object (incl. the plantref if parent is plant);
 		- calculates the total area of each relation;
 		- calculates the centroid of each relation;
 		- performs spatial containment queries to label solar panels as members of a plant (i.e. plantref) if they're geographically inside them.
+		If 'previous' is given (see containment_snapshot()), containment is only re-checked for generators which may have been affected by the changes since then.
 		"""
-		# Find all objects that are relations and also plants. Then push down the metadata through their children (only for the temporary data), and also calculate the area for the parents.
+		# Clear the results of any previous run, so that re-running gives the same as a fresh parse.
+		for therel in self.reldata.values():
+			therel.pop('plantref', None)
+		# Calculate the area and centroid of every relation within a power=* relation, in one batch (each relation once, children before parents).
+		pvrelations = [curitem for curitem in self.objs if curitem['tag_power'] in ['plant', 'generator'] and curitem['objtype']=='relation']
+		self._resolve_relations([int(curitem['id']) for curitem in pvrelations])
+		# Then push down the plant metadata through the children of plant relations (only for the temporary data).
 		rels_postprocessed = 0
-		self.plantoutlines = [] # {lat, lon, outlinepath, plantref} a list of ways that are either plants themselves, or non-inner members of plant relations; i.e. potential geo containers for panels
+		self.plantoutlines = [] # {lat, lon, outline, plantref} a list of ways that are either plants themselves, or non-inner members of plant relations; i.e. potential geo containers for panels
 		for curitem in self.objs:
 			if curitem['tag_power']=='plant' and curitem['objtype']=='way':
-				self.plantoutlines.append({'lat': curitem['lat'], 'lon': curitem['lon'], 'outlinepath': self.waydata[curitem['id']]['outlinepath'], 'plantref': curitem['plantref']})
+				self.plantoutlines.append({'lat': curitem['lat'], 'lon': curitem['lon'], 'outline': self.wayoutline(int(curitem['id'])), 'plantref': curitem['plantref']})
 			if curitem['tag_power'] in ['plant', 'generator'] and curitem['objtype']=='relation':
+				therel = self.reldata[int(curitem['id'])]
+				curitem['calc_area'] = therel['calc_area']
+				curitem['lat'] = therel['lat']
+				curitem['lon'] = therel['lon']
 				if curitem['tag_power']=='plant':
-					plantitem = curitem
-					plantref = ('relation', curitem['id'])
-				else:
-					plantitem = None
-					plantref = None
-				curitem['calc_area'] = 0
-				self._recurse_relation_info(curitem, plantitem, plantref)
+					self._propagate_plantref(int(curitem['id']), ('relation', curitem['id']))
 				rels_postprocessed += 1
 
 		print("Postprocessed %i power=* relations" % rels_postprocessed)
 		print("Plant outlines for geo containment search: %i" % len(self.plantoutlines))
-		plantoutlines_kdtree = kdtree([[item['lat'], item['lon']] for item in self.plantoutlines])
-		# Now, for every generator object that DOESN'T have a plantref, we find its nearest-neighbour potential-containers and check for containment
-		for curitem in self.objs:
-			if curitem['tag_power']=='generator' and not curitem.get('plantref', None):
-				for distance, arrayposition in zip(*plantoutlines_kdtree.query([curitem['lat'], curitem['lon']], 3, distance_upper_bound=1)):
-					if distance != np.inf:
-						if self.plantoutlines[arrayposition]['outlinepath'].contains_point([curitem['lat'], curitem['lon']]):
-							curitem['plantref'] = self.plantoutlines[arrayposition]['plantref']
-							#print("       spatially inferred generator %s/%s belongs to plant %s" % (curitem['objtype'], curitem['id'], curitem['plantref']))
+		# Now, for every generator object that DOESN'T have a plantref, we check for geographic containment within the plant outlines.
+		# This is done for all the generators in one batch: every outline whose bounding box contains a generator is tested, and if more
+		# than one outline contains it, the plant whose outline centroid is nearest wins.
+		if previous is None:
+			unassigned = [curitem for curitem in self.objs if curitem['tag_power']=='generator' and not curitem.get('plantref', None)]
+		else:
+			unassigned = self._containment_recheck(previous)
+		outlineindex = OutlineIndex([item['outline'] for item in self.plantoutlines])
+		containers = outlineindex.find_containing(
+			[[curitem['lat'], curitem['lon']] for curitem in unassigned],
+			[[item['lat'], item['lon']] for item in self.plantoutlines])
+		for curitem, arrayposition in zip(unassigned, containers):
+			if arrayposition >= 0:
+				curitem['plantref'] = self.plantoutlines[arrayposition]['plantref']
+				#print("       spatially inferred generator %s/%s belongs to plant %s" % (curitem['objtype'], curitem['id'], curitem['plantref']))
 
 		if False: # This should NOT NORMALLY be activated. It inserts "guesstimate" power capacities for small-scale solar PV
 			for curitem in self.objs:
@@ -420,72 +253,368 @@ class SolarXMLHandler(sax.handler.ContentHandler):
 					curitem['calc_capacity'] = guess_kilowattage(curitem)
 
 
-	def _recurse_relation_info(self, curitem, plantitem, plantref):
-		"""Pushes down through relations' members, for two reasons: to compile their areas onto the parent, and to propagate the parent plant reference down to all.
-		You will call it with curitem==plantitem for plants, and plantitem=None for gens; then the recursion keeps plantitem fixed and alters the immediate curitem."""
-		# first we recurse into the child relations - the ways and rels will then add their area to our plantitem
-		#print("")
-		#print("_recurse_relation_info(curitem=%s, plantitem=%s, plantref=%s)"  % (curitem, plantitem, plantref))
-		for childinfo in curitem['relations']:
-			therel = self.reldata[childinfo['ref']]
-			if 'plantref' in therel:
-				raise ValueError("Suspicious recursion: while analysing a plant relation (%i) we found a child rel (%i) which already has plantref set: %s" % (plantitem['id'], childid, str(therel['plantref'])))
+	def containment_snapshot(self):
+		"Records the current generator positions/plantrefs and plant outlines, so that a later postprocess() can tell which containment results might have changed."
+		return {
+			'generators': {(curitem['objtype'], curitem['id']): (curitem['lat'], curitem['lon'], curitem.get('plantref', None))
+				for curitem in self.objs if curitem['tag_power']=='generator'},
+			'plantoutlines': self.plantoutlines,
+		}
+
+	def _containment_recheck(self, previous):
+		"""Decides which generators need their geographic containment re-checking, compared against a containment_snapshot().
+		The others get their previous plantref back. Returns the list of generators to re-check (with any old plantref cleared)."""
+		# A plant "changed" if the list of its outlines (centroid and vertices) differs at all
+		def outlinesbyplant(plantoutlines):
+			result = {}
+			for item in plantoutlines:
+				result.setdefault(item['plantref'], []).append((item['lat'], item['lon'], item['outline'].tobytes()))
+			return result
+		oldoutlines = outlinesbyplant(previous['plantoutlines'])
+		newoutlines = outlinesbyplant(self.plantoutlines)
+		changedplants = set(plantref for plantref in set(oldoutlines) | set(newoutlines) if oldoutlines.get(plantref) != newoutlines.get(plantref))
+		dirtyoutlines = [item['outline'] for item in previous['plantoutlines'] + self.plantoutlines if item['plantref'] in changedplants]
+
+		generators = [curitem for curitem in self.objs if curitem['tag_power']=='generator']
+		recheck = np.zeros(len(generators), dtype=bool)
+		for which, curitem in enumerate(generators):
+			old = previous['generators'].get((curitem['objtype'], curitem['id']))
+			# new generators, ones which have moved, and ones which belonged to a plant that changed
+			recheck[which] = (old is None) or (old[0] != curitem['lat']) or (old[1] != curitem['lon']) or (old[2] in changedplants)
+		# ...plus any that lie within the bounding box of a changed plant outline, whether added, altered or removed
+		if len(dirtyoutlines) and len(generators):
+			pointidx, _ = OutlineIndex(dirtyoutlines).candidates([[curitem['lat'], curitem['lon']] for curitem in generators])
+			recheck[pointidx] = True
+
+		unassigned = []
+		for curitem, dorecheck in zip(generators, recheck):
+			curitem.pop('plantref', None)
+			if dorecheck:
+				unassigned.append(curitem)
 			else:
-				self._recurse_relation_info(therel, plantitem, plantref)
-		# now we grab all area info from one-level-down, and also push the plantref down one level
+				oldplantref = previous['generators'][(curitem['objtype'], curitem['id'])][2]
+				if oldplantref:
+					curitem['plantref'] = oldplantref
+		print("Geo containment re-checked for %i of %i generators (%i plants changed)" % (len(unassigned), len(generators), len(changedplants)))
+		return unassigned
+
+	def _resolve_relations(self, relids):
+		"""Calculates the area (outer minus inner members) and centroid of the given relations, and of all the relations within them, storing the results in reldata.
+		The hierarchy is walked iteratively, children before parents, and each relation is calculated only once however many parents it has.
+		Raises ValueError if relations contain each other in a cycle."""
+		resolved = set()
+		for relid in relids:
+			if relid in resolved:
+				continue
+			# depth-first walk: each stack entry is a relation plus an iterator over its child relations not yet visited
+			path = [relid]
+			stack = [iter([childinfo['ref'] for childinfo in self.reldata[relid]['relations']])]
+			while stack:
+				for childid in stack[-1]:
+					if childid in resolved:
+						continue
+					if childid in path:
+						raise ValueError("Relations contain each other in a cycle: %s" % " -> ".join(map(str, path[path.index(childid):] + [childid])))
+					path.append(childid)
+					stack.append(iter([childinfo['ref'] for childinfo in self.reldata[childid]['relations']]))
+					break
+				else:
+					# all this relation's children are done, so it can be calculated from them
+					self._calc_relation(path[-1])
+					resolved.add(path.pop())
+					stack.pop()
+
+	def _calc_relation(self, relid):
+		"Calculates one relation's area and centroid from its members' (which for child relations must already have been calculated)"
+		therel = self.reldata[relid]
+		therel['calc_area'] = 0
 		latslist = []
 		lonslist = []
-		for childtype, childlist, childdatacache in [
-			('node',     curitem['nodes'],     self.nodedata),
-			('way',      curitem['ways'],      self.waydata),
-			('relation', curitem['relations'], self.reldata),
+		for childtype, childlist in [
+			('node',     therel['nodes']),
+			('way',      therel['ways']),
+			('relation', therel['relations']),
 			]:
 			for childinfo in childlist: # each is a dict with 'ref' and 'role'
-				childobj = childdatacache[childinfo['ref']]
-				latslist.append(childobj['lat'])
-				lonslist.append(childobj['lon'])
+				childlat, childlon, childarea = self._lookup_member(childtype, childinfo['ref'])
+				latslist.append(childlat)
+				lonslist.append(childlon)
 				multiplier = [1, -1][childinfo['role']=='inner']  # how to subtract inner-areas
-				curitem['calc_area'] += multiplier * childobj.get('calc_area', 0)
-				if plantref:
-					childobj['plantref'] = plantref
-				#if childtype=='way':
-				#	print("             from way %s we add area %g" % (childinfo['ref'], multiplier * childobj['calc_area']))
-				if childtype=='way' and childinfo['role']!='inner' and plantref:
-					self.plantoutlines.append({'lat': childobj['lat'], 'lon': childobj['lon'], 'outlinepath': self.waydata[childinfo['ref']]['outlinepath'], 'plantref': plantref})
-		curitem['lat'] = np.mean(latslist)
-		curitem['lon'] = np.mean(lonslist)
+				therel['calc_area'] += multiplier * childarea
+		therel['lat'] = np.mean(latslist)
+		therel['lon'] = np.mean(lonslist)
+
+	def _propagate_plantref(self, plantid, plantref):
+		"""Labels every relation within a plant relation with the plant's plantref, and adds the non-inner member ways of the plant and of all
+		those relations to plantoutlines (child relations' ways first, then the parent's own). Raises ValueError if a relation turns out to be
+		within two different plants."""
+		visited = set([plantid])
+		path = [plantid]
+		stack = [iter([childinfo['ref'] for childinfo in self.reldata[plantid]['relations']])]
+		while stack:
+			for childid in stack[-1]:
+				if childid in visited:
+					continue
+				therel = self.reldata[childid]
+				if therel.get('plantref', plantref) != plantref:
+					raise ValueError("Suspicious recursion: while analysing a plant relation (%s) we found a child rel (%i) which already has plantref set: %s" % (plantref[1], childid, str(therel['plantref'])))
+				therel['plantref'] = plantref
+				visited.add(childid)
+				path.append(childid)
+				stack.append(iter([childinfo['ref'] for childinfo in therel['relations']]))
+				break
+			else:
+				for childinfo in self.reldata[path.pop()]['ways']:
+					if childinfo['role']!='inner':
+						childlat, childlon, childarea = self._lookup_member('way', childinfo['ref'])
+						self.plantoutlines.append({'lat': childlat, 'lon': childlon, 'outline': self.wayoutline(childinfo['ref']), 'plantref': plantref})
+				stack.pop()
+
+	def _lookup_member(self, childtype, ref):
+		"Returns (lat, lon, calc_area) for a relation member. Like the dict lookups it replaces, raises KeyError if the member was not in the data."
+		if childtype=='relation':
+			childobj = self.reldata[ref]
+			return childobj['lat'], childobj['lon'], childobj['calc_area']
+		elif childtype=='way':
+			index = self.waydata.index(ref)
+			return self.waydata.lat[index], self.waydata.lon[index], self.waydata.extra['calc_area'][index]
+		else:
+			index = self.nodedata.index(ref)
+			return self.nodedata.lat[index], self.nodedata.lon[index], 0
+
+	def _waynodeindices(self, osmid):
+		"The node-store indices of a way's nodes"
+		index = self.waydata.index(osmid)
+		return self.waynoderanges.get(self.waydata.extra['nodestart'][index], self.waydata.extra['nodecount'][index])
+
+	def wayoutline(self, osmid):
+		"Builds the (N, 2) array of lat/lon vertices of a way, e.g. for use as a plant outline"
+		nodeindices = self._waynodeindices(osmid)
+		return np.column_stack((self.nodedata.lat[nodeindices], self.nodedata.lon[nodeindices]))
+
+
+	############################################
+	# Saving the compiled state, and applying OSM change files to it:
+
+	stateattribs = ['objs', 'nodedata', 'waydata', 'waynoderanges', 'reldata', 'plantoutlines']
+
+	def save_state(self, fpath):
+		"Saves everything needed to apply change files later. Call this after postprocess()."
+		with open(fpath, 'wb') as outfp:
+			pickle.dump({attr: getattr(self, attr) for attr in self.stateattribs}, outfp, protocol=pickle.HIGHEST_PROTOCOL)
+
+	def load_state(self, fpath):
+		with open(fpath, 'rb') as infp:
+			state = pickle.load(infp)
+		for attr in self.stateattribs:
+			setattr(self, attr, state[attr])
+
+	def apply_changes(self, changes):
+		"""Applies the contents of an OSM change file, as a list of (action, item) from OsmChangeHandler, to the stored data.
+		The stored data are a solar-only subset, so elements are only taken in if they are already stored, are PV objects, or are members of those.
+		Ways whose nodes have moved get their geometry recalculated. Afterwards, call postprocess(previous) to bring the relation and containment results up to date."""
+		objtypes = ['node', 'way', 'relation']
+		objsbykey = {(obj['objtype'], int(obj['id'])): obj for obj in self.objs}
+		stores = {'node': self.nodedata, 'way': self.waydata, 'relation': self.reldata}
+		latest = {}
+		for action, item in changes:
+			latest[(item['objtype'], int(item['id']))] = (action, item)  # if an element changes more than once, only its final state matters
+
+		wanted = set(key for key, (action, item) in latest.items() if key[1] in stores[key[0]] or (action!='delete' and is_pv_object(item['tags'])))
+		# pull in any members of those which are also in the change file (e.g. the nodes of a newly-tagged way); relations can nest, so repeat until nothing new
+		queue = list(wanted)
+		while queue:
+			action, item = latest[queue.pop()]
+			if action=='delete':
+				continue
+			if item['objtype']=='way':
+				members = [('node', ref) for ref in item['nodes']]
+			elif item['objtype']=='relation':
+				members = [(childtype, childinfo['ref']) for childtype in objtypes for childinfo in item[childtype + 's']]
+			else:
+				members = []
+			for key in members:
+				if key in latest and key not in wanted:
+					wanted.add(key)
+					queue.append(key)
+
+		numupdated = 0
+		numdeleted = 0
+		movednodes = set()   # (as node-store indices)
+		for objtype in objtypes:   # nodes first, so that ways are built from the new coordinates
+			for key in sorted(key for key in wanted if key[0]==objtype):
+				action, item = latest[key]
+				osmid = key[1]
+				if action=='delete':
+					if objtype=='node':
+						movednodes.add(self.nodedata.index(osmid))
+						self.nodedata.remove(osmid)
+					elif objtype=='way':
+						self.waydata.remove(osmid)
+					else:
+						del self.reldata[osmid]
+					objsbykey.pop(key, None)
+					numdeleted += 1
+					continue
+				try:
+					obj = self._finish_item(item, replace=True)
+				except KeyError as err:
+					print("WARNING: skipping %s %i from change file, since not all its nodes are available (a full rebuild will pick it up): %s" % (objtype, osmid, err))
+					continue
+				if objtype=='node':
+					movednodes.add(self.nodedata.index(osmid))
+				if obj is None:
+					objsbykey.pop(key, None)
+				else:
+					objsbykey[key] = obj
+				numupdated += 1
+
+			if objtype=='node':
+				# Ways which weren't in the change file themselves, but whose nodes have moved (or gone), need their geometry recalculating
+				numrecalculated = 0
+				wayindices = np.flatnonzero(self.waydata.live[:self.waydata.count])
+				wayindices = wayindices[self.waynoderanges.contains_any(self.waydata.extra['nodestart'][wayindices], self.waydata.extra['nodecount'][wayindices], movednodes)]
+				for osmid in self.waydata.ids[wayindices].tolist():
+					if ('way', osmid) in wanted:
+						continue
+					refs = self.nodedata.ids[self._waynodeindices(osmid)].tolist()
+					oldobj = objsbykey.get(('way', osmid))
+					if oldobj is None:
+						item = {'id': str(osmid), 'timestamp': '', 'user': '', 'tags': {}, 'objtype': 'way', 'nodes': refs}
+					else:
+						item = {k: oldobj[k] for k in ['id', 'timestamp', 'user', 'objtype', 'nodes']}
+						item['tags'] = dict(oldobj['tags'])
+					try:
+						obj = self._finish_item(item, replace=True)
+					except KeyError as err:
+						print("WARNING: could not recalculate geometry of way %i, keeping the old geometry: %s" % (osmid, err))
+						continue
+					if obj is not None:
+						objsbykey[('way', osmid)] = obj
+					numrecalculated += 1
+
+		# Relations can only be postprocessed if all their members are present; drop any which aren't (repeating, since a dropped relation may itself be a member)
+		dropped = True
+		while dropped:
+			dropped = False
+			for osmid, therel in list(self.reldata.items()):
+				missing = [(childtype, childinfo['ref']) for childtype, store in [('node', self.nodedata), ('way', self.waydata), ('relation', self.reldata)]
+					for childinfo in therel[childtype + 's'] if childinfo['ref'] not in store]
+				if missing:
+					print("WARNING: dropping relation %i, since some of its members are not available (a full rebuild will pick it up): %s" % (osmid, missing[:10]))
+					del self.reldata[osmid]
+					objsbykey.pop(('relation', osmid), None)
+					dropped = True
+
+		# Keep the same order as a full parse of the (sorted) extract would give
+		self.objs = sorted(objsbykey.values(), key=lambda obj: (objtypes.index(obj['objtype']), int(obj['id'])))
+		print("Applied change file: %i elements created/modified, %i deleted, %i other ways recalculated (%i entries in the file)" % (numupdated, numdeleted, numrecalculated, len(changes)))
+
+class OsmChangeHandler(SolarXMLHandler):
+	"""Parses an OSM change file (.osc). After this has finished, the 'changes' member is a list of (action, item) in file order,
+	where action is 'create', 'modify' or 'delete' and item is as built by SolarXMLHandler. See SolarXMLHandler.apply_changes()."""
+	def __init__ (self):
+		SolarXMLHandler.__init__(self)
+		self.action = None
+		self.changes = []
+
+	def startElement (self, name, attrs):
+		if name in ['create', 'modify', 'delete']:
+			self.action = name
+		elif self.action=='delete':
+			# deleted elements may come without their coordinates or tags - all we need is the type and id
+			if name in ['node', 'way', 'relation']:
+				self.changes.append(('delete', {'id': attrs['id'], 'objtype': name, 'tags': {}}))
+		else:
+			SolarXMLHandler.startElement(self, name, attrs)
+
+	def endElement(self, name):
+		if name in ['create', 'modify', 'delete']:
+			self.action = None
+		elif name in ['node', 'way', 'relation'] and self.action!='delete':
+			self.changes.append((self.action, self.curitem))
+			self.curitem = None
+
+
+##############################################################################
+# Parallel parsing of PBF input. Each shard of the file is decoded in a worker process, which also does all the processing that
+# doesn't depend on other shards: nodes, and relations (whose members are only looked up in postprocess()). Ways need their
+# nodes' coordinates, which may be in an earlier shard, so they are finished off as the shards are merged back in file order.
+
+def parse_shard(shard):
+	"""Worker: parses one shard from osm_pbf.iter_pbf_shards(). Returns a list of segments in file order, each one either
+	('ways', items) for a run of ways, still to be processed; or ('done', nodeids, nodelats, nodelons, reldata, objs, printed)
+	for a run of nodes and relations, processed here, where 'printed' is the console output to be replayed when it's merged."""
+	segments = []
+	for isway, run in itertools.groupby(osm_pbf.iter_shard_items(shard), key=lambda pair: pair[0]=='way'):
+		items = [item for objtype, item in run]
+		if isway:
+			segments.append(('ways', items))
+		else:
+			parthandler = SolarXMLHandler()
+			printed = io.StringIO()
+			with contextlib.redirect_stdout(printed):
+				for item in items:
+					parthandler.add_item(item)
+			count = parthandler.nodedata.count
+			segments.append(('done', parthandler.nodedata.ids[:count], parthandler.nodedata.lat[:count], parthandler.nodedata.lon[:count],
+				parthandler.reldata, parthandler.objs, printed.getvalue()))
+	return segments
 
 
 ##############
 # let's go!
 
-if do_osmium:
-	infp = subprocess.Popen(["osmium", "tags-filter", osmsourcefpath, "generator:method=photovoltaic", "plant:method=photovoltaic", "plant:source=solar", "-o", "-", "-f", "xml"],
-			stdout=subprocess.PIPE).stdout
-else:
-	infp = open(osmsourcefpath, 'rb')
-
-parser = sax.make_parser()
 handler = SolarXMLHandler()
-parser.setContentHandler(handler)
-parser.parse(infp)
-infp.close()
-handler.postprocess()
+if len(sys.argv) > 1 and sys.argv[1]=='--update':
+	# apply change files to the state saved by the previous run, rather than parsing the whole extract
+	if len(sys.argv) < 3:
+		raise ValueError("Usage: %s --update changes.osc[.gz] [more.osc[.gz] ...]" % sys.argv[0])
+	handler.load_state(statefpath)
+	previous = handler.containment_snapshot()
+	for oscfpath in sys.argv[2:]:
+		changehandler = OsmChangeHandler()
+		infp = gzip.open(oscfpath, 'rb') if oscfpath.endswith('.gz') else open(oscfpath, 'rb')
+		parser = sax.make_parser()
+		parser.setContentHandler(changehandler)
+		parser.parse(infp)
+		infp.close()
+		handler.apply_changes(changehandler.changes)
+	sourcedescription = "%s, updated with %s" % (os.path.basename(osmsourcefpath), ", ".join(map(os.path.basename, sys.argv[2:])))
+	print("Coordinate stores: %s; %s; %s" % (handler.nodedata.describe(), handler.waydata.describe(), handler.waynoderanges.describe()))
+	handler.postprocess(previous)
+else:
+	if osmsourcefpath.endswith('.pbf') and not do_osmium:
+		# decode the PBF blocks directly into the handler, no XML needed
+		with open(osmsourcefpath, 'rb') as infp:
+			# The workers must be forked, not spawned, since this script does all its work at import time.
+			if numworkers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+				# imap() returns the shards' results in file order, so the merge gives exactly what a single process would
+				with multiprocessing.get_context('fork').Pool(numworkers) as pool:
+					for segments in pool.imap(parse_shard, osm_pbf.iter_pbf_shards(infp)):
+						for segment in segments:
+							handler.add_shard_segment(segment)
+			else:
+				for objtype, item in osm_pbf.iter_pbf_items(infp):
+					handler.add_item(item)
+	else:
+		if do_osmium:
+			infp = subprocess.Popen(["osmium", "tags-filter", osmsourcefpath, "generator:method=photovoltaic", "plant:method=photovoltaic", "plant:source=solar", "-o", "-", "-f", "xml"],
+					stdout=subprocess.PIPE).stdout
+		else:
+			infp = open(osmsourcefpath, 'rb')
+
+		parser = sax.make_parser()
+		parser.setContentHandler(handler)
+		parser.parse(infp)
+		infp.close()
+	sourcedescription = os.path.basename(osmsourcefpath)
+	print("Coordinate stores: %s; %s; %s" % (handler.nodedata.describe(), handler.waydata.describe(), handler.waynoderanges.describe()))
+	handler.postprocess()
+handler.save_state(statefpath)
 
 # find all attribs in use
-allattribs = set()
-for obj in handler.objs:
-	allattribs = allattribs.union(set(obj))
-allattribs = allattribs.difference(set(['nodes', 'ways', 'relations', 'tags']))
-
-# some overcomplex coding to sort attributes in the way I want
-attribstarters = ['objtype', 'id', 'user', 'timestamp', 'lat', 'lon']
-def attribsorter(a):
-	if a in attribstarters:
-		return "a_%i" % attribstarters.index(a)
-	else:
-		return "b_%s" % a
-allattribs = sorted(list(allattribs), key=attribsorter)
+allattribs = osm_output.find_attribs(handler.objs)
 
 if False:
 	print()
@@ -494,73 +623,28 @@ if False:
 		print(anattrib)
 	print()
 
-# output happy stats
-osmtotalobjs = len(handler.objs)
+# output happy stats - gathered in one pass over the objects, and also saved as JSON
+stats = SolarStats()
+for obj in handler.objs:
+	stats.add(obj)
 print("")
 print("####################################################################")
-print(os.path.basename(osmsourcefpath))
-print("parsed %i OSM objects (%i nodes, %i ways, %i relations)" % (osmtotalobjs,
-	len([_ for _ in handler.objs if _['objtype']=='node']),
-	len([_ for _ in handler.objs if _['objtype']=='way']),
-	len([_ for _ in handler.objs if _['objtype']=='relation'])
-	))
-print("")
-
-
-# collect the unique REPD identifiers
-repds_used = []
-for item in handler.objs:
-	if item.get('tag_repd:id', False):
-		repds_used.extend(item['tag_repd:id'].split(';'))
-
-readable = "standalone"
-subset = [_ for _ in handler.objs if _['tag_power']=='generator' and not _.get('plantref', None)]
-print("Solar PV panel items (power=generator) (%s):" % readable)
-print("   %i in total"                                                                    % len([_ for _ in subset]))
-print("   %g sq km total surface area"  % (1e-6 * np.sum([_['calc_area']                           for _ in subset])))
-print("   %g MW total generating capacity (NB metadata will be v incomplete for this)" % (1e-3 * np.sum([_.get('calc_capacity',0)             for _ in subset])))
-print("   %i nodes with no sqm tagged (could presume 'domestic', but needs more tagging)" % len([_ for _ in subset if    _['calc_area']==0]))
-print("   %i areas <= 30 sqm (could presume 'domestic')"                                  % len([_ for _ in subset if  0<_['calc_area']<=30]))
-print("   %i areas 30--2000 sqm (could presume 'commercial' or part of array)"            % len([_ for _ in subset if 30<_['calc_area']<=2000]))
-print("   %i areas > 2000 sqm (inspect to see if should really be tagged 'solar farm')"   % len([_ for _ in subset if    _['calc_area']>2000]))
-
-readable = "within a farm"
-subset = [_ for _ in handler.objs if _['tag_power']=='generator' and     _.get('plantref', None)]
-print("Solar PV panel items (power=generator) (%s):" % readable)
-print("   %i in total"                                                                    % len([_ for _ in subset]))
-print("   %g sq km total surface area"  % (1e-6 * np.sum([_['calc_area']                           for _ in subset])))
-print("   %i nodes with no sqm tagged"                                                    % len([_ for _ in subset if    _['calc_area']==0]))
-print("   %i areas <= 30 sqm"                                                             % len([_ for _ in subset if  0<_['calc_area']<=30]))
-print("   %i areas 30--2000 sqm"                                                          % len([_ for _ in subset if 30<_['calc_area']<=2000]))
-print("   %i areas > 2000 sqm (inspect to see if should really be tagged 'solar farm')"   % len([_ for _ in subset if    _['calc_area']>2000]))
-
-print("Solar PV farm items (power=plant):")
-print("   %i in total"                                                                    % len([_ for _ in handler.objs if _['tag_power']=='plant']))
-print("   %i have REPD identifier tagged"                                                 % len([_ for _ in handler.objs if _['tag_power']=='plant' and _.get('tag_repd:id', False)]))
-print("        (%i REPD identifiers encountered)"                                         % len(repds_used))
-print("   %g sq km total surface area"  % (1e-6 * np.sum([_['calc_area']                           for _ in handler.objs if _['tag_power']=='plant'])))
-print("   %g MW total generating capacity"  % (1e-3 * np.sum([_.get('calc_capacity',0)             for _ in handler.objs if _['tag_power']=='plant'])))
-print("   %i nodes with no sqm tagged (needs more tagging)"                               % len([_ for _ in handler.objs if _['tag_power']=='plant' and    _['calc_area']==0]))
-print("   %i areas <= 30 sqm - not including nodes"                                       % len([_ for _ in handler.objs if _['tag_power']=='plant' and  0<_['calc_area']<=30]))
-print("   %i areas 30--2000 sqm"                                                          % len([_ for _ in handler.objs if _['tag_power']=='plant' and 30<_['calc_area']<=2000]))
-print("   %i areas > 2000 sqm"                                                            % len([_ for _ in handler.objs if _['tag_power']=='plant' and    _['calc_area']>2000]))
-
-
-def csvformatspecialfields(k, v):
-	"special formatting sometimes needed"
-	if k=='plantref':
-		if not v: return ''
-		return "%s/%s" % v
-	return v
-
-try:
-	with open("osm.csv", 'w', buffering=1) as outfp:
-		outfp.write(",".join(allattribs) + "\n")
-		for obj in handler.objs:
-			outfp.write(",".join(map(str, [csvformatspecialfields(anattrib, obj.get(anattrib, '')) for anattrib in allattribs])) + "\n")
-except:
-	os.rename("osm.csv", "osm_ERROR.csv")
-	raise
+print(sourcedescription)
+print("\n".join(stats.report()))
+with open(statsfpath, 'w') as outfp:
+	json.dump(stats.summary(), outfp, indent=1)
+
+
+for outfpath in outputfpaths:
+	try:
+		if outfpath.endswith('.csv'):
+			osm_output.write_csv(handler.objs, allattribs, outfpath)
+		else:
+			osm_output.write_columnar(handler.objs, allattribs, outfpath)
+	except:
+		if os.path.exists(outfpath):
+			os.rename(outfpath, "%s_ERROR%s" % os.path.splitext(outfpath))
+		raise
 
 print("==========================================================")
 print("Finished creating initial OSM PV solar extract spreadsheet")
@@ -1,53 +1,139 @@
-import glob
+import glob, os, sys, shutil, multiprocessing
 import openpyxl
 from openpyxl import load_workbook
 
+import xlsx_reader
+
 # tested using openpyxl 3.0.3 on python 3.7.5, ubuntu 18.04
 
-# TODO this script should be merged in with data/processed/pre-process-fit.py
+# NB data/processed/pre-process-fit.py can also read the workbooks directly (using the functions here), which is how
+# the processed fit.csv is made; this script's own output (raw fit.csv) is the full unfiltered report, e.g. for inspection
 
-headercols = None
-rowswritten = 0
+numworkers = os.cpu_count() or 1   # the workbooks are converted by this many processes at once (1 = all in this process). The output is identical either way.
+fastreader = True   # read the sheets with xlsx_reader (the same values as openpyxl gives, but much faster); False = openpyxl's own reader
+outfpath = "fit.csv"
 
-def formatcell(item):
+def formatvalue(value):
 	"Appropriate conversions for CSV output"
-	if item.value is None:
+	if value is None:
 		return ""
-	return str(item.internal_value)
-
-with open("fit.csv", "wt") as outfp:
-	for infname in sorted(glob.glob("../as_received/installation_report_*_part_*.xlsx")):
-		print(infname)
-		wb = load_workbook(filename=infname, read_only=True)
+	return str(value)
 
-		gotheader = False
-		for whichrow, row in enumerate(wb.active.iter_rows()):
-			at_repeated_header = False
+def openpyxl_rows(infname):
+	"Yields each row of the workbook's active sheet as a list of cell values (None for empty), or the error for a row that can't be read"
+	wb = load_workbook(filename=infname, read_only=True)
+	try:
+		for row in wb.active.iter_rows():
 			try:
-				rowstrs = [formatcell(item) for item in row]
+				yield [None if item.value is None else item.internal_value for item in row]
 			except AttributeError as err:
-				print(err)
-				print("    skipping row %i (merged cell?)" % whichrow)
-				continue
-			for item in rowstrs:
-				assert("," not in item)
-			# Here we're detecting hitting the header in this XLS:
-			if rowstrs[0] and (rowstrs[0].startswith("Extension")):
-				gotheader = True
-				#print(headercols)
-				if headercols:
-					assert(headercols==rowstrs)
-					at_repeated_header = True
-				else:
-					headercols = rowstrs
-			if gotheader and not at_repeated_header:
-				#if whichrow < 20:
-				#	print(rowstrs[0])
-				outfp.write(",".join(rowstrs) + "\n")
-				rowswritten += 1
-		del wb
-
-print("Written %i rows" % rowswritten)
-assert(rowswritten > 10000)
-assert(gotheader)
+				yield err
+	finally:
+		wb.close()
+
+def iter_output_rows(rows, printed):
+	"""Yields the rows of one workbook that come after its header, as lists of strings: the header row itself first (once), then the data rows.
+	Rows before the header, and any repeats of the header, are skipped."""
+	headercols = None
+	gotheader = False
+	for whichrow, row in enumerate(rows):
+		at_repeated_header = False
+		if isinstance(row, AttributeError):
+			printed.append(str(row))
+			printed.append("    skipping row %i (merged cell?)" % whichrow)
+			continue
+		rowstrs = [formatvalue(value) for value in row]
+		for item in rowstrs:
+			assert("," not in item)
+		# Here we're detecting hitting the header in this XLS:
+		if rowstrs[0] and (rowstrs[0].startswith("Extension")):
+			gotheader = True
+			#print(headercols)
+			if headercols:
+				assert(headercols==rowstrs)
+				at_repeated_header = True
+			else:
+				headercols = rowstrs
+		if gotheader and not at_repeated_header:
+			#if whichrow < 20:
+			#	print(rowstrs[0])
+			yield rowstrs
+
+def convert_rows(rows, outfp, printed):
+	"""Writes the rows of one workbook that come after its header as CSV lines (including the header row itself, once).
+	Returns (header, number of lines written); the header is None if the workbook didn't have one."""
+	headercols = None
+	rowswritten = 0
+	for rowstrs in iter_output_rows(rows, printed):
+		if headercols is None:
+			headercols = rowstrs
+		outfp.write(",".join(rowstrs) + "\n")
+		rowswritten += 1
+	return headercols, rowswritten
+
+def convert_workbook(job, consume=convert_rows):
+	"""Worker: converts one workbook into its own part file, so the parts can be joined in order afterwards.
+	consume(rows, outfp, printed) writes the part, and returns (header, count). Returns (lines to print, header, count)."""
+	infname, partfpath = job
+	printed = [infname]
+	with open(partfpath, "wt") as outfp:
+		if fastreader:
+			try:
+				return (printed,) + consume(xlsx_reader.iter_sheet_values(infname), outfp, printed)
+			except xlsx_reader.UnsupportedSheet as err:
+				printed.append("    fast reader not usable (%s), reading with openpyxl" % err)
+				outfp.seek(0)
+				outfp.truncate()
+		return (printed,) + consume(openpyxl_rows(infname), outfp, printed)
+
+def iter_workbook_parts(infnames, outfpath, worker=convert_workbook, printfp=sys.stdout):
+	"""Runs worker((infname, partfpath)) for each of the workbooks, in parallel if numworkers > 1, and yields (partfpath, header, count) for each in order.
+	Every workbook's header must be the same as the first one. Each part file is removed once the caller has moved on to the next one."""
+	jobs = [(infname, "%s.part%i" % (outfpath, whichfile)) for whichfile, infname in enumerate(infnames)]
+
+	if numworkers > 1 and len(jobs) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+		pool = multiprocessing.get_context('fork').Pool(min(numworkers, len(jobs)))
+		results = pool.imap(worker, jobs)   # (in the same order as the jobs)
+	else:
+		pool = None
+		results = map(worker, jobs)
+
+	headercols = None
+	try:
+		for (infname, partfpath), (printed, partheader, partcount) in zip(jobs, results):
+			for line in printed:
+				print(line, file=printfp)
+			if partheader is not None and headercols:
+				assert(headercols==partheader)
+			elif partheader is not None:
+				headercols = partheader
+			yield partfpath, partheader, partcount
+			os.remove(partfpath)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		for infname, partfpath in jobs:
+			if os.path.exists(partfpath):
+				os.remove(partfpath)
+
+if __name__ == '__main__':
+	infnames = sorted(glob.glob("../as_received/installation_report_*_part_*.xlsx"))
+
+	# Join the parts in order: the header is only written once
+	rowswritten = 0
+	headerwritten = False
+	with open(outfpath, "wt") as outfp:
+		for partfpath, partheader, partrows in iter_workbook_parts(infnames, outfpath):
+			gotheader = partheader is not None
+			with open(partfpath, "rt") as partfp:
+				if gotheader and headerwritten:
+					partfp.readline()   # (the header again)
+					partrows -= 1
+				shutil.copyfileobj(partfp, outfp)
+			headerwritten = headerwritten or gotheader
+			rowswritten += partrows
 
+	print("Written %i rows" % rowswritten)
+	assert(rowswritten > 10000)
+	assert(gotheader)
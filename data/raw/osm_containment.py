@@ -0,0 +1,129 @@
+# Batched point-in-polygon search, used by compile_osm_solar.py to find which plant
+# outline (if any) each solar generator lies inside.
+#
+# All the points are handled in one go: a uniform grid over the outlines' bounding
+# boxes gives every (point, outline) pair whose bounding box contains the point, and
+# then a vectorised crossing-number test is run over all of those candidate pairs.
+# Unlike a k-nearest-centroid search, this never misses a containing outline just
+# because the outline is large or oddly shaped.
+
+import numpy as np
+
+def _expand_ranges(starts, counts):
+	"For ranges given as (start, count), return the concatenation of all the aranges, plus the range number of each element."
+	counts = np.asarray(counts, dtype=np.int64)
+	total = int(counts.sum())
+	which = np.repeat(np.arange(len(counts)), counts)
+	offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+	return np.asarray(starts, dtype=np.int64)[which] + offsets, which
+
+class OutlineIndex:
+	"""A bounding-box grid index over a list of polygon outlines, each given as an (N, 2) array of vertices.
+	The polygon is taken to be closed (an edge joins the last vertex back to the first)."""
+
+	def __init__(self, outlines, cellsize=None):
+		self.numoutlines = len(outlines)
+		lengths = np.array([len(outline) for outline in outlines], dtype=np.int64)
+		self.starts = np.cumsum(lengths) - lengths
+		self.lengths = lengths
+		if self.numoutlines:
+			self.vertices = np.concatenate([np.asarray(outline, dtype=np.float64).reshape(-1, 2) for outline in outlines])
+		else:
+			self.vertices = np.zeros((0, 2))
+		# Outlines with no vertices can never contain anything: give them an empty (inverted) bbox
+		nonempty = lengths > 0
+		self.bbmin = np.full((self.numoutlines, 2), np.inf)
+		self.bbmax = np.full((self.numoutlines, 2), -np.inf)
+		if np.any(nonempty):
+			self.bbmin[nonempty] = np.minimum.reduceat(self.vertices, self.starts[nonempty])
+			self.bbmax[nonempty] = np.maximum.reduceat(self.vertices, self.starts[nonempty])
+		self._build_grid(nonempty, cellsize)
+
+	def _build_grid(self, nonempty, cellsize):
+		if not np.any(nonempty):
+			self.origin = np.zeros(2)
+			self.cellsize = 1.
+			self.ncols = 1
+			self.cellkeys = np.zeros(0, dtype=np.int64)
+			self.celloutlines = np.zeros(0, dtype=np.int64)
+			return
+		if cellsize is None:
+			# Cells about the size of a typical-but-large outline, so most outlines touch only a few cells
+			extents = (self.bbmax[nonempty] - self.bbmin[nonempty]).max(axis=1)
+			cellsize = max(np.percentile(extents, 90), 1e-6)
+		self.cellsize = cellsize
+		self.origin = self.bbmin[nonempty].min(axis=0)
+		firstcell = np.floor((self.bbmin[nonempty] - self.origin) / cellsize).astype(np.int64)
+		lastcell  = np.floor((self.bbmax[nonempty] - self.origin) / cellsize).astype(np.int64)
+		self.ncols = int(lastcell[:, 1].max()) + 1
+		outlineids = np.flatnonzero(nonempty)
+		# enumerate every (cell, outline) combination covered by each bounding box
+		nrows = lastcell[:, 0] - firstcell[:, 0] + 1
+		ncols = lastcell[:, 1] - firstcell[:, 1] + 1
+		cellpos, which = _expand_ranges(np.zeros(len(outlineids)), nrows * ncols)
+		rows = firstcell[which, 0] + cellpos // ncols[which]
+		cols = firstcell[which, 1] + cellpos % ncols[which]
+		keys = rows * self.ncols + cols
+		order = np.argsort(keys, kind='stable')
+		self.cellkeys = keys[order]
+		self.celloutlines = outlineids[which][order]
+
+	def candidates(self, points):
+		"Returns (pointindices, outlineindices) for every pair where the outline's bounding box contains the point."
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+		cell = np.floor((points - self.origin) / self.cellsize).astype(np.int64)
+		valid = (cell[:, 0] >= 0) & (cell[:, 1] >= 0) & (cell[:, 1] < self.ncols)
+		keys = np.where(valid, cell[:, 0] * self.ncols + cell[:, 1], -1)
+		lo = np.searchsorted(self.cellkeys, keys, side='left')
+		hi = np.searchsorted(self.cellkeys, keys, side='right')
+		hi[~valid] = lo[~valid]
+		pairpos, pointidx = _expand_ranges(lo, hi - lo)
+		outlineidx = self.celloutlines[pairpos]
+		inbox = np.all((points[pointidx] >= self.bbmin[outlineidx]) & (points[pointidx] <= self.bbmax[outlineidx]), axis=1)
+		return pointidx[inbox], outlineidx[inbox]
+
+	def contains(self, points, pointidx, outlineidx, maxedges=2000000):
+		"""Vectorised crossing-number test: for each candidate (point, outline) pair, is the point inside the outline?
+		Work is done in batches of at most roughly maxedges edge-tests, to bound memory use."""
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+		result = np.zeros(len(pointidx), dtype=bool)
+		cumedges = np.cumsum(self.lengths[outlineidx])
+		batchstart = 0
+		while batchstart < len(pointidx):
+			edgesdone = cumedges[batchstart - 1] if batchstart else 0
+			batchend = max(int(np.searchsorted(cumedges, edgesdone + maxedges, side='right')), batchstart + 1)
+			result[batchstart:batchend] = self._contains_batch(points, pointidx[batchstart:batchend], outlineidx[batchstart:batchend])
+			batchstart = batchend
+		return result
+
+	def _contains_batch(self, points, pointidx, outlineidx):
+		# one entry per (pair, edge): edge k of an outline joins vertex k to vertex k+1 (wrapping round to vertex 0)
+		vertpos, pairno = _expand_ranges(self.starts[outlineidx], self.lengths[outlineidx])
+		edgeno = vertpos - self.starts[outlineidx][pairno]
+		nextpos = self.starts[outlineidx][pairno] + (edgeno + 1) % self.lengths[outlineidx][pairno]
+		x1, y1 = self.vertices[vertpos, 0], self.vertices[vertpos, 1]
+		x2, y2 = self.vertices[nextpos, 0], self.vertices[nextpos, 1]
+		px, py = points[pointidx[pairno], 0], points[pointidx[pairno], 1]
+		straddles = (y1 > py) != (y2 > py)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			crossx = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+		crossings = straddles & (px < crossx)
+		return (np.bincount(pairno, weights=crossings, minlength=len(pointidx)) % 2) == 1
+
+	def find_containing(self, points, centroids):
+		"""For each point, return the index of the outline that contains it, or -1 if none does.
+		If several outlines contain a point, the one whose centroid is nearest to the point is chosen."""
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+		result = np.full(len(points), -1, dtype=np.int64)
+		if not self.numoutlines or not len(points):
+			return result
+		pointidx, outlineidx = self.candidates(points)
+		inside = self.contains(points, pointidx, outlineidx)
+		pointidx, outlineidx = pointidx[inside], outlineidx[inside]
+		distance = np.sum((np.asarray(centroids, dtype=np.float64)[outlineidx] - points[pointidx]) ** 2, axis=1)
+		order = np.lexsort((outlineidx, distance, pointidx))
+		pointidx, outlineidx = pointidx[order], outlineidx[order]
+		first = np.ones(len(pointidx), dtype=bool)
+		first[1:] = pointidx[1:] != pointidx[:-1]
+		result[pointidx[first]] = outlineidx[first]
+		return result
@@ -0,0 +1,93 @@
+# Writers for the PV objects compiled by compile_osm_solar.py: the original CSV format, and a typed
+# columnar format (Parquet, or Arrow IPC) with a fixed schema, so that the processed stage can read the
+# values directly instead of re-parsing text and re-inferring the types.
+
+# The fixed schema for the columnar output: (attribute, type) in the same order as the CSV columns.
+# These are all the attributes that SolarXMLHandler can produce for a PV object.
+osm_schema = [
+	('objtype',                 'str'),
+	('id',                      'int'),
+	('user',                    'str'),
+	('timestamp',               'str'),
+	('lat',                     'float'),
+	('lon',                     'float'),
+	('calc_area',               'float'),
+	('calc_capacity',           'float'),
+	('generator:solar:modules', 'float'),   # (a count, but float like the database column, since it can be missing)
+	('location',                'str'),
+	('orientation',             'float'),
+	('plantref',                'str'),     # written as "objtype/id", like the CSV
+	('source_capacity',         'str'),
+	('source_obj',              'str'),
+	('tag_power',               'str'),
+	('tag_repd:id',             'str'),
+	('tag_start_date',          'str'),
+]
+
+# attributes which are working data, not output
+nonoutput_attribs = frozenset(['nodes', 'ways', 'relations', 'tags'])
+
+# some overcomplex coding to sort attributes in the way I want
+attribstarters = ['objtype', 'id', 'user', 'timestamp', 'lat', 'lon']
+def attribsorter(a):
+	if a in attribstarters:
+		return "a_%i" % attribstarters.index(a)
+	else:
+		return "b_%s" % a
+
+def find_attribs(objs):
+	"Find all the output attributes in use, in one pass over the objects. Returns them in output column order."
+	allattribs = set()
+	for obj in objs:
+		allattribs.update(obj)
+	return sorted(allattribs - nonoutput_attribs, key=attribsorter)
+
+def csvformatspecialfields(k, v):
+	"special formatting sometimes needed"
+	if k=='plantref':
+		if not v: return ''
+		return "%s/%s" % v
+	return v
+
+def write_csv(objs, allattribs, fpath):
+	"Write the objects as CSV, one column per attribute. (Block-buffered, not line-buffered: the file is only for use once it's complete.)"
+	with open(fpath, 'w') as outfp:
+		outfp.write(",".join(allattribs) + "\n")
+		for obj in objs:
+			outfp.write(",".join(map(str, [csvformatspecialfields(anattrib, obj.get(anattrib, '')) for anattrib in allattribs])) + "\n")
+
+def _columnvalue(obj, attrib, kind):
+	"An object's value for one column of the columnar output, with None for missing"
+	v = obj.get(attrib, None)
+	if attrib=='plantref':
+		return "%s/%s" % v if v else None
+	if v is None or (kind != 'str' and v == ''):
+		return None
+	if kind=='int':
+		return int(v)
+	elif kind=='float':
+		return float(v)
+	return str(v)
+
+def write_columnar(objs, allattribs, fpath, batchsize=65536):
+	"""Write the objects with the fixed osm_schema, in batches of rows: as Arrow IPC if fpath ends in .arrow or .feather, otherwise as Parquet.
+	Every schema column is always written (all null if unused). Raises ValueError if an object has an attribute that is not in the schema."""
+	import pyarrow as pa   # (only needed for this output, so only imported here)
+	unknown = set(allattribs) - set(attrib for attrib, kind in osm_schema)
+	if unknown:
+		raise ValueError("Attribute(s) not in the columnar output schema (please add to osm_schema): %s" % ", ".join(sorted(unknown)))
+	arrowtypes = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+	schema = pa.schema([(attrib, arrowtypes[kind]) for attrib, kind in osm_schema])
+	if fpath.endswith('.arrow') or fpath.endswith('.feather'):
+		writer = pa.ipc.new_file(fpath, schema)
+	else:
+		import pyarrow.parquet as pq
+		writer = pq.ParquetWriter(fpath, schema)
+	try:
+		for start in range(0, len(objs), batchsize):
+			batch = objs[start:start + batchsize]
+			writer.write_batch(pa.record_batch(
+				[pa.array([_columnvalue(obj, attrib, kind) for obj in batch], type=arrowtypes[kind]) for attrib, kind in osm_schema],
+				schema=schema))
+	finally:
+		writer.close()
@@ -0,0 +1,329 @@
+# Minimal reader for OSM PBF files, so that compile_osm_solar.py can load an
+# osmium-filtered .osm.pbf extract directly, with no intermediate XML file.
+# It decodes the protobuf blocks itself (pure python, no extra dependencies) and
+# yields node/way/relation records in exactly the form that SolarXMLHandler
+# builds from the XML (string ids, integer refs, ISO timestamps, member dicts, etc).
+#
+# Format reference: https://wiki.openstreetmap.org/wiki/PBF_Format
+
+import struct, time, zlib, lzma
+from itertools import accumulate
+
+# The features we know how to read. Anything else listed as "required" in the file header is an error.
+supported_features = set(['OsmSchema-V0.6', 'DenseNodes'])
+
+membertypes = ['node', 'way', 'relation']
+
+############################################
+# Protobuf wire-format helpers:
+
+def _read_varint(buf, pos):
+	"Decode one base-128 varint from buf at pos. Returns (value, newpos)."
+	result = 0
+	shift = 0
+	while True:
+		b = buf[pos]
+		pos += 1
+		result |= (b & 0x7f) << shift
+		if not (b & 0x80):
+			return result, pos
+		shift += 7
+
+def _signed64(v):
+	"Reinterpret an unsigned varint as a two's-complement int64 (protobuf 'int64' fields)"
+	return v - (1 << 64) if v >= (1 << 63) else v
+
+def _zigzag(v):
+	"Decode a zigzag-encoded varint (protobuf 'sint' fields)"
+	return (v >> 1) ^ -(v & 1)
+
+def _iter_fields(buf):
+	"Iterate over the (fieldnumber, value) pairs of a protobuf message. Length-delimited values are returned as bytes."
+	pos = 0
+	end = len(buf)
+	while pos < end:
+		key, pos = _read_varint(buf, pos)
+		wiretype = key & 7
+		if wiretype == 0:
+			value, pos = _read_varint(buf, pos)
+		elif wiretype == 2:
+			length, pos = _read_varint(buf, pos)
+			value = buf[pos:pos + length]
+			pos += length
+		elif wiretype == 1:
+			value = buf[pos:pos + 8]
+			pos += 8
+		elif wiretype == 5:
+			value = buf[pos:pos + 4]
+			pos += 4
+		else:
+			raise ValueError("Unsupported protobuf wire type %i in PBF data" % wiretype)
+		yield key >> 3, value
+
+def _packed(buf):
+	"Decode a packed repeated varint field to a list of unsigned ints"
+	values = []
+	pos = 0
+	end = len(buf)
+	while pos < end:
+		v, pos = _read_varint(buf, pos)
+		values.append(v)
+	return values
+
+def _packed_sint(buf):
+	return [_zigzag(v) for v in _packed(buf)]
+
+def _packed_delta(buf):
+	"Decode a packed, delta-coded sint64 field (ids, refs, coordinates)"
+	return list(accumulate(_packed_sint(buf)))
+
+############################################
+# File and block level:
+
+def iter_pbf_blobs(fp):
+	"""Iterate over the blobs in a PBF file, yielding (blobtype, blobbytes) with the blob still compressed.
+	Each 'OSMData' blob can be decoded independently of all the others."""
+	while True:
+		lenbytes = fp.read(4)
+		if not lenbytes:
+			return
+		if len(lenbytes) != 4:
+			raise ValueError("Truncated PBF file (incomplete blob header length)")
+		headerlen, = struct.unpack('>I', lenbytes)
+		blobtype = None
+		datasize = None
+		for fieldnum, value in _iter_fields(fp.read(headerlen)):
+			if fieldnum == 1:
+				blobtype = value.decode('utf-8')
+			elif fieldnum == 3:
+				datasize = value
+		if datasize is None:
+			raise ValueError("Malformed PBF blob header (no datasize)")
+		blobbytes = fp.read(datasize)
+		if len(blobbytes) != datasize:
+			raise ValueError("Truncated PBF file (incomplete blob)")
+		yield blobtype, blobbytes
+
+def decode_blob(blobbytes):
+	"Decompress a PBF blob, returning the raw block bytes"
+	for fieldnum, value in _iter_fields(blobbytes):
+		if fieldnum == 1:
+			return value
+		elif fieldnum == 3:
+			return zlib.decompress(value)
+		elif fieldnum == 4:
+			return lzma.decompress(value)
+		elif fieldnum in (5, 6, 7):
+			raise ValueError("This PBF blob uses a compression scheme not supported here (field %i). Please re-encode with zlib, e.g. using osmium." % fieldnum)
+	raise ValueError("PBF blob contains no data")
+
+def check_header_block(data):
+	"Check that an 'OSMHeader' block doesn't require features we can't handle"
+	for fieldnum, value in _iter_fields(data):
+		if fieldnum == 4:
+			feature = value.decode('utf-8')
+			if feature not in supported_features:
+				raise ValueError("This PBF file requires a feature which this reader does not support: %s" % feature)
+
+############################################
+# Decoding the OSM data proper:
+
+class _BlockContext:
+	"The per-block settings needed to decode the elements in a PrimitiveBlock"
+	def __init__(self):
+		self.strings = []
+		self.granularity = 100
+		self.lat_offset = 0
+		self.lon_offset = 0
+		self.date_granularity = 1000
+
+	def latlon(self, lat, lon):
+		# Coordinates are stored in nanodegrees. Dividing the exact integer by 1e9 gives the same float as parsing the
+		# 7-decimal-place text that osmium writes to XML, so both readers produce identical values.
+		return (self.lat_offset + self.granularity * lat) / 1e9, (self.lon_offset + self.granularity * lon) / 1e9
+
+	def timestamp(self, ts):
+		return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts * self.date_granularity // 1000))
+
+def _newitem(objtype, osmid, timestamp, user):
+	return {'id': str(osmid), 'timestamp': timestamp, 'user': user, 'tags': {}, 'objtype': objtype}
+
+def _decode_info(buf, ctx):
+	"Returns (timestamp, user) from an Info message"
+	timestamp = ''
+	user = ''
+	for fieldnum, value in _iter_fields(buf):
+		if fieldnum == 2:
+			timestamp = ctx.timestamp(_signed64(value))
+		elif fieldnum == 5:
+			user = ctx.strings[value]
+	return timestamp, user
+
+def _decode_keysvals(keys, vals, ctx):
+	return {ctx.strings[k]: ctx.strings[v] for k, v in zip(keys, vals)}
+
+def _decode_node(buf, ctx):
+	osmid = 0
+	keys = vals = []
+	info = ('', '')
+	lat = lon = 0
+	for fieldnum, value in _iter_fields(buf):
+		if fieldnum == 1:
+			osmid = _zigzag(value)
+		elif fieldnum == 2:
+			keys = _packed(value)
+		elif fieldnum == 3:
+			vals = _packed(value)
+		elif fieldnum == 4:
+			info = _decode_info(value, ctx)
+		elif fieldnum == 8:
+			lat = _zigzag(value)
+		elif fieldnum == 9:
+			lon = _zigzag(value)
+	item = _newitem('node', osmid, info[0], info[1])
+	item['lat'], item['lon'] = ctx.latlon(lat, lon)
+	item['tags'] = _decode_keysvals(keys, vals, ctx)
+	return item
+
+def _decode_dense(buf, ctx):
+	ids = lats = lons = keysvals = []
+	timestamps = usersids = None
+	for fieldnum, value in _iter_fields(buf):
+		if fieldnum == 1:
+			ids = _packed_delta(value)
+		elif fieldnum == 5:
+			for infofield, infovalue in _iter_fields(value):
+				if infofield == 2:
+					timestamps = _packed_delta(infovalue)
+				elif infofield == 5:
+					usersids = _packed_delta(infovalue)
+		elif fieldnum == 8:
+			lats = _packed_delta(value)
+		elif fieldnum == 9:
+			lons = _packed_delta(value)
+		elif fieldnum == 10:
+			keysvals = _packed(value)
+	kvpos = 0
+	strings = ctx.strings
+	for which, osmid in enumerate(ids):
+		item = _newitem('node', osmid,
+			ctx.timestamp(timestamps[which]) if timestamps else '',
+			strings[usersids[which]] if usersids else '')
+		item['lat'], item['lon'] = ctx.latlon(lats[which], lons[which])
+		# keys_vals is a flat list of (k, v, k, v, ..., 0) with a zero terminating each node's tags
+		if keysvals:
+			tags = item['tags']
+			while keysvals[kvpos] != 0:
+				tags[strings[keysvals[kvpos]]] = strings[keysvals[kvpos + 1]]
+				kvpos += 2
+			kvpos += 1
+		yield item
+
+def _decode_way(buf, ctx):
+	osmid = 0
+	keys = vals = refs = []
+	info = ('', '')
+	for fieldnum, value in _iter_fields(buf):
+		if fieldnum == 1:
+			osmid = _signed64(value)
+		elif fieldnum == 2:
+			keys = _packed(value)
+		elif fieldnum == 3:
+			vals = _packed(value)
+		elif fieldnum == 4:
+			info = _decode_info(value, ctx)
+		elif fieldnum == 8:
+			refs = _packed_delta(value)
+	item = _newitem('way', osmid, info[0], info[1])
+	item['tags'] = _decode_keysvals(keys, vals, ctx)
+	item['nodes'] = refs
+	return item
+
+def _decode_relation(buf, ctx):
+	osmid = 0
+	keys = vals = roles = memids = types = []
+	info = ('', '')
+	for fieldnum, value in _iter_fields(buf):
+		if fieldnum == 1:
+			osmid = _signed64(value)
+		elif fieldnum == 2:
+			keys = _packed(value)
+		elif fieldnum == 3:
+			vals = _packed(value)
+		elif fieldnum == 4:
+			info = _decode_info(value, ctx)
+		elif fieldnum == 8:
+			roles = _packed(value)
+		elif fieldnum == 9:
+			memids = _packed_delta(value)
+		elif fieldnum == 10:
+			types = _packed(value)
+	item = _newitem('relation', osmid, info[0], info[1])
+	item['tags'] = _decode_keysvals(keys, vals, ctx)
+	item['nodes'] = []
+	item['ways'] = []
+	item['relations'] = []
+	for role, ref, membertype in zip(roles, memids, types):
+		if membertype >= len(membertypes):
+			raise ValueError("This script does not know how to handle the following member-type found in relation %s: '%s'" % (item['id'], membertype))
+		item[membertypes[membertype] + 's'].append({'ref': ref, 'role': ctx.strings[role]})
+	return item
+
+def iter_block_items(data):
+	"Decode one (decompressed) PrimitiveBlock, yielding (objtype, item) for every node, way and relation, in file order."
+	ctx = _BlockContext()
+	groups = []
+	for fieldnum, value in _iter_fields(data):
+		if fieldnum == 1:
+			ctx.strings = [s.decode('utf-8') for fieldnum, s in _iter_fields(value) if fieldnum == 1]
+		elif fieldnum == 2:
+			groups.append(value)
+		elif fieldnum == 17:
+			ctx.granularity = value
+		elif fieldnum == 18:
+			ctx.date_granularity = value
+		elif fieldnum == 19:
+			ctx.lat_offset = _signed64(value)
+		elif fieldnum == 20:
+			ctx.lon_offset = _signed64(value)
+	for group in groups:
+		for fieldnum, value in _iter_fields(group):
+			if fieldnum == 1:
+				yield 'node', _decode_node(value, ctx)
+			elif fieldnum == 2:
+				for item in _decode_dense(value, ctx):
+					yield 'node', item
+			elif fieldnum == 3:
+				yield 'way', _decode_way(value, ctx)
+			elif fieldnum == 4:
+				yield 'relation', _decode_relation(value, ctx)
+			# (field 5, changesets, is ignored)
+
+def iter_pbf_items(fp):
+	"Iterate over a whole PBF file, yielding (objtype, item) for every node, way and relation, in file order."
+	for blobtype, blobbytes in iter_pbf_blobs(fp):
+		if blobtype == 'OSMHeader':
+			check_header_block(decode_blob(blobbytes))
+		elif blobtype == 'OSMData':
+			yield from iter_block_items(decode_blob(blobbytes))
+		# unknown blob types are skipped, as the spec requires
+
+def iter_pbf_shards(fp, blobspershard=4):
+	"""Iterate over a PBF file in shards which can be decoded independently (e.g. in parallel processes): each shard is a list of
+	consecutive, still-compressed 'OSMData' blobs. Decode one with iter_shard_items(). The header block is checked along the way."""
+	shard = []
+	for blobtype, blobbytes in iter_pbf_blobs(fp):
+		if blobtype == 'OSMHeader':
+			check_header_block(decode_blob(blobbytes))
+		elif blobtype == 'OSMData':
+			shard.append(blobbytes)
+			if len(shard) == blobspershard:
+				yield shard
+				shard = []
+	if shard:
+		yield shard
+
+def iter_shard_items(shard):
+	"Decode one shard from iter_pbf_shards(), yielding (objtype, item) for every node, way and relation, in file order."
+	for blobbytes in shard:
+		yield from iter_block_items(decode_blob(blobbytes))
@@ -0,0 +1,116 @@
+# Summary statistics of the PV objects compiled by compile_osm_solar.py, gathered in a single pass over the objects.
+# Gives the human-readable report printed at the end of a run, and the same numbers as a dict (for a JSON summary).
+
+import numpy as np
+
+# The calc_area (sq m) ranges reported for each group of objects: (key, test)
+areabuckets = [
+	('area_zero',         lambda area: area==0),
+	('area_upto_30',      lambda area: 0<area<=30),
+	('area_30_to_2000',   lambda area: 30<area<=2000),
+	('area_over_2000',    lambda area: area>2000),
+]
+
+class _GroupStats:
+	"Accumulates the counts and totals for one group of objects (e.g. standalone generators)"
+	def __init__(self):
+		self.count = 0
+		self.areas = []       # values are kept (not just a running total) so the totals are summed exactly as np.sum() always did
+		self.capacities = []
+		self.buckets = dict.fromkeys([key for key, test in areabuckets], 0)
+		self.with_repd = 0
+
+	def add(self, obj):
+		self.count += 1
+		area = obj['calc_area']
+		self.areas.append(area)
+		self.capacities.append(obj.get('calc_capacity', 0))
+		for key, test in areabuckets:
+			if test(area):
+				self.buckets[key] += 1
+				break
+		if obj.get('tag_repd:id', False):
+			self.with_repd += 1
+
+	def area_sqkm(self):
+		return 1e-6 * np.sum(self.areas)
+
+	def capacity_mw(self):
+		return 1e-3 * np.sum(self.capacities)
+
+	def summary(self):
+		result = {'count': self.count, 'area_sqkm': float(self.area_sqkm()), 'capacity_mw': float(self.capacity_mw())}
+		result.update(self.buckets)
+		return result
+
+class SolarStats:
+	"""Collects the summary statistics for a list of processed PV objects, one object at a time via add().
+	Objects must be complete (i.e. after postprocess(), which decides which generators belong to a plant)."""
+	def __init__(self):
+		self.total = 0
+		self.byobjtype = {'node': 0, 'way': 0, 'relation': 0}
+		self.repds_used = 0   # number of REPD identifiers tagged, counting each one in a semicolon-separated list
+		self.standalone = _GroupStats()  # power=generator, not part of a plant
+		self.infarm = _GroupStats()      # power=generator, part of a plant
+		self.plants = _GroupStats()      # power=plant
+
+	def add(self, obj):
+		self.total += 1
+		self.byobjtype[obj['objtype']] += 1
+		if obj.get('tag_repd:id', False):
+			self.repds_used += len(obj['tag_repd:id'].split(';'))
+		if obj['tag_power']=='generator':
+			if obj.get('plantref', None):
+				self.infarm.add(obj)
+			else:
+				self.standalone.add(obj)
+		elif obj['tag_power']=='plant':
+			self.plants.add(obj)
+
+	def summary(self):
+		"The statistics as a dict of plain numbers, suitable for writing as JSON"
+		return {
+			'total': self.total,
+			'by_objtype': dict(self.byobjtype),
+			'generators_standalone': self.standalone.summary(),
+			'generators_in_farm': self.infarm.summary(),
+			'plants': dict(self.plants.summary(), with_repd=self.plants.with_repd, repd_identifiers=self.repds_used),
+		}
+
+	def report(self):
+		"The human-readable report, as a list of lines"
+		lines = []
+		lines.append("parsed %i OSM objects (%i nodes, %i ways, %i relations)" % (self.total, self.byobjtype['node'], self.byobjtype['way'], self.byobjtype['relation']))
+		lines.append("")
+
+		subset = self.standalone
+		lines.append("Solar PV panel items (power=generator) (%s):" % "standalone")
+		lines.append("   %i in total"                                                                    % subset.count)
+		lines.append("   %g sq km total surface area"                                                    % subset.area_sqkm())
+		lines.append("   %g MW total generating capacity (NB metadata will be v incomplete for this)"    % subset.capacity_mw())
+		lines.append("   %i nodes with no sqm tagged (could presume 'domestic', but needs more tagging)" % subset.buckets['area_zero'])
+		lines.append("   %i areas <= 30 sqm (could presume 'domestic')"                                  % subset.buckets['area_upto_30'])
+		lines.append("   %i areas 30--2000 sqm (could presume 'commercial' or part of array)"            % subset.buckets['area_30_to_2000'])
+		lines.append("   %i areas > 2000 sqm (inspect to see if should really be tagged 'solar farm')"   % subset.buckets['area_over_2000'])
+
+		subset = self.infarm
+		lines.append("Solar PV panel items (power=generator) (%s):" % "within a farm")
+		lines.append("   %i in total"                                                                    % subset.count)
+		lines.append("   %g sq km total surface area"                                                    % subset.area_sqkm())
+		lines.append("   %i nodes with no sqm tagged"                                                    % subset.buckets['area_zero'])
+		lines.append("   %i areas <= 30 sqm"                                                             % subset.buckets['area_upto_30'])
+		lines.append("   %i areas 30--2000 sqm"                                                          % subset.buckets['area_30_to_2000'])
+		lines.append("   %i areas > 2000 sqm (inspect to see if should really be tagged 'solar farm')"   % subset.buckets['area_over_2000'])
+
+		subset = self.plants
+		lines.append("Solar PV farm items (power=plant):")
+		lines.append("   %i in total"                                                                    % subset.count)
+		lines.append("   %i have REPD identifier tagged"                                                 % subset.with_repd)
+		lines.append("        (%i REPD identifiers encountered)"                                         % self.repds_used)
+		lines.append("   %g sq km total surface area"                                                    % subset.area_sqkm())
+		lines.append("   %g MW total generating capacity"                                                % subset.capacity_mw())
+		lines.append("   %i nodes with no sqm tagged (needs more tagging)"                               % subset.buckets['area_zero'])
+		lines.append("   %i areas <= 30 sqm - not including nodes"                                       % subset.buckets['area_upto_30'])
+		lines.append("   %i areas 30--2000 sqm"                                                          % subset.buckets['area_30_to_2000'])
+		lines.append("   %i areas > 2000 sqm"                                                            % subset.buckets['area_over_2000'])
+		return lines
@@ -0,0 +1,194 @@
+# Compact array-backed storage for OSM element coordinates, used by compile_osm_solar.py
+# in place of one python dict per node. Ids are int64 and lat/lon are float64, held in
+# parallel numpy arrays which grow in chunks; id->index lookup is by binary search.
+
+import numpy as np
+
+class CoordStore:
+	"""Stores (id, lat, lon) for OSM elements, plus optional extra float or int columns (e.g. 'calc_area' for ways).
+	Lookups behave like the dicts they replace: asking for an id that was never added raises KeyError,
+	and adding the same id twice raises ValueError. For applying OSM change files, elements can also be
+	updated in place or removed (removed ids keep their slot, marked as no longer live).
+
+	Osmium writes elements in ascending id order, so normally the arrays are already sorted and lookups
+	are a plain binary search; if ids ever arrive out of order, a sort permutation is built lazily."""
+
+	def __init__(self, name='item', chunksize=65536, extracols=(), intcols=()):
+		self.name = name
+		self.chunksize = chunksize
+		self.count = 0
+		self.ids = np.empty(chunksize, dtype=np.int64)
+		self.lat = np.empty(chunksize, dtype=np.float64)
+		self.lon = np.empty(chunksize, dtype=np.float64)
+		self.extra = {col: np.zeros(chunksize, dtype=np.float64) for col in extracols}
+		self.extra.update({col: np.zeros(chunksize, dtype=np.int64) for col in intcols})
+		self.live = np.zeros(chunksize, dtype=bool)
+		self._ascending = True  # True as long as every id added has been larger than the previous one
+		self._order = None      # argsort of the ids, only needed (and built lazily) if not _ascending
+
+	def __len__(self):
+		return int(np.count_nonzero(self.live[:self.count]))
+
+	def __contains__(self, osmid):
+		return self._find(np.array([osmid], dtype=np.int64))[0] >= 0
+
+	def _grow(self, needed=1):
+		"Enlarge the arrays by enough whole chunks to hold at least 'needed' more elements"
+		newsize = len(self.ids) + self.chunksize * -(-(self.count + needed - len(self.ids)) // self.chunksize)
+		self.ids = np.resize(self.ids, newsize)
+		self.lat = np.resize(self.lat, newsize)
+		self.lon = np.resize(self.lon, newsize)
+		self.live = np.resize(self.live, newsize)
+		for col in self.extra:
+			self.extra[col] = np.resize(self.extra[col], newsize)
+
+	def add(self, osmid, lat, lon, **extravalues):
+		"Append one element. Returns its index in the store."
+		osmid = int(osmid)
+		if self.count and osmid <= self.ids[self.count - 1]:
+			if self._slots(np.array([osmid], dtype=np.int64))[0] >= 0:
+				raise ValueError("%s store seems to encounter a duplicate item: id %i" % (self.name, osmid))
+			self._ascending = False
+		self._order = None
+		if self.count == len(self.ids):
+			self._grow()
+		index = self.count
+		self.ids[index] = osmid
+		self.lat[index] = lat
+		self.lon[index] = lon
+		for col, value in extravalues.items():
+			self.extra[col][index] = value
+		self.live[index] = True
+		self.count += 1
+		return index
+
+	def extend(self, ids, lat, lon):
+		"Append many elements at once (e.g. a batch parsed in another process), with the same checks as add()."
+		ids = np.asarray(ids, dtype=np.int64)
+		num = len(ids)
+		if not num:
+			return
+		if np.any(np.diff(ids) <= 0) or (self.count and ids[0] <= self.ids[self.count - 1]):
+			# not simply a continuation of the ascending ids: add one by one, which checks for duplicates
+			for osmid, onelat, onelon in zip(ids, lat, lon):
+				self.add(osmid, onelat, onelon)
+			return
+		if self.count + num > len(self.ids):
+			self._grow(num)
+		self.ids[self.count:self.count + num] = ids
+		self.lat[self.count:self.count + num] = lat
+		self.lon[self.count:self.count + num] = lon
+		self.live[self.count:self.count + num] = True
+		self.count += num
+		self._order = None
+
+	def update(self, osmid, lat, lon, **extravalues):
+		"Add an element, or overwrite it if the id is already present (or was removed). Returns its index in the store."
+		index = self._slots(np.array([osmid], dtype=np.int64))[0]
+		if index < 0:
+			return self.add(osmid, lat, lon, **extravalues)
+		self.lat[index] = lat
+		self.lon[index] = lon
+		for col in self.extra:
+			self.extra[col][index] = extravalues.get(col, 0)
+		self.live[index] = True
+		return int(index)
+
+	def remove(self, osmid):
+		"Remove an element. Raises KeyError if it is not present."
+		self.live[self.index(osmid)] = False
+
+	def _slots(self, ids):
+		"Vectorised lookup of array slots, including removed elements: returns the index of each id, or -1 where the id was never added."
+		if self._ascending:
+			sortedids = self.ids[:self.count]
+			order = None
+		else:
+			if self._order is None:
+				self._order = np.argsort(self.ids[:self.count], kind='stable')
+			order = self._order
+			sortedids = self.ids[:self.count][order]
+		pos = np.searchsorted(sortedids, ids)
+		pos[pos == self.count] = 0
+		found = (sortedids[pos] == ids) if self.count else np.zeros(len(ids), dtype=bool)
+		if order is not None:
+			pos = order[pos]
+		return np.where(found, pos, -1)
+
+	def _find(self, ids):
+		"Vectorised lookup: returns the index of each id, or -1 where the id is not present."
+		slots = self._slots(ids)
+		return np.where(self.live[slots] & (slots >= 0), slots, -1)
+
+	def indices(self, ids):
+		"Return the array indices for a sequence of ids. Raises KeyError if any is missing."
+		ids = np.asarray(ids, dtype=np.int64)
+		result = self._find(ids)
+		if np.any(result < 0):
+			raise KeyError("%s id(s) not found in store: %s" % (self.name, ", ".join(map(str, ids[result < 0][:10]))))
+		return result
+
+	def index(self, osmid):
+		return int(self.indices([osmid])[0])
+
+	def latlon(self, ids):
+		"Return (lats, lons) arrays for a sequence of ids"
+		indices = self.indices(ids)
+		return self.lat[indices], self.lon[indices]
+
+	def get(self, osmid, col):
+		"Fetch a single value for one id: col can be 'lat', 'lon' or one of the extra columns"
+		index = self.index(osmid)
+		if col == 'lat':
+			return self.lat[index]
+		elif col == 'lon':
+			return self.lon[index]
+		return self.extra[col][index]
+
+	@property
+	def nbytes(self):
+		"Memory footprint of the store's arrays, in bytes (including unused capacity in the last chunk)"
+		total = self.ids.nbytes + self.lat.nbytes + self.lon.nbytes + self.live.nbytes + sum(arr.nbytes for arr in self.extra.values())
+		if self._order is not None:
+			total += self._order.nbytes
+		return total
+
+	def describe(self):
+		return "%i %ss, %.1f MB" % (len(self), self.name, self.nbytes / 1e6)
+
+class RangeStore:
+	"""An append-only flat int64 array holding many variable-length runs of values (e.g. the node-store indices of each way's nodes),
+	each referred to by its (start, count). Replacing a run just appends a new one; the old values are left unused."""
+
+	def __init__(self, name='item', chunksize=262144):
+		self.name = name
+		self.chunksize = chunksize
+		self.count = 0
+		self.values = np.empty(chunksize, dtype=np.int64)
+
+	def append(self, values):
+		"Store a run of values. Returns its start position."
+		num = len(values)
+		if self.count + num > len(self.values):
+			self.values = np.resize(self.values, len(self.values) + self.chunksize * -(-(self.count + num - len(self.values)) // self.chunksize))
+		start = self.count
+		self.values[start:start + num] = values
+		self.count += num
+		return start
+
+	def get(self, start, count):
+		return self.values[start:start + count]
+
+	def contains_any(self, starts, counts, values):
+		"For each run given by (starts, counts), whether it contains any of the given values"
+		starts = np.asarray(starts, dtype=np.int64)
+		hits = np.zeros(self.count + 1, dtype=np.int64)
+		hits[1:] = np.cumsum(np.isin(self.values[:self.count], np.asarray(list(values), dtype=np.int64)))
+		return hits[starts + np.asarray(counts, dtype=np.int64)] > hits[starts]
+
+	@property
+	def nbytes(self):
+		return self.values.nbytes
+
+	def describe(self):
+		return "%i %s entries, %.1f MB" % (self.count, self.name, self.nbytes / 1e6)
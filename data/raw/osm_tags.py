@@ -0,0 +1,358 @@
+# Table-driven normalisation of the OSM tags found on solar PV objects, used by compile_osm_solar.py.
+#
+# Every tag key is dispatched through a dict (rather than a chain of if/elif and list-membership tests)
+# to a handler which writes the normalised value into the output item. The value parsers for capacity,
+# orientation and module counts are also available as batch functions, which take a whole column of raw
+# tag values and return parsed columns - handy for benchmarking, or for reuse outside the XML/PBF parse.
+
+import re
+import numpy as np
+
+############################################
+# Lookup tables:
+
+compasspoints = {
+	'N':     0,
+	'NNE':  22.5,
+	'NE':   45,
+	'ENE':  67.5,
+	'E':    90,
+	'ESE': 112.5,
+	'SE':  135,
+	'SSE': 157.5,
+	'S':   180,
+	'SSW': 202.5,
+	'SW':  225,
+	'WSW': 247.5,
+	'W':   270,
+	'WNW': 292.2,
+	'NW':  315,
+	'NNW': 337.5,
+	# unconventional but seen in data:
+	'NORTH':   0,
+	'NORTHEAST':   45,
+	'NORTH_EAST':   45,
+	'EAS':    90,                   # TEMPORARY fix for wonky entry
+	'EAST':    90,
+	'SOUTHEAST':    135,
+	'SOUTH_EAST':    135,
+	'SOUTH':  180,
+	'SOUTHWEST':    225,
+	'SOUTH_WEST':    225,
+	'WEST':   270,
+	'NORTHWEST':   315,
+	'NORTH_WEST':   315,
+}
+
+# orientation values which are understood but carry no usable direction
+orientations_without_direction = frozenset([
+	'ESW',  # uninterpretable case seen in data... so skip
+	'FLAT', # flat-mounted items have no orientation
+])
+
+# Multipliers to convert capacity values to kW. Note that W and MWp are only recognised with a space before the unit.
+capacity_units = {
+	' W':   0.001,
+	'KW':   1,
+	'MW':   1000,
+	' MWP': 1000,  # NB probably not possible to make use of difference between MW and MWp
+}
+capacity_nonvalues = frozenset(['YES', 'SMALL_INSTALLATION'])
+regex_capacity = re.compile('^(.*?)( W|KW|MW| MWP)\\Z', re.DOTALL)
+
+regex_numbers_semicolon_start = re.compile('^([0-9;]*).*')
+
+# Here are ALL the ones we copy into the output data unedited
+copied_tags = frozenset([
+	'start_date',
+	'repd:id',
+])
+
+# Here are ALL the ones we don't need information from:
+ignored_tags = frozenset([
+	'generator',
+	'generator:source',
+	'generator:method',
+	'generator:type',
+	'generator:output',
+	'generator:note',
+	'generator:strings',
+	'generator:output:biogas',
+	'generator:output:hot_water',
+	'generator:plant',
+	'plant:source',
+	'plant:method',
+	'plant:type',
+	'power_source',
+	'note:generator:output:electricity',
+	'voltage',
+	'fixme',
+	'earliest_start_date',
+	'latest_start_date',
+	'amenity',
+	'capacity',
+	'floating',
+	'area',
+	'ref',
+	'website',
+	'alt_name',
+	'url',
+	'landcover',
+	'email',
+	'fax',
+	'postal_code',
+	'phone',
+	'site',
+	'surface',
+	'notes',
+	'industrial',
+	'listed_status',
+	'survey_date',
+	'man_made',
+	'barrier',
+	'fence_type',
+	'height',
+	'shop',
+	'wheelchair',
+	'sport',
+	'brand',
+	'leisure',
+	'frequency',
+	'manufacturer',
+	'architect',
+	'HE_ref',
+	'note_2',
+	'survey:date',
+	'mapillary',
+	'natural',
+	'construction',
+	'farmland',
+	'opening_hours',
+])
+
+# ...and any key whose first colon-separated part is one of these:
+ignored_prefixes = frozenset([
+	'source',  # NB there are lots of different source tags. Here we're suppressing any leftovers, even though we may use specific source tags already.
+	'operator',
+	'owner',
+	'description',
+	'contact',
+	'name',
+	'fence',
+	'social_facility',
+	'flickr',
+	'highway',
+	'landuse',
+	'fhrs',
+	'layer',
+	'ref',
+	'level',
+	'wikimedia_commons',
+	'wikidata',
+	'wikipedia',
+	'geograph',
+	'type', # rel multipolygon
+	'tourism',
+	'building',
+	'addr',
+	'roof',
+	'demolished',
+	'indoor',
+])
+
+############################################
+# Value parsers. Each returns (value, ok): value is None if there's nothing to store, and ok is False if the input wasn't understood.
+
+def parse_capacity(v):
+	"Parse a generator/plant output value such as '4 kW' or '5 MWp' into kW."
+	v = v.replace(",", ".").upper()
+	if v in capacity_nonvalues:
+		return None, True
+	match = regex_capacity.match(v)
+	if match is None:
+		return None, False
+	try:
+		return float(match.group(1)) * capacity_units[match.group(2)], True
+	except ValueError:
+		return None, False
+
+def parse_orientation(v):
+	"Parse a compass point (e.g. 'SSE') or a number of degrees."
+	v = v.replace('`', '').upper()  # some people write it this way
+	if v in compasspoints:
+		return compasspoints[v], True
+	if v in orientations_without_direction:
+		return None, True
+	try:
+		return int(v), True
+	except ValueError:
+		return None, False
+
+def parse_modules(v):
+	"Parse a module count, returned as a string (empty if unknown). Entries like '7;5;2' are summed."
+	if v=='unknown':
+		return '', True
+	# It's quite common (for some UI reason) to get typos in this field with characters pasted after the initial digits. We trim them off.
+	v = regex_numbers_semicolon_start.sub('\\1', v)
+	if ';' in v:
+		try:
+			v = str(sum(map(int, v.split(';'))))
+		except ValueError:
+			return None, False
+	return v, True
+
+def parse_module_array(v):
+	"Parse a module layout such as '3 by 4' into a module count."
+	splitvals = v.split(" by ")
+	if len(splitvals)!=2:
+		return None, False
+	try:
+		return int(splitvals[0]) * int(splitvals[1]), True
+	except ValueError:
+		return None, False
+
+############################################
+# Tag handlers. Each takes the output item plus one tag, stores whatever it can in the item,
+# and returns None if the tag was understood or else the value to report as un-recognised.
+
+def _handle_power(curitem, k, v):
+	curitem['tag_power'] = v
+
+def _handle_capacity(curitem, k, v):
+	value, ok = parse_capacity(v)
+	if value is not None:
+		curitem['calc_capacity'] = value
+	if not ok:
+		return v.replace(",", ".").upper()
+
+def _handle_location(curitem, k, v):
+	if v=='rooftop':
+		v = 'roof'
+	curitem['location'] = v
+
+def _handle_source_obj(curitem, k, v):
+	curitem['source_obj'] = v.replace(",", ";")
+
+def _handle_source_capacity(curitem, k, v):
+	if v=='REPD Open Data':
+		v = 'repd'
+	curitem['source_capacity'] = v.replace(",", ";")
+
+def _handle_note(curitem, k, v):
+	if v=='roof household':
+		curitem['location'] = 'roof'
+	# TODO check all unhandled "note", see if they're OK
+
+def _handle_notional_area(curitem, k, v):
+	#TODO consider: if curitem['calc_area'] != 0: print("  WARNING: skipping notional_area for %s %s because calc_area already filled in" % (curitem['objtype'], curitem['id']))
+	if not v.endswith(' sq m'):
+		return v
+	try:
+		curitem['calc_area'] = float(v[:-5].replace(',', '.', ))
+	except ValueError:
+		print("Couldn't handle this notional_area: " + v)
+
+def _handle_orientation(curitem, k, v):
+	value, ok = parse_orientation(v)
+	if value is not None:
+		curitem['orientation'] = value
+	if not ok:
+		print("Un-parseable orientation value in %s %s: %s=%s" % (curitem['objtype'], curitem['id'], k, v.replace('`', '').upper()))
+
+def _handle_module_array(curitem, k, v):
+	value, ok = parse_module_array(v)
+	if not ok:
+		return v
+	curitem['generator:solar:modules'] = value
+
+def _handle_modules(curitem, k, v):
+	value, ok = parse_modules(v)
+	if not ok:
+		return v
+	curitem['generator:solar:modules'] = value
+
+def _handle_copied(curitem, k, v):
+	curitem['tag_%s' % k] = v
+
+def _handle_ignored(curitem, k, v):
+	pass
+
+tag_handlers = {}
+for _keys, _handler in [
+		(['power'],                                                          _handle_power),
+		(['generator:output:electricity', 'plant:output:electricity'],       _handle_capacity),
+		(['location', 'generator:place', 'generator:location'],              _handle_location),
+		(['source', 'source:geometry'],                                      _handle_source_obj),
+		(['source:generator:output:electricity', 'source:plant:output:electricity', "source:power:output", "source:output", "source:power"], _handle_source_capacity),
+		(['note'],                                                           _handle_note),
+		(['notional_area'],                                                  _handle_notional_area),
+		(['direction', 'generator:orientation', 'orientation'],              _handle_orientation),
+		(['pv_module_array'],                                                _handle_module_array),
+		(['modules', 'generator:solar:modules', 'generator:modules'],        _handle_modules),
+		(copied_tags,                                                        _handle_copied),
+		(ignored_tags,                                                       _handle_ignored),
+	]:
+	for _k in _keys:
+		tag_handlers[_k] = _handler
+
+# Cache of the dispatch decision for keys not in tag_handlers (resolved by prefix, or unknown)
+_dispatch_cache = {}
+
+def _lookup_handler(k):
+	"Find the handler for a tag key, or None if the key is not recognised."
+	handler = tag_handlers.get(k)
+	if handler is None:
+		try:
+			handler = _dispatch_cache[k]
+		except KeyError:
+			handler = _handle_ignored if k.split(':')[0] in ignored_prefixes else None
+			_dispatch_cache[k] = handler
+	return handler
+
+def normalise_tags(curitem):
+	"""Process ALL the tags of a PV object (curitem['tags']) into the item's output fields, including irrelevant ones, so that no information is lost.
+	Un-recognised tags are reported, in the order they occur."""
+	for k, v in curitem['tags'].items():
+		handler = _lookup_handler(k)
+		if handler is None:
+			unrecognised = v
+		else:
+			unrecognised = handler(curitem, k, v)
+		if unrecognised is not None:
+			astr = "Un-recognised tag in %s %s: %s=%s" % (curitem['objtype'], curitem['id'], k, unrecognised)
+			print(astr)
+			#raise ValueError(astr)
+
+		# TODO also try to calc_type: rooftop or infarm (location=roof; large size) or unknown
+
+############################################
+# Batch API: parse a whole column of raw tag values at once. Each distinct value is only parsed once.
+
+def parse_column(parser, values):
+	"""Apply one of the parse_* functions to a sequence of raw tag values (None meaning the tag is absent).
+	Returns (parsed, ok): an object array of parsed values (None where there is nothing to store) and a bool array."""
+	values = list(values)
+	parsed = np.empty(len(values), dtype=object)
+	ok = np.ones(len(values), dtype=bool)
+	memo = {None: (None, True)}
+	for which, v in enumerate(values):
+		try:
+			result = memo[v]
+		except KeyError:
+			result = memo[v] = parser(v)
+		parsed[which], ok[which] = result
+	return parsed, ok
+
+def parse_capacity_column(values):
+	"Parse a column of capacity strings. Returns (float array of kW, NaN where absent or unparsed; bool ok array)."
+	parsed, ok = parse_column(parse_capacity, values)
+	return np.array([np.nan if p is None else p for p in parsed], dtype=np.float64), ok
+
+def parse_orientation_column(values):
+	"Parse a column of orientation strings. Returns (float array of degrees, NaN where absent or no direction; bool ok array)."
+	parsed, ok = parse_column(parse_orientation, values)
+	return np.array([np.nan if p is None else p for p in parsed], dtype=np.float64), ok
+
+def parse_modules_column(values):
+	"Parse a column of module-count strings. Returns (object array of normalised strings, None where absent; bool ok array)."
+	return parse_column(parse_modules, values)
@@ -0,0 +1,167 @@
+# Fast reader for the cell values of a large, plain .xlsx worksheet, as used by convert_fit_excel_to_csv.py.
+# openpyxl's read-only mode builds a ReadOnlyCell object (and several dicts) for every cell, which dominates the
+# time taken to convert the FiT installation reports. Here openpyxl still loads the workbook-level parts
+# (shared strings, styles, the sheet's dimensions), but the worksheet XML itself is streamed directly, and each
+# row comes out as a plain list of values.
+# The values, and the shape of the rows (padding to the sheet's dimensions, empty rows for missing ones), are
+# exactly what openpyxl's  wb.active.iter_rows()  gives as cell.value, for the same workbook.
+# Worksheets with formulas are not handled (openpyxl rewrites shared formulas cell by cell): for those,
+# UnsupportedSheet is raised, and the caller should use openpyxl instead.
+
+from xml.etree.ElementTree import iterparse
+from warnings import warn
+from openpyxl import load_workbook
+from openpyxl.cell.text import Text
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+VALUE_TAG = '{%s}v' % SHEET_MAIN_NS
+FORMULA_TAG = '{%s}f' % SHEET_MAIN_NS
+INLINE_STRING = '{%s}is' % SHEET_MAIN_NS
+TEXT_TAG = '{%s}t' % SHEET_MAIN_NS
+
+class UnsupportedSheet(Exception):
+	"The worksheet has content that this reader can't give the same values as openpyxl for"
+	pass
+
+def _cast_number(value):
+	"Convert numbers as string to an int or float (as openpyxl does)"
+	if "." in value or "E" in value or "e" in value:
+		return float(value)
+	return int(value)
+
+class _SheetParser:
+	"Converts the <row> elements of one worksheet into (row number, [(column, value), ...])"
+	def __init__(self, sharedstrings, epoch, dateformats, timedeltaformats):
+		self.sharedstrings = sharedstrings
+		self.epoch = epoch
+		self.dateformats = dateformats
+		self.timedeltaformats = timedeltaformats
+		self.rowcounter = 0
+		self.columns = {}   # cache: column letters -> column number
+		self.dates = {}     # cache: (serial value, timedelta) -> converted value
+
+	def _column(self, coordinate):
+		letters = coordinate.rstrip('0123456789')
+		try:
+			return self.columns[letters]
+		except KeyError:
+			self.columns[letters] = column = column_index_from_string(letters)
+			return column
+
+	def _date(self, value, timedelta, coordinate):
+		"The date (or time, or timedelta) for a date-formatted number. The same dates recur a lot, so the conversions are remembered."
+		key = (value, timedelta)
+		try:
+			return self.dates[key]
+		except KeyError:
+			pass
+		try:
+			result = from_excel(value, self.epoch, timedelta=timedelta)
+		except (OverflowError, ValueError):
+			warn("Cell %s is marked as a date but the serial value %s is outside the limits for dates. The cell will be treated as an error." % (coordinate, value))
+			return "#VALUE!"
+		self.dates[key] = result
+		return result
+
+	def parse_row(self, element):
+		rownum = element.get('r')
+		if rownum is not None:
+			try:
+				self.rowcounter = int(rownum)
+			except ValueError:
+				val = float(rownum)
+				if not val.is_integer():
+					raise ValueError("%s is not a valid row number" % rownum)
+				self.rowcounter = int(val)
+		else:
+			self.rowcounter += 1
+
+		cells = []
+		column = 0
+		for cell in element:
+			datatype = cell.get('t', 'n')
+			coordinate = cell.get('r')
+			if coordinate:
+				column = self._column(coordinate)
+			else:
+				column += 1
+
+			value = None
+			inline = None
+			for child in cell:
+				if child.tag == VALUE_TAG:
+					value = child.text or None
+				elif child.tag == FORMULA_TAG:
+					raise UnsupportedSheet("formula in row %i" % self.rowcounter)
+				elif child.tag == INLINE_STRING:
+					inline = child
+
+			if datatype == 'inlineStr':
+				value = None
+				if inline is not None:
+					if len(inline) == 1 and inline[0].tag == TEXT_TAG:
+						value = inline[0].text or ""   # (plain text: no need for openpyxl's Text object)
+					else:
+						value = Text.from_tree(inline).content
+			elif value is not None:
+				if datatype == 'n':
+					value = _cast_number(value)
+					styleid = cell.get('s', 0)
+					if styleid:
+						styleid = int(styleid)
+					if styleid in self.dateformats:
+						value = self._date(value, styleid in self.timedeltaformats, coordinate)
+				elif datatype == 's':
+					value = self.sharedstrings[int(value)]
+				elif datatype == 'b':
+					value = bool(int(value))
+				elif datatype == 'd':
+					value = from_ISO8601(value)
+			cells.append((column, value))
+		return self.rowcounter, cells
+
+def iter_sheet_values(fpath):
+	"""Yields each row of the active worksheet of an .xlsx file, as a list of cell values (None for an empty cell).
+	Raises UnsupportedSheet (possibly after yielding some rows) if the worksheet has formulas."""
+	wb = load_workbook(filename=fpath, read_only=True)
+	try:
+		ws = wb.active
+		parser = _SheetParser(ws._shared_strings, wb.epoch, wb._date_formats, getattr(wb, '_timedelta_formats', set()))
+		maxcol = ws.max_column
+		maxrow = ws.max_row
+		emptyrow = [None] * maxcol if maxcol is not None else []
+
+		# Same row logic as openpyxl's ReadOnlyWorksheet: missing rows are given as empty rows,
+		# and each row is padded (or cut) to the width given by the sheet's dimensions
+		counter = 1
+		rownum = 1
+		with wb._archive.open(ws._worksheet_path) as src:
+			for _, element in iterparse(src):
+				if element.tag != ROW_TAG:
+					continue
+				rownum, cells = parser.parse_row(element)
+				element.clear()
+				if maxrow is not None and rownum > maxrow:
+					break
+				while counter < rownum:
+					counter += 1
+					yield list(emptyrow)
+				if counter <= rownum:
+					counter += 1
+					if not cells and not maxcol:
+						yield []
+						continue
+					width = maxcol or cells[-1][0]
+					row = [None] * width
+					for column, value in cells:
+						if 1 <= column <= width:
+							row[column - 1] = value
+					yield row
+		if maxrow is not None and maxrow < rownum:
+			for _ in range(counter, maxrow + 1):
+				yield list(emptyrow)
+	finally:
+		wb.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+### Load the processed datasets into the database: the same tables as the \copy commands in osm.sql, repd.sql, fit.sql and
+### mv.sql make, but read from the typed Parquet files (see data/processed/schema.py) and sent with binary COPY, so nothing
+### is formatted as text or parsed again. The four tables are loaded at once, each over its own connection, and each table's
+### location point is made as its rows are loaded, rather than by a second pass over the table (the update in the .sql files).
+### Usage:  python3 bulk-load.py hut23-425 [TABLE ...]       (a database name, or a libpq connection string)
+###         psql -v bulk_loaded=1 -f make-database.sql hut23-425
+### The second step then skips creating and loading the tables, and carries on from there.
+### To try it out on a throwaway database, e.g. with docker:
+###         docker run --rm -d -p 5433:5432 -e POSTGRES_HOST_AUTH_METHOD=trust postgis/postgis
+###         createdb -h localhost -p 5433 -U postgres scratch
+###         python3 bulk-load.py "host=localhost port=5433 user=postgres dbname=scratch"
+
+import os, sys, time, multiprocessing
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(dirname, '..', 'data', 'processed'))
+import schema
+from database import connect
+
+processeddir = os.path.join(dirname, '..', 'data', 'processed')
+
+# Number of rows read, encoded and sent at a time (the encoding takes around 10 times the size of the encoded rows in memory)
+batchsize = 20000
+
+# The table each processed dataset is loaded into, its primary key, and whether it has a location point (made from its
+# longitude and latitude columns, as in the .sql files)
+targets = {
+    'osm':            ('raw.osm',        'osm_id',  True),
+    'repd':           ('raw.repd',       'repd_id', True),
+    'fit':            ('raw.fit',        None,      False),
+    'machine_vision': ('machine_vision', 'mv_id',   True),
+}
+
+### PostgreSQL's binary COPY format: a header, then each row as a field count followed by each field as its length in
+### bytes and its value (in the type's binary form, big-endian), with a length of -1 for NULL; then a trailer
+
+copy_header = b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+copy_trailer = (-1).to_bytes(2, 'big', signed=True)
+
+# Dates are sent as days since 2000-01-01
+postgres_epoch = np.datetime64('2000-01-01', 'D')
+
+# The numpy type each fixed-size database type is sent as
+fixed_types = {'bigint': '>i8', 'int': '>i4', 'integer': '>i4', 'float': '>f8', 'date': '>i4'}
+
+# The location point, as EWKB: a little-endian point, with the SRID flag set, and SRID 4326 (WGS84)
+ewkb_point = np.dtype([('order', 'u1'), ('type', '<u4'), ('srid', '<u4'), ('x', '<f8'), ('y', '<f8')])
+ewkb_point_type = 0x20000001
+
+### Each column is encoded as (lengths, data): the length of each row's value in bytes (-1 for NULL), and the bytes of
+### the values that aren't NULL, one after the other. The rows are then put together from the columns all at once.
+
+def _fixed_column(values, missing, dtype):
+    lengths = np.where(missing, -1, np.dtype(dtype).itemsize)
+    return lengths, np.ascontiguousarray(values[~missing], dtype=dtype).view('u1')
+
+def column_values(series, kind, dbtype):
+    """One column of a conformed DataFrame, encoded for the given database type"""
+    if kind == 'str':
+        # (an empty string is sent as NULL, as it would be in CSV)
+        values = pa.chunked_array([pa.array(series, type=pa.string(), from_pandas=True)]).combine_chunks()
+        values = pc.fill_null(values, '')
+        offsets = np.frombuffer(values.buffers()[1], dtype=np.int32)[values.offset:values.offset + len(values) + 1]
+        lengths = np.diff(offsets).astype('int64')
+        lengths[lengths == 0] = -1
+        return lengths, np.frombuffer(values.buffers()[2], dtype='u1')[offsets[0]:offsets[-1]]
+    missing = series.isna().to_numpy()
+    if kind == 'date':
+        values = (series.to_numpy('datetime64[D]') - postgres_epoch).astype('int64')
+    elif kind == 'int':
+        values = series.to_numpy('int64', na_value=0)
+    else:
+        values = series.to_numpy('float64')
+    dtype = fixed_types[dbtype]
+    if dtype == '>i4' and not missing.all() and (values[~missing].min() < -2**31 or values[~missing].max() >= 2**31):
+        raise ValueError("Column %r has values out of range for %s" % (series.name, dbtype))
+    return _fixed_column(values, missing, dtype)
+
+def location_values(longitude, latitude):
+    """The location column: ST_SetSRID(ST_MakePoint(longitude, latitude), 4326), as EWKB (NULL where either is missing)"""
+    missing = np.isnan(longitude) | np.isnan(latitude)
+    points = np.zeros((~missing).sum(), dtype=ewkb_point)
+    points['order'] = 1
+    points['type'] = ewkb_point_type
+    points['srid'] = 4326
+    points['x'] = longitude[~missing]
+    points['y'] = latitude[~missing]
+    return np.where(missing, -1, ewkb_point.itemsize), points.view('u1')
+
+def _place(buffer, starts, lengths, data):
+    """Copy data into the buffer, lengths[i] bytes of it at starts[i] for each i"""
+    ends = np.cumsum(lengths)
+    buffer[np.repeat(starts - (ends - lengths), lengths) + np.arange(len(data))] = data
+
+def encode_rows(df, table, location):
+    """A conformed DataFrame as the rows of a binary COPY, as one bytes object"""
+    columns = [column_values(df[col], kind, dbtype) for col, kind, dbcol, dbtype in schema.tables[table]]
+    if location:
+        dbcolumns = {dbcol: col for col, kind, dbcol, dbtype in schema.tables[table]}
+        columns.append(location_values(df[dbcolumns['longitude']].to_numpy('float64'), df[dbcolumns['latitude']].to_numpy('float64')))
+    numrows = len(df)
+    fieldsizes = [4 + np.maximum(lengths, 0) for lengths, data in columns]
+    rowsizes = 2 + np.sum(fieldsizes, axis=0)
+    rowstarts = np.cumsum(rowsizes) - rowsizes
+    buffer = np.empty(rowsizes.sum(), dtype='u1')
+    _place(buffer, rowstarts, np.full(numrows, 2), np.tile(np.frombuffer(len(columns).to_bytes(2, 'big'), dtype='u1'), numrows))
+    fieldstarts = rowstarts + 2
+    for (lengths, data), size in zip(columns, fieldsizes):
+        _place(buffer, fieldstarts, np.full(numrows, 4), lengths.astype('>i4').view('u1'))
+        present = lengths > 0
+        _place(buffer, fieldstarts[present] + 4, lengths[present], data)
+        fieldstarts += size
+    return buffer.tobytes()
+
+class CopyStream:
+    """A file-like object for cursor.copy_expert to read the COPY data from: the header, each batch of rows as it is made, and the trailer"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.data = b''
+        self.pos = 0
+
+    def read(self, size=-1):
+        while self.pos >= len(self.data):
+            self.data = next(self.chunks, None)
+            if self.data is None:
+                self.data = b''
+                return b''
+            self.pos = 0
+        end = len(self.data) if size < 0 else self.pos + size
+        out = self.data[self.pos:end]
+        self.pos += len(out)
+        return out
+
+def copy_chunks(table, fpath, location, counts):
+    """The COPY data for a processed dataset's Parquet file, a batch at a time; counts[0] is the number of rows made so far"""
+    yield copy_header
+    for batch in pq.ParquetFile(fpath).iter_batches(batch_size=batchsize, columns=schema.columns(table)):
+        yield encode_rows(schema.from_arrow(batch, table), table, location)
+        counts[0] += batch.num_rows
+    yield copy_trailer
+
+def table_ddl(table, dbtable, location):
+    columns = ["  %-30s %s" % (dbcol, dbtype) for col, kind, dbcol, dbtype in schema.tables[table]]
+    if location:
+        columns.append("  %-30s %s" % ('location', 'geometry(Point, 4326)'))
+    return "create table %s (\n%s\n);" % (dbtable, ",\n".join(columns))
+
+def load_table(job):
+    """Worker: (re)creates one table and loads its processed dataset into it, over its own connection. Returns (table, rows, seconds)."""
+    dsn, table = job
+    dbtable, primarykey, location = targets[table]
+    dbcolumns = [dbcol for col, kind, dbcol, dbtype in schema.tables[table]] + (['location'] if location else [])
+    starttime = time.time()
+    counts = [0]
+    connection = connect(dsn)
+    try:
+        with connection, connection.cursor() as cursor:
+            # Creating the table in the same transaction as the COPY lets the server skip writing the rows to the WAL (with
+            # wal_level = minimal), and the primary key index is built once, after the rows are in
+            cursor.execute("drop table if exists %s;" % dbtable)
+            cursor.execute(table_ddl(table, dbtable, location))
+            cursor.copy_expert("copy %s (%s) from stdin with (format binary)" % (dbtable, ", ".join(dbcolumns)),
+                               CopyStream(copy_chunks(table, os.path.join(processeddir, table + ".parquet"), location, counts)), size=1 << 20)
+            if cursor.rowcount != counts[0]:
+                raise ValueError("%s: %i rows sent, but %i loaded" % (dbtable, counts[0], cursor.rowcount))
+            if primarykey:
+                cursor.execute("alter table %s add primary key (%s);" % (dbtable, primarykey))
+            cursor.execute("analyze %s;" % dbtable)
+    finally:
+        connection.close()
+    return table, counts[0], time.time() - starttime
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        raise ValueError("Usage: bulk-load.py DATABASE [TABLE ...]")
+    dsn = sys.argv[1]
+    tables = sys.argv[2:] or list(targets)
+    for table in tables:
+        if table not in targets:
+            raise KeyError("No such table %r (the tables are: %s)" % (table, ", ".join(targets)))
+
+    # As at the start of make-database.sql (done here once, rather than by each of the loads at the same time)
+    connection = connect(dsn)
+    with connection, connection.cursor() as cursor:
+        cursor.execute("create schema if not exists raw;")
+        if any(targets[table][2] for table in tables):
+            cursor.execute("create extension if not exists postgis;")
+    connection.close()
+
+    jobs = [(dsn, table) for table in tables]
+    with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+        for table, rows, seconds in pool.imap_unordered(load_table, jobs):
+            print("Loaded %i rows into %s in %.1fs" % (rows, targets[table][0], seconds))
@@ -0,0 +1,90 @@
+### Clustering the objects of a dataset that are near each other, for the deduplication (dedup-osm.py and dedup-repd.py):
+### the pairs of objects close enough to count as the same installation are found with a KD-tree, and joined up into
+### clusters with a disjoint-set (union-find) structure, so that no cluster's pairs are ever all listed
+
+import re
+import numpy as np
+from scipy.spatial import cKDTree
+from sphere import sphere_points, chord_length, great_circle_distance
+
+# The largest distance area_adaptive_threshold gives, in metres (see area-adaptive-threshold.sql)
+max_threshold = 1500
+
+def area_adaptive_threshold(area1, area2, capacity1, capacity2):
+    """The distance threshold for pairs of objects, from their areas (in square metres) and capacities (in MW), as
+    area_adaptive_threshold() in area-adaptive-threshold.sql, for arrays of values. NaN is NULL, which (as in SQL's
+    GREATEST and LEAST) is ignored unless all the values are NULL."""
+    biggest = np.fmax(np.fmax(area1, capacity1 * 20000), np.fmax(area2, capacity2 * 20000))
+    with np.errstate(invalid='ignore'):
+        return np.fmin(max_threshold, np.fmax(10, 2 * np.sqrt(biggest)))
+
+# A word, for trigram matching: a run of letters and digits
+trigram_word = re.compile(r'[^\W_]+')
+
+def trigrams(text):
+    """The set of trigrams of a string, as pg_trgm makes them: each word, lower-cased and padded with two spaces before and
+    one after, gives the trigrams in it"""
+    result = set()
+    for word in trigram_word.findall(text):
+        padded = "  " + word.lower() + " "
+        result.update(padded[k:k + 3] for k in range(len(padded) - 2))
+    return result
+
+def trigram_similarity(trigrams1, trigrams2):
+    """pg_trgm's similarity() of two strings, from their sets of trigrams: the number of trigrams they share, over the
+    number of distinct trigrams of both; 0 if either has none. It is a float4 in pg_trgm, and so here."""
+    if not trigrams1 or not trigrams2:
+        return np.float32(0)
+    shared = len(trigrams1 & trigrams2)
+    return np.float32(shared) / np.float32(len(trigrams1) + len(trigrams2) - shared)
+
+class DisjointSet:
+    """Disjoint sets of the integers 0 .. n-1, each to begin with in a set of its own"""
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i):
+        """The representative of i's set"""
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]   # (halving the path as we go)
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """Merge the sets of i and j"""
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            if self.size[i] < self.size[j]:
+                i, j = j, i
+            self.parent[j] = i
+            self.size[i] += self.size[j]
+
+    def representatives(self):
+        return np.array([self.find(i) for i in range(len(self.parent))], dtype=np.int64)
+
+def pairs_within(longitude, latitude, distance):
+    """The pairs (i, j), i < j, of the points that are less than the given distance in metres apart (a number, or a
+    function of the arrays of i and j giving one for each pair), with their distances: (i array, j array, distances).
+    Points without a location are in no pairs."""
+    present = np.flatnonzero(~(np.isnan(longitude) | np.isnan(latitude)))
+    maxdistance = distance if np.isscalar(distance) else max_threshold
+    tree = cKDTree(sphere_points(longitude[present], latitude[present]))
+    # (the search radius is a little larger, so as not to miss pairs at the limit: they're then measured exactly)
+    pairs = tree.query_pairs(chord_length(maxdistance) * (1 + 1e-9), output_type='ndarray')
+    i, j = present[pairs[:, 0]], present[pairs[:, 1]]
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    distances = great_circle_distance(longitude[i], latitude[i], longitude[j], latitude[j])
+    near = distances < (distance if np.isscalar(distance) else distance(i, j))
+    return i[near], j[near], distances[near]
+
+def cluster_masters(ids, i, j):
+    """For the objects with the given ids, joined up by the pairs (i, j), the largest id in each object's cluster"""
+    clusters = DisjointSet(len(ids))
+    for a, b in zip(i.tolist(), j.tolist()):
+        clusters.union(a, b)
+    representatives = clusters.representatives()
+    masters = np.full(len(ids), np.iinfo(np.int64).min)
+    np.maximum.at(masters, representatives, ids)
+    return masters[representatives]
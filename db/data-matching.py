@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+### Match the objects of the datasets by the match rules (see doc/matching.md), for data-matching.sql (which runs this):
+### makes the table matches(match_rule, master_repd_id, master_osm_id, mv_id, fit_id).
+### The rules are declared below, in the order they are applied, as conditions on one table of candidate pairs (the view
+### match_candidates, made by data-matching.sql), with the attributes of each pair's OSM and REPD objects joined on once.
+### An OSM-REPD rule doesn't match an object that an earlier rule has matched: the ids matched so far are kept in sets, so
+### each rule is a filter of its candidates, rather than a search of the matches found so far.
+### Run by data-matching.sql (with psql's connection passed on in PG* environment variables); or by hand:
+###         python3 data-matching.py hut23-425       (a database name, or a libpq connection string)
+
+import io, sys, time
+import pandas as pd
+from database import connect
+
+# The REPD partitions by development status, which the OSM-REPD rules are applied to in turn (with a NULL status, an
+# object is in neither)
+partitions = {
+    'operational':     lambda status: status == 'Operational',
+    'non-operational': lambda status: status != 'Operational',
+}
+
+### The conditions of the rules, on the candidate pairs. Each gives a boolean Series with NA where the SQL condition
+### would be NULL: a pair only meets a condition where it is true.
+
+def tagged_same_site(c):
+    """The OSM object's REPD id tag is for the same site as its nearest REPD object"""
+    return (  (c['tagged_repd_id'] == c['repd_id']).fillna(False)
+            | (c['tagged_repd_id'] == c['closest_co_location_repd_id']).fillna(False)
+            | (c['tagged_repd_id'] == c['repd_master_repd_id']).fillna(False)
+            | (c['repd_id'] == c['tagged_co_location_repd_id']).fillna(False)
+            | (c['repd_id'] == c['tagged_master_repd_id']).fillna(False))
+
+def masters(c):
+    """Both objects are the masters of their clusters"""
+    return (c['osm_id'] == c['osm_master_osm_id']) & (c['repd_id'] == c['repd_master_repd_id'])
+
+def way_or_relation(c):
+    return c['osm_objtype'] != 'node'
+
+def node(c):
+    return c['osm_objtype'] == 'node'
+
+def scheme(c):
+    return c['repd_site_name'].str.contains('Scheme', regex=False)
+
+class Rule:
+    """A match rule: the candidate pairs of one kind (pairs) that meet all of its conditions (where), and are nearer than
+    max_distance (if given), are its matches.
+    The objects named in joined ('osm', 'repd' and/or 'tagged', the REPD object of the OSM object's REPD id tag) must
+    exist, and those of REPD must be in the rule's partition. If the rule is exclusive, a pair isn't matched if its OSM
+    object, or its REPD object in the partition, has been matched by an earlier rule (by master id).
+    Each match is of the master ids in the columns repd and osm (or NULL), and the pair's machine vision object."""
+    def __init__(self, name, pairs, partition=None, joined=('osm', 'repd'), where=(), max_distance=None, exclusive=True,
+                 repd='repd_master_repd_id', osm='osm_master_osm_id'):
+        self.name = name
+        self.pairs = pairs
+        self.partition = partition
+        self.joined = joined
+        self.where = where
+        self.max_distance = max_distance
+        self.exclusive = exclusive
+        self.repd = repd
+        self.osm = osm
+
+def osm_repd_rules(partition, suffix):
+    """Rules 1 to 5, for the REPD objects in a partition (see doc/matching.md)"""
+    return [
+        Rule('1' + suffix,  'tagged',  partition, joined=('osm', 'repd', 'tagged'), max_distance=500, exclusive=bool(suffix),
+             repd='tagged_master_repd_id'),
+        Rule('2' + suffix,  'tagged',  partition, joined=('osm', 'repd', 'tagged'), where=[tagged_same_site]),
+        # (the tagged REPD object can have any status: it is only checked against the earlier matches if it is in the
+        # partition; and the OSM object needn't exist)
+        Rule('25' + suffix, 'mapping', partition, joined=()),
+        Rule('3' + suffix,  'nearest', partition, where=[masters, way_or_relation], max_distance=700),
+        Rule('4' + suffix,  'nearest', partition, where=[masters, node, scheme], max_distance=5000),
+        Rule('5' + suffix,  'nearest', partition, where=[masters, node, scheme]),
+    ]
+
+# The rules, in the order they are applied
+rules = (osm_repd_rules('operational', '') + osm_repd_rules('non-operational', 'a') + [
+    Rule('6', 'mv-repd', joined=('repd',), max_distance=1000, exclusive=False, osm=None),
+    Rule('7', 'mv-osm',  joined=('osm',),  max_distance=1000, exclusive=False, repd=None),
+])
+
+def read_table(cursor, query, dtypes):
+    """The rows of a query as a DataFrame, with the given (nullable) dtypes, so that NULL is NA"""
+    cursor.execute(query)
+    return pd.DataFrame(cursor.fetchall(), columns=list(dtypes), dtype=object).astype(dtypes)
+
+def read_candidates(cursor):
+    """The candidate pairs, with the attributes of their objects (as columns prefixed osm_, repd_ and tagged_, and
+    osm_found etc., whether the object exists)"""
+    candidates = read_table(cursor, "select pairs, osm_id, repd_id, tagged_repd_id, closest_co_location_repd_id, mv_id, distance_meters from match_candidates;",
+                            {'pairs': 'string', 'osm_id': 'Int64', 'repd_id': 'Int64', 'tagged_repd_id': 'Int64',
+                             'closest_co_location_repd_id': 'Int64', 'mv_id': 'Int64', 'distance_meters': 'Float64'})
+    osm = read_table(cursor, "select osm_id, master_osm_id, objtype from osm;",
+                     {'osm_id': 'Int64', 'master_osm_id': 'Int64', 'objtype': 'string'})
+    repd = read_table(cursor, "select repd_id, master_repd_id, co_location_repd_id, dev_status, site_name from repd;",
+                      {'repd_id': 'Int64', 'master_repd_id': 'Int64', 'co_location_repd_id': 'Int64', 'dev_status': 'string', 'site_name': 'string'})
+    for prefix, key, attributes in (('osm', 'osm_id', osm), ('repd', 'repd_id', repd), ('tagged', 'tagged_repd_id', repd)):
+        attributes = attributes.set_index(attributes.columns[0]).assign(found=True).add_prefix(prefix + '_')
+        candidates = candidates.join(attributes, on=key)
+        candidates[prefix + '_found'] = candidates[prefix + '_found'].fillna(False).astype(bool)
+    return candidates
+
+def rule_matches(rule, candidates, matched_repd, matched_osm):
+    """The matches of a rule, as a DataFrame with the columns of the matches table"""
+    c = candidates[candidates['pairs'] == rule.pairs]
+    chosen = pd.Series(True, index=c.index)
+    in_partition = partitions[rule.partition] if rule.partition else lambda status: pd.Series(True, index=status.index)
+    for obj in rule.joined:
+        chosen &= c[obj + '_found']
+        if obj != 'osm':
+            chosen &= in_partition(c[obj + '_dev_status']).fillna(False)
+    for condition in rule.where:
+        chosen &= condition(c).fillna(False)
+    if rule.max_distance is not None:
+        chosen &= (c['distance_meters'] < rule.max_distance).fillna(False)
+    if rule.exclusive:
+        checked_repd = c['repd_master_repd_id'].where(in_partition(c['repd_dev_status']).fillna(False))
+        chosen &= ~(c['osm_master_osm_id'].isin(matched_osm).fillna(False) | checked_repd.isin(matched_repd).fillna(False))
+    c = c[chosen]
+    nulls = pd.array([pd.NA] * len(c), dtype='Int64')
+    return pd.DataFrame({
+        'match_rule': rule.name,
+        'master_repd_id': c[rule.repd].array if rule.repd else nulls,
+        'master_osm_id': c[rule.osm].array if rule.osm else nulls,
+        'mv_id': c['mv_id'].array,
+        'fit_id': nulls,
+    })
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        raise ValueError("Usage: data-matching.py [DATABASE]")
+    starttime = time.time()
+    connection = connect(sys.argv[1] if len(sys.argv) > 1 else None)
+    with connection, connection.cursor() as cursor:
+        candidates = read_candidates(cursor)
+        matched_repd, matched_osm = set(), set()
+        matches = []
+        for rule in rules:
+            found = rule_matches(rule, candidates, matched_repd, matched_osm)
+            matched_repd.update(found['master_repd_id'].dropna())
+            matched_osm.update(found['master_osm_id'].dropna())
+            matches.append(found)
+            print("Match rule %s: %i matches" % (rule.name, len(found)))
+
+        cursor.execute("drop table if exists matches;")
+        cursor.execute("""create table matches (
+  match_rule     varchar(3),
+  master_repd_id integer,
+  master_osm_id  bigint,
+  mv_id          integer,
+  fit_id         integer
+);""")
+        matches_df = pd.concat(matches, ignore_index=True)
+        cursor.copy_expert("copy matches from stdin with (format csv)", io.StringIO(matches_df.to_csv(index=False, header=False)))
+    connection.close()
+    print("Found %i matches in %.1fs" % (len(matches_df), time.time() - starttime))
@@ -1,39 +1,53 @@
 
 \echo -n Finding matches across datasets ...
 
+-- (the deduplication has updated every row of osm and repd since they were last analysed)
+analyze osm;
+analyze repd;
+
 drop table if exists matches;
-create table matches (
-  match_rule     varchar(3),
-  master_repd_id integer,
-  master_osm_id  bigint,
-  mv_id          integer,
-  fit_id         integer
-);
-
--- OSM-REPD matching for operational installations
-drop table if exists repd_operational;
-select * into repd_operational from repd where dev_status = 'Operational';
-
-\include data-matching-rules/rule-1.sql
-\include data-matching-rules/rule-2.sql
-\include data-matching-rules/rule-25.sql
-\include data-matching-rules/rule-3.sql
-\include data-matching-rules/rule-4.sql
-\include data-matching-rules/rule-5.sql
-
--- OSM-REPD matching for non-operational installations
-drop table if exists repd_non_operational;
-select * into repd_non_operational from repd where dev_status != 'Operational';
-
-\include data-matching-rules/rule-1a.sql
-\include data-matching-rules/rule-2a.sql
-\include data-matching-rules/rule-25a.sql
-\include data-matching-rules/rule-3a.sql
-\include data-matching-rules/rule-4a.sql
-\include data-matching-rules/rule-5a.sql
-
--- REPD-MV matching
-\include data-matching-rules/rule-6.sql
-
--- OSM-MV matching
-\include data-matching-rules/rule-7.sql
+
+-- match_candidates(pairs, osm_id, repd_id, tagged_repd_id, closest_co_location_repd_id,
+--                  mv_id, distance_meters)
+-- The pairs of objects the match rules are applied to (see doc/matching.md), of each kind:
+--   tagged:  an OSM object with a REPD id tag (tagged_repd_id), and its nearest REPD
+--            object; distance_meters is the distance between the two REPD objects
+--   mapping: an OSM object and a REPD object of one of its REPD id tags
+--   nearest: an OSM object and its nearest REPD object
+--   mv-repd: a machine vision object and its nearest REPD object
+--   mv-osm:  a machine vision object and its nearest OSM way or relation
+
+drop view if exists match_candidates;
+create view match_candidates as
+  select 'tagged' as pairs,
+         n.osm_id,
+         n.closest_geo_match_from_repd_repd_id as repd_id,
+         n.repd_id_in_osm as tagged_repd_id,
+         n.closest_geo_match_from_repd_co_location_repd_id as closest_co_location_repd_id,
+         null::bigint as mv_id,
+         repd.location::geography <-> tagged.location::geography as distance_meters
+    from osm_with_existing_repd_neighbours as n
+    left join repd on repd.repd_id = n.closest_geo_match_from_repd_repd_id
+    left join repd as tagged on tagged.repd_id = n.repd_id_in_osm
+  union all
+  select 'mapping', osm_repd_id_mapping.osm_id, osm_repd_id_mapping.repd_id, null, null, null, null
+    from osm_repd_id_mapping
+    join repd using (repd_id)
+  union all
+  select 'nearest', osm_id, closest_geo_match_from_repd_repd_id, null, null, null, distance_meters
+    from osm_repd_neighbours
+  union all
+  select 'mv-repd', null, repd_id, null, null, mv_id, distance_meters
+    from mv_repd_neighbours
+  union all
+  select 'mv-osm', osm_id, null, null, null, mv_id, distance_meters
+    from osm_mv_neighbours;
+
+-- matches(match_rule, master_repd_id, master_osm_id, mv_id, fit_id)
+-- Made by data-matching.py, which applies the match rules to the candidates in turn.
+-- (If it fails, matches won't exist, and the analyze below stops the build.)
+
+\! ${PYTHON:-python3} data-matching.py
+
+drop view match_candidates;
+analyze matches;
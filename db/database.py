@@ -0,0 +1,12 @@
+### Connecting to the database, for the Python scripts here (bulk-load.py and neighbour-finding.py)
+
+import psycopg2
+
+def connect(dsn=None):
+    """A connection to the database given by a name, or by a libpq connection string; or, if none is given, the one the
+    PG* environment variables give (as set by neighbour-finding.sql, for example, for the database psql is connected to)"""
+    if not dsn:
+        return psycopg2.connect('')
+    if '=' in dsn or dsn.startswith('postgres'):
+        return psycopg2.connect(dsn)
+    return psycopg2.connect(dbname=dsn)
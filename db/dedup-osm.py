@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+### Cluster the OSM objects that are parts of the same installation, for dedup-osm.sql (which runs this): two objects are
+### in the same cluster if they are closer than area_adaptive_threshold() of their areas and capacities, or are linked by
+### a chain of such pairs. Makes the table osm_dedup(osm_id, master_osm_id), of the objects that are in any pair, with the
+### largest osm_id in the object's cluster.
+### The objects clustered are those of the view osm_dedup_candidates (made by dedup-osm.sql). The pairs are found with a
+### KD-tree, within the largest threshold there is, and then each is checked against its own threshold; the clusters are
+### then joined up with a disjoint-set structure (see clustering.py).
+### Run by dedup-osm.sql (with psql's connection passed on in PG* environment variables); or by hand:
+###         python3 dedup-osm.py hut23-425       (a database name, or a libpq connection string)
+
+import io, sys, time
+import numpy as np
+import pandas as pd
+from database import connect
+import clustering
+
+def read_candidates(cursor):
+    cursor.execute("select osm_id, longitude, latitude, area, capacity from osm_dedup_candidates;")
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * 5
+    ids = np.array(columns[0], dtype='int64')
+    longitude, latitude, area, capacity = (np.array(column, dtype='float64') for column in columns[1:])   # (None becomes NaN)
+    return ids, longitude, latitude, area, capacity
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        raise ValueError("Usage: dedup-osm.py [DATABASE]")
+    starttime = time.time()
+    connection = connect(sys.argv[1] if len(sys.argv) > 1 else None)
+    with connection, connection.cursor() as cursor:
+        ids, longitude, latitude, area, capacity = read_candidates(cursor)
+        i, j, distances = clustering.pairs_within(longitude, latitude,
+                                                  lambda i, j: clustering.area_adaptive_threshold(area[i], area[j], capacity[i], capacity[j]))
+        masters = clustering.cluster_masters(ids, i, j)
+        paired = np.zeros(len(ids), dtype=bool)
+        paired[i] = paired[j] = True
+
+        cursor.execute("drop table if exists osm_dedup;")
+        cursor.execute("create table osm_dedup (osm_id bigint, master_osm_id bigint);")
+        dedup_df = pd.DataFrame({'osm_id': ids[paired], 'master_osm_id': masters[paired]})
+        cursor.copy_expert("copy osm_dedup from stdin with (format csv)", io.StringIO(dedup_df.to_csv(index=False, header=False)))
+    connection.close()
+    print("Clustered %i OSM objects (%i pairs) into %i clusters in %.1fs"
+          % (paired.sum(), len(i), len(np.unique(masters[paired])), time.time() - starttime))
@@ -51,60 +51,41 @@ select objtype,
 
 \echo clustering ...
 
--- osm_parts(osm_id1, osm_id2)
--- All pairs of objects that are within 300m of each other
+-- osm_dedup_candidates(osm_id, longitude, latitude, area, capacity)
+-- The objects that are clustered
 
-create temporary view osm_parts as
-with maybe_dupes(osm_id, location, area, capacity) as (
+drop view if exists osm_dedup_candidates;
+create view osm_dedup_candidates as
   -- ignore nodes, (various misspellings of) rooftop things,
   -- and cases where there is already a master_osm_id.
   -- NB. "X is not true" is true if X is false or X is null
-  select osm_id, location, area, capacity from osm
+  select osm_id, longitude, latitude, area, capacity from osm
   where
     objtype != 'node'
     and (located in ('roof', 'rood', 'roofq', 'rof', 'roofs')) is not true
-    and master_osm_id is null
-)
--- find objects within appropriate distance of each other
-select md1.osm_id as osm_id1, md2.osm_id as osm_id2
-  from maybe_dupes as md1, maybe_dupes as md2
-  where md1.osm_id != md2.osm_id
-        and md1.location::geography <-> md2.location::geography <
-		area_adaptive_threshold(md1.area, md2.area, md1.capacity, md2.capacity);
-
--- osm_clusters(osm_id1, osm_id2)
--- Objects that can be reached through a chain of connections
-
-create temporary view osm_clusters as
-with recursive osm_clusters(osm_id1, osm_id2) as (
-    select osm_id1, osm_id2
-    from osm_parts
-  union
-    select osm_clusters.osm_id1 as osm_id1, osm_parts.osm_id2 as osm_id2
-    from osm_clusters cross join osm_parts
-    where osm_clusters.osm_id2 = osm_parts.osm_id1
-  )
-  select osm_id1, osm_id2 FROM osm_clusters;
+    and master_osm_id is null;
 
 -- osm_dedup(osm_id, master_osm_id)
--- master_osm_id is the largest osm_id over all objects within the
--- same cluster
+-- Objects are in the same cluster if they are within area_adaptive_threshold() of each
+-- other, or are linked by a chain of such pairs; master_osm_id is the largest osm_id
+-- over all objects within the same cluster (for each object that is in any pair).
+-- Made by dedup-osm.py, which finds the pairs with a spatial index and joins them up
+-- with a disjoint-set structure. (If it fails, osm_dedup won't exist, and the update
+-- below stops the build.)
 
-select osm_id1 as osm_id, max(osm_id2) as master_osm_id
-  into osm_dedup
-  from osm_clusters
-  group by osm_id1;
+\! ${PYTHON:-python3} dedup-osm.py
+
+drop view osm_dedup_candidates;
 
 /*
 ** Merge the new groupings into the osm table
 */
 
 update osm
-  set (master_osm_id) =
-    (select master_osm_id
-     from osm_dedup
-     where osm_dedup.osm_id = osm.osm_id)
-  where master_osm_id is null;
+  set master_osm_id = osm_dedup.master_osm_id
+  from osm_dedup
+  where osm_dedup.osm_id = osm.osm_id
+    and osm.master_osm_id is null;
 
 -- Add master id identical to id for all singletons, to aid matching
 update osm
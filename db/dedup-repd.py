@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+### Cluster the REPD sites that are the same site, for dedup-repd.sql (which runs this): two sites are the same if they
+### are closer than area_adaptive_threshold() of their capacities and their reduced site names are similar by trigram
+### matching, or if they are so close as to be clearly the same; and the sites linked by a chain of such pairs are in the
+### same cluster. Makes the table repd_dedup(repd_id, master_repd_id), of the sites that are in any pair, with the largest
+### repd_id in the site's cluster.
+### The sites clustered are those of the view repd_dedup_candidates (made by dedup-repd.sql). Each site name is reduced,
+### and its trigrams made, once; the pairs are found with a KD-tree, within the largest threshold there is, and only the
+### names of those close enough are compared. The clusters are then joined up with a disjoint-set structure (see
+### clustering.py).
+### Run by dedup-repd.sql (with psql's connection passed on in PG* environment variables); or by hand:
+###         python3 dedup-repd.py hut23-425       (a database name, or a libpq connection string)
+
+import io, re, sys, time
+import numpy as np
+import pandas as pd
+from database import connect
+import clustering
+
+# PARAMETERS:
+#
+# identical_cluster_distance is the distance (in metres) within which two sites are
+# counted as the same, whatever their names.
+#
+# name_distance is the threshold (in trigram matching) for counting two site names as
+# potentially representing the same site.
+
+identical_cluster_distance = 5
+name_distance = 0.2
+
+# The reduced form of a site name: the name with the following strings removed
+#   solar, Solar, park, Park, farm, Farm, resubmission, (resubmission), (Resubmission),
+#   extension, Extension, ()
+# and runs of spaces reduced to one
+removed_from_names = re.compile(r'solar|Solar|park|Park|farm|Farm|\(resubmission\)|\(Resubmission\)|resubmission|Resubmission|extension|Extension|\(\)')
+
+def reduced_site_name(name):
+    if name is None:
+        return None
+    return re.sub(' +', ' ', removed_from_names.sub('', name))
+
+def read_candidates(cursor):
+    cursor.execute("select repd_id, longitude, latitude, capacity, site_name from repd_dedup_candidates;")
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * 5
+    ids = np.array(columns[0], dtype='int64')
+    longitude, latitude, capacity = (np.array(column, dtype='float64') for column in columns[1:4])   # (None becomes NaN)
+    return ids, longitude, latitude, capacity, list(columns[4])
+
+def same_site_pairs(longitude, latitude, capacity, site_names):
+    """The pairs (i, j) of sites that are the same site, as arrays of their positions"""
+    i, j, distances = clustering.pairs_within(longitude, latitude,
+                                              lambda i, j: clustering.area_adaptive_threshold(np.nan, np.nan, capacity[i], capacity[j]))
+    # (a site without a name has no trigrams to compare, and isn't similar to any other)
+    trigrams = [None if name is None else clustering.trigrams(reduced_site_name(name)) for name in site_names]
+    similar = np.array([trigrams[a] is not None and trigrams[b] is not None
+                        and clustering.trigram_similarity(trigrams[a], trigrams[b]) >= name_distance
+                        for a, b in zip(i, j)], dtype=bool)
+    same = similar | (distances < identical_cluster_distance)
+    return i[same], j[same]
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        raise ValueError("Usage: dedup-repd.py [DATABASE]")
+    starttime = time.time()
+    connection = connect(sys.argv[1] if len(sys.argv) > 1 else None)
+    with connection, connection.cursor() as cursor:
+        ids, longitude, latitude, capacity, site_names = read_candidates(cursor)
+        i, j = same_site_pairs(longitude, latitude, capacity, site_names)
+        masters = clustering.cluster_masters(ids, i, j)
+        paired = np.zeros(len(ids), dtype=bool)
+        paired[i] = paired[j] = True
+
+        cursor.execute("drop table if exists repd_dedup;")
+        cursor.execute("create table repd_dedup (repd_id integer, master_repd_id integer);")
+        dedup_df = pd.DataFrame({'repd_id': ids[paired], 'master_repd_id': masters[paired]})
+        cursor.copy_expert("copy repd_dedup from stdin with (format csv)", io.StringIO(dedup_df.to_csv(index=False, header=False)))
+    connection.close()
+    print("Clustered %i REPD sites (%i pairs) into %i clusters in %.1fs"
+          % (paired.sum(), len(i), len(np.unique(masters[paired])), time.time() - starttime))
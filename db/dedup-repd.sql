@@ -10,74 +10,35 @@
 **
 */
 
-create extension if not exists pg_trgm; -- trigram matching
-
 \echo -n Deduplicating REPD dataset ...
 
--- PARAMETERS:
---
--- cluster_distance is the distance (in metres) within which we count
--- two objects as potentially being part of the same cluster.
---
--- name_distance is the threshold (in trigram matching) for counting two site
--- names as potentially representing the same site.
-
-\set cluster_distance 1380
-\set identical_cluster_distance 5
-\set name_distance 0.2
-
+-- (The parameters -- the distances and the threshold for the names -- are set in
+-- dedup-repd.py)
 
-create temporary view repd_parts(repd_id1, repd_id2) as
-with temp(repd_id, location, capacity, reduced_site_name) as (
-  -- Within `site_name` remove the following strings:
-  --   solar, Solar, park, Park, farm, Farm, resubmission, (resubmission), (Resubmission),
-  --   extension, Extension, ()
-  -- also remove ' - ' and reduce two consecutive spaces to one.
-  select repd_id,
-         location,
-         capacity,
-         regexp_replace(
-           regexp_replace(
-           site_name,
-           'solar|Solar|park|Park|farm|Farm|\(resubmission\)|\(Resubmission\)|resubmission|Resubmission|extension|Extension|\(\)', '', 'g'),
-         ' +', ' ', 'g') as reduced_site_name
-   from repd
-)
-  select x.repd_id as repd_id1,
-         y.repd_id as repd_id2
-    from temp as x cross join temp as y
-    -- two sites are the same if they are close and have similar names; or if they
-    -- are so close as to be clearly the same.
-    where x.repd_id != y.repd_id
-      and ((x.location::geography <-> y.location::geography <
-		area_adaptive_threshold(NULL, NULL, x.capacity, y.capacity)
-            and similarity(x.reduced_site_name, y.reduced_site_name) >= :name_distance)
-           or x.location::geography <-> y.location::geography < :identical_cluster_distance);
+-- repd_dedup_candidates(repd_id, longitude, latitude, capacity, site_name)
+-- The sites that are clustered
 
+drop table if exists repd_dedup;
+drop view if exists repd_dedup_candidates;
+create view repd_dedup_candidates as
+  select repd_id, longitude, latitude, capacity, site_name from repd;
 
--- repd_clusters(repd_id1, repd_id2)
--- Objects that can be reached through a chain of connections
-
-create temporary view repd_clusters as
-with recursive repd_clusters(repd_id1, repd_id2) as (
-    select repd_id1, repd_id2
-    from repd_parts
-  union
-    select repd_clusters.repd_id1 as repd_id1, repd_parts.repd_id2 as repd_id2
-    from repd_clusters cross join repd_parts
-    where repd_clusters.repd_id2 = repd_parts.repd_id1
-  )
-  select repd_id1, repd_id2 FROM repd_clusters;
+-- repd_dedup(repd_id, master_repd_id)
+-- Two sites are the same if they are within area_adaptive_threshold() of each other
+-- and have similar reduced names; or if they are so close as to be clearly the same.
+-- Sites linked by a chain of such pairs are in the same cluster, and master_repd_id
+-- is the largest repd_id over all sites within the same cluster (for each site that
+-- is in any pair).
+-- Made by dedup-repd.py, which reduces each name (and makes its trigrams) once, finds
+-- the pairs with a spatial index, compares the names of only those, and joins the
+-- pairs up with a disjoint-set structure. (If it fails, repd_dedup won't exist, and
+-- the update below stops the build.)
 
+\echo clustering ...
 
--- repd_dedup(repd_id, master_repd_id)
--- master_repd_id is the largest repd_id over all objects within the
--- same cluster
+\! ${PYTHON:-python3} dedup-repd.py
 
-create temporary view repd_dedup as
-select repd_id1 as repd_id, max(repd_id2) as master_repd_id
-  from repd_clusters
-  group by repd_id1;
+drop view repd_dedup_candidates;
 
 /*
 ** Merge the new groupings into the repd table
@@ -86,14 +47,11 @@ select repd_id1 as repd_id, max(repd_id2) as master_repd_id
 alter table repd
   add column master_repd_id integer;  -- default is NULL
 
-\echo clustering ...
-
 update repd
-  set (master_repd_id) =
-    (select master_repd_id
-       from repd_dedup
-      where repd_dedup.repd_id = repd.repd_id)
-    where master_repd_id is null;
+  set master_repd_id = repd_dedup.master_repd_id
+  from repd_dedup
+  where repd_dedup.repd_id = repd.repd_id
+    and repd.master_repd_id is null;
 
 -- Add master id identical to id for all singletons, to aid matching
 update repd
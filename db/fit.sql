@@ -4,9 +4,13 @@
 
 \echo Creating fit table ...
 
-drop table if exists raw.fit;
 drop table if exists fit;
+\if :bulk_loaded
+\echo (already loaded by bulk-load.py)
+\else
+drop table if exists raw.fit;
 
+-- (the column types match data/processed/schema.py, which the processed csv is written with)
 create table raw.fit (
   fit_id                int,
   extension             char(1),
@@ -32,6 +36,7 @@ create table raw.fit (
 );
 
 \copy raw.fit from '../data/processed/fit.csv' delimiter ',' csv header;
+\endif
 
 -- Restrict raw.fit to Solar PV only
 select * into fit
@@ -6,6 +6,9 @@
 ** Prerequisites:
 **   i. A database named "hut23-425" is assumed to exist on the local PostgreSQL server
 **
+** The tables are loaded from the processed csv files; or, if they have already been loaded by bulk-load.py (which is
+** quicker), run with "psql -v bulk_loaded=1 -f make-database.sql hut23-425" to carry on from there
+**
 ** These psql files:
 **   1. Create database tables (deleting them if they exist already)
 **   2. Break out the REPD tags from the OSM dataset
@@ -17,10 +20,21 @@
 -- Preliminaries
 
 \set ON_ERROR_STOP on
+\if :{?bulk_loaded}
+\else
+\set bulk_loaded 0
+\endif
 alter database "hut23-425" set datestyle to "DMY"; -- to match FIT and REPD data files
 create schema if not exists raw;
 create extension if not exists postgis;
 
+-- Some steps are done by Python scripts (run with \!, by python3, or by $PYTHON if it's
+-- set), which connect to the same database as this psql session
+\setenv PGHOST :HOST
+\setenv PGPORT :PORT
+\setenv PGUSER :USER
+\setenv PGDATABASE :DBNAME
+
 \include area-adaptive-threshold.sql
 
 -- 1. Create tables and load data
@@ -4,8 +4,12 @@
 
 \echo Creating Machine Vision table ...
 
+\if :bulk_loaded
+\echo (already loaded by bulk-load.py)
+\else
 drop table if exists machine_vision;
 
+-- (the column types match data/processed/schema.py, which the processed csv is written with)
 create table machine_vision (
   mv_id          int,
   area           float,
@@ -20,6 +24,7 @@ create table machine_vision (
 );
 
 \copy machine_vision from '../data/processed/machine_vision.csv' delimiter ',' csv header;
+\endif
 
 /* -----------------------------------------------------------------------------
 ** Edit table as necessary
@@ -28,10 +33,14 @@ create table machine_vision (
 -- Create geometry columns for geographical comparison/matching
 -- NB: Spatial Reference ID 4326 refers to WGS84
 
+-- (bulk-load.py makes the location column as it loads the table)
+\if :bulk_loaded
+\else
 alter table machine_vision
   add column location geometry(Point, 4326);
   
 update machine_vision
   set location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326);
+\endif
 
 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+### Find the nearest neighbour of each object of one dataset among the objects of another -- of each OSM object among the
+### REPD, and of each machine vision object among the OSM ways and relations, and among the REPD -- and make the tables
+### osm_repd_neighbours, osm_mv_neighbours and mv_repd_neighbours, with the same columns as the queries that did this in SQL
+### (CROSS JOIN LATERAL ... ORDER BY a.location::geography <-> b.location::geography LIMIT 1, which compared every pair).
+### Each dataset's points are put on the sphere once, as 3D coordinates, and the dataset searched is indexed in a KD-tree,
+### which is queried for all of the other dataset's points at once. On a sphere, the straight-line distance between two
+### points goes up with the distance along the surface, so the nearest by one is the nearest by the other. The distance of
+### each pair found is then the great-circle distance, on the same sphere as the geography <-> operator measures on
+### (see sphere.py).
+### Run by neighbour-finding.sql (with psql's connection passed on in PG* environment variables); or by hand:
+###         python3 neighbour-finding.py hut23-425       (a database name, or a libpq connection string)
+
+import io, sys, time
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from database import connect
+from sphere import sphere_points, great_circle_distance
+
+# The searches: for each object of the first dataset, its nearest among the objects of the second. A dataset is a table,
+# its id column, and which of its rows are included. Each search's pairs go into a temporary table of the same name.
+searches = {
+    'osm_repd_pairs': (('osm', 'osm_id', 'true'),            ('repd', 'repd_id', 'true')),
+    'mv_osm_pairs':   (('machine_vision', 'mv_id', 'true'),  ('osm', 'osm_id', "objtype != 'node'")),
+    'mv_repd_pairs':  (('machine_vision', 'mv_id', 'true'),  ('repd', 'repd_id', 'true')),
+}
+
+# The neighbour tables, made from the pairs (id, neighbour_id, distance_meters). An object without a location has no
+# neighbour (the columns from the neighbour are NULL).
+neighbour_tables = {
+    'osm_repd_neighbours': """
+select osm.osm_id,
+       repd.repd_id as closest_geo_match_from_repd_repd_id,
+       repd.co_location_repd_id as closest_geo_match_from_repd_co_location_repd_id,
+       pairs.distance_meters
+  into osm_repd_neighbours
+  from osm_repd_pairs as pairs
+  join osm on osm.osm_id = pairs.id
+  left join repd on repd.repd_id = pairs.neighbour_id;""",
+
+    'osm_mv_neighbours': """
+select osm.osm_id,
+       osm.tag_start_date as osm_date,
+       machine_vision.install_date as mv_date,
+       osm.area as osm_area,
+       machine_vision.area as mv_area,
+       pairs.distance_meters,
+       machine_vision.mv_id as mv_id
+  into osm_mv_neighbours
+  from mv_osm_pairs as pairs
+  join machine_vision on machine_vision.mv_id = pairs.id
+  left join osm on osm.osm_id = pairs.neighbour_id;""",
+
+    'mv_repd_neighbours': """
+select repd.repd_id,
+       repd.co_location_repd_id,
+       repd.master_repd_id,
+       machine_vision.install_date as mv_date,
+       machine_vision.area as mv_area,
+       pairs.distance_meters,
+       machine_vision.mv_id as mv_id
+  into mv_repd_neighbours
+  from mv_repd_pairs as pairs
+  join machine_vision on machine_vision.mv_id = pairs.id
+  left join repd on repd.repd_id = pairs.neighbour_id;""",
+}
+
+class NeighbourIndex:
+    """The points of a dataset in a KD-tree, for finding the nearest of them to other points. Points without a location
+    (a missing longitude or latitude) are left out: they can't be anyone's nearest."""
+    def __init__(self, ids, longitude, latitude):
+        present = ~(np.isnan(longitude) | np.isnan(latitude))
+        self.ids = ids[present]
+        self.longitude = longitude[present]
+        self.latitude = latitude[present]
+        self.tree = cKDTree(sphere_points(self.longitude, self.latitude))
+
+    def nearest(self, longitude, latitude, k=1):
+        """For each of the points, the positions (in the index) of its k nearest points, nearest first, and their distances
+        in metres, as (n, k) arrays. Where there are fewer than k (e.g. for a point without a location), the position is -1
+        and the distance NaN."""
+        positions = np.full((len(longitude), k), -1)
+        distances = np.full((len(longitude), k), np.nan)
+        present = ~(np.isnan(longitude) | np.isnan(latitude))
+        if present.any() and len(self.ids):
+            chords, found = self.tree.query(sphere_points(longitude[present], latitude[present]), k=list(range(1, k + 1)))
+            found[np.isinf(chords)] = -1   # (not enough points)
+            positions[present] = found
+        hit = positions >= 0
+        querylon = np.broadcast_to(longitude[:, None], hit.shape)[hit]
+        querylat = np.broadcast_to(latitude[:, None], hit.shape)[hit]
+        distances[hit] = great_circle_distance(querylon, querylat, self.longitude[positions[hit]], self.latitude[positions[hit]])
+        return positions, distances
+
+def read_points(cursor, dataset):
+    """The ids, longitudes and latitudes of a dataset's objects (the location column is made from the longitude and
+    latitude columns, in osm.sql, repd.sql and mv.sql)"""
+    table, idcolumn, where = dataset
+    cursor.execute("select %s, longitude, latitude from %s where %s;" % (idcolumn, table, where))
+    rows = cursor.fetchall()
+    ids = np.array([row[0] for row in rows], dtype='int64')
+    longitude = np.array([row[1] for row in rows], dtype='float64')   # (None becomes NaN)
+    latitude = np.array([row[2] for row in rows], dtype='float64')
+    return ids, longitude, latitude
+
+def write_pairs(cursor, pairstable, ids, neighbour_ids, distances):
+    """Put the pairs found into a temporary table (dropped at the end of the transaction)"""
+    cursor.execute("create temporary table %s (id bigint, neighbour_id bigint, distance_meters float) on commit drop;" % pairstable)
+    pairs_df = pd.DataFrame({'id': ids, 'neighbour_id': neighbour_ids, 'distance_meters': distances})
+    cursor.copy_expert("copy %s from stdin with (format csv)" % pairstable, io.StringIO(pairs_df.to_csv(index=False, header=False)))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        raise ValueError("Usage: neighbour-finding.py [DATABASE]")
+    connection = connect(sys.argv[1] if len(sys.argv) > 1 else None)
+    with connection, connection.cursor() as cursor:
+        points = {}
+        indexes = {}
+        for pairstable, (querydataset, searcheddataset) in searches.items():
+            starttime = time.time()
+            for dataset in (querydataset, searcheddataset):
+                if dataset not in points:
+                    points[dataset] = read_points(cursor, dataset)
+            if searcheddataset not in indexes:
+                indexes[searcheddataset] = NeighbourIndex(*points[searcheddataset])
+            index = indexes[searcheddataset]
+            ids, longitude, latitude = points[querydataset]
+            positions, distances = index.nearest(longitude, latitude)
+            found = positions[:, 0] >= 0
+            neighbour_ids = np.zeros(len(ids), dtype='int64')
+            neighbour_ids[found] = index.ids[positions[found, 0]]
+            neighbour_ids = pd.arrays.IntegerArray(neighbour_ids, ~found)
+            write_pairs(cursor, pairstable, ids, neighbour_ids, distances[:, 0])
+            print("Found the nearest of %i %s objects among %i %s objects in %.1fs"
+                  % (len(ids), querydataset[0], len(index.ids), searcheddataset[0], time.time() - starttime))
+
+        for table, query in neighbour_tables.items():
+            cursor.execute("drop table if exists %s;" % table)
+            cursor.execute(query)
+    connection.close()
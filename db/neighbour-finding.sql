@@ -1,5 +1,11 @@
 \echo -n Finding neighbouring objects across datasets ...
 
+-- The nearest neighbours (osm_repd_neighbours, osm_mv_neighbours and mv_repd_neighbours) are found by
+-- neighbour-finding.py, on the database this psql is connected to (see make-database.sql). (psql can't tell whether the
+-- script worked, so the tables are dropped first: if it didn't make them, the query below, which uses them, stops the build.)
+drop table if exists osm_repd_neighbours;
+drop table if exists osm_mv_neighbours;
+drop table if exists mv_repd_neighbours;
+\! ${PYTHON:-python3} neighbour-finding.py
+
 \include neighbour-finding/osm-repd.sql
-\include neighbour-finding/mv-osm.sql
-\include neighbour-finding/mv-repd.sql
@@ -4,8 +4,13 @@
 
 \echo Creating OSM table ...
 
+\if :bulk_loaded
+\echo (already loaded by bulk-load.py)
+\else
 drop table if exists raw.osm;
 
+-- (the column types match data/processed/schema.py, which the processed csv is written with:
+--  modules and orientation arrive already rounded to integers)
 create table raw.osm (
   objtype        varchar(8),
   osm_id         bigint,
@@ -15,9 +20,9 @@ create table raw.osm (
   longitude      float,
   area           float,
   capacity       float,
-  modules        float,
+  modules        bigint,
   located        varchar(20),
-  orientation    float,
+  orientation    integer,
   plantref       varchar(20),
   source_capacity varchar(255),
   source_obj     varchar(255),
@@ -28,28 +33,24 @@ create table raw.osm (
 );
 
 \copy raw.osm from '../data/processed/osm.csv' delimiter ',' csv header;
+\endif
 
 /* -----------------------------------------------------------------------------
 ** Edit table as necessary
 */
 
--- coerce some float columns to int, since float res is excessive (but sometimes present in the input)
-
-alter table raw.osm
-  alter column modules
-    type bigint using round(modules)::bigint;
-alter table raw.osm
-  alter column orientation
-    type integer using round(orientation)::integer;
-
 -- our input is using kW, convert to MW for coherence with use elsewhere in the db
 update raw.osm set capacity = 0.001 * capacity;
 
 -- Create geometry columns for geographical comparison/matching
 -- NB: Spatial Reference ID 4326 refers to WGS84
 
+-- (bulk-load.py makes the location column as it loads the table)
+\if :bulk_loaded
+\else
 alter table raw.osm
   add column location geometry(Point, 4326);
 
 update raw.osm
   set location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326);
+\endif
@@ -4,9 +4,13 @@
 
 \echo Creating REPD table ...
 
-drop table if exists raw.repd;
 drop table if exists repd cascade;
+\if :bulk_loaded
+\echo (already loaded by bulk-load.py)
+\else
+drop table if exists raw.repd;
 
+-- (the column types match data/processed/schema.py, which the processed csv is written with)
 create table raw.repd (
   old_repd_id                    varchar(15),
   repd_id                        integer,
@@ -15,8 +19,8 @@ create table raw.repd (
   site_name                      varchar(100),
   tech_type                      varchar(40),
   storage_type                   varchar(40),
-  co_location_repd_id            float, -- can't make this int as csv contains NaN, but this is fixed below
-  capacity                       varchar(8),
+  co_location_repd_id            integer,
+  capacity                       float,
   chp_enabled                    varchar(3),
   ro_banding                     varchar(10),
   fit_tariff                     float,
@@ -61,30 +65,25 @@ create table raw.repd (
 );
 
 \copy raw.repd from '../data/processed/repd.csv' delimiter ',' csv header;
+\endif
 
 
 /* -----------------------------------------------------------------------------
 ** Edit table as necessary
 */
 
--- Change co_location_repd_id to integer
-alter table raw.repd
-  alter column co_location_repd_id
-    set data type int
-      using cast (co_location_repd_id as integer);
-
-alter table raw.repd
-  alter column capacity
-    type float using (capacity)::float;
-
 -- Create geometry columns for geographical comparison/matching
 -- NB: Spatial Reference ID 4326 refers to WGS84
 
+-- (bulk-load.py makes the location column as it loads the table)
+\if :bulk_loaded
+\else
 alter table raw.repd
   add column location geometry(Point, 4326);
 
 update raw.repd
   set location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326);
+\endif
 
 /* -----------------------------------------------------------------------------
 ** Generate final table
@@ -0,0 +1,24 @@
+### Points and distances on the sphere that PostGIS measures geography distances on (with the <-> operator, and with
+### ST_DWithin(..., false)), for the Python scripts here (neighbour-finding.py and dedup-osm.py)
+
+import numpy as np
+
+# The radius of the sphere, in metres: PostGIS's sphere for WGS84 (of the mean radius, (2a + b)/3)
+earth_radius = 6371008.7714
+
+def sphere_points(longitude, latitude):
+    """Points on the unit sphere, as (x, y, z) rows, for longitudes and latitudes in degrees. The straight-line distance
+    between two of them goes up with the distance along the surface, so a KD-tree of them finds the nearest points, or
+    those within a distance, as measured on the sphere."""
+    lon, lat = np.radians(longitude), np.radians(latitude)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def chord_length(distance):
+    """The straight-line distance between points of the unit sphere that are the given distance in metres apart along the surface"""
+    return 2 * np.sin(np.minimum(distance / earth_radius, np.pi) / 2)
+
+def great_circle_distance(lon1, lat1, lon2, lat2):
+    """The distance in metres between points given in degrees, along the surface of the sphere (by the haversine formula)"""
+    lon1, lat1, lon2, lat2 = np.radians(lon1), np.radians(lat1), np.radians(lon2), np.radians(lat2)
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earth_radius * np.arcsin(np.sqrt(np.minimum(h, 1.0)))